@@ -0,0 +1,139 @@
+# Write-behind sentiment/theme analysis: saves enqueue entry ids, worker threads score and store them.
+# Rows carry the analyzer version they were scored with; a resumable backfill re-scores outdated rows.
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+import crypto
+import db
+import sentiment
+
+WORKERS = 2
+BATCH = 50  # ids a worker drains and writes in one transaction
+BACKFILL_BATCH = 100
+BACKFILL_PAUSE_S = 0.05
+
+logger = logging.getLogger("dear_diary.analysis")
+_queue = queue.Queue()
+_lock = threading.Lock()
+_workers = []
+_backfill = {"running": False, "done": False}
+
+
+# Only paragraphs changed since the last analysis are re-scored (sentiment.analyze_incremental).
+def _analyze_ids(ids: list) -> list:
+    results = []
+    for item in db.get_analysis_inputs(ids):
+        result, paragraphs = sentiment.analyze_incremental(item["content"], item["paragraphs"])
+        results.append({"id": item["id"], "iv": item["iv"], "paragraphs": paragraphs, **result})
+    return db.apply_analysis(results)
+
+
+def _worker() -> None:
+    while True:
+        ids = [_queue.get()]
+        while len(ids) < BATCH:
+            try:
+                ids.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            # Locked journals drop the work; the rows stay stale and the backfill picks them up after unlock.
+            if crypto.is_unlocked():
+                _analyze_ids(list(dict.fromkeys(ids)))
+        except (ValueError, sqlite3.Error):
+            pass
+        except Exception:
+            # One bad row (a foreign-key InvalidTag, an analyzer bug) must not stop the worker for good.
+            logger.exception("analysis batch of %d entries failed", len(ids))
+        finally:
+            for _ in ids:
+                _queue.task_done()
+
+
+# Starts workers up to WORKERS, replacing any that died.
+def _ensure_workers() -> None:
+    with _lock:
+        _workers[:] = [t for t in _workers if t.is_alive()]
+        for i in range(len(_workers), WORKERS):
+            t = threading.Thread(target=_worker, name=f"journal-analysis-{i}", daemon=True)
+            t.start()
+            _workers.append(t)
+
+
+# Queue entries for scoring; returns immediately.
+def enqueue(*ids: str) -> None:
+    _ensure_workers()
+    for eid in ids:
+        _queue.put(eid)
+
+
+# Block until queued work is written (CLI, imports, tests). Returns False on timeout.
+def wait(timeout: float | None = None) -> bool:
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while _queue.unfinished_tasks:
+        if not any(t.is_alive() for t in _workers):
+            _ensure_workers()
+        if deadline is not None and time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def pending() -> int:
+    return _queue.unfinished_tasks
+
+
+# Re-score rows whose analyzer version is missing or outdated, BACKFILL_BATCH at a time. Progress lives in
+# the rows themselves, so an interrupted run resumes where it stopped. Returns rows re-scored.
+def backfill(batch_size: int = BACKFILL_BATCH, pause_s: float = 0.0, progress=None) -> int:
+    key = crypto.get_key()
+    if not key:
+        raise ValueError("Unlock required to analyze entries.")
+    db.unarchive_stale(sentiment.ANALYZER_VERSION)
+    total = db.count_stale_analysis(sentiment.ANALYZER_VERSION)
+    done, after = 0, 0
+    while crypto.get_key() is key:
+        batch = db.get_stale_analysis_ids(sentiment.ANALYZER_VERSION, after, batch_size)
+        if not batch:
+            break
+        after = batch[-1][0]
+        done += len(_analyze_ids([eid for _, eid in batch]))
+        if progress:
+            progress(done, total)
+        time.sleep(pause_s)
+    return done
+
+
+# Start the backfill on a daemon thread once per process after unlock; cheap to call per rerun.
+def start_in_background() -> bool:
+    _ensure_workers()
+    with _lock:
+        if _backfill["running"] or _backfill["done"] or not crypto.is_unlocked():
+            return False
+        _backfill["running"] = True
+
+    def run():
+        try:
+            backfill(pause_s=BACKFILL_PAUSE_S)
+            with _lock:
+                _backfill["done"] = db.count_stale_analysis(sentiment.ANALYZER_VERSION) == 0
+        except (ValueError, sqlite3.Error):
+            pass
+        except Exception:
+            logger.exception("analysis backfill failed")
+        finally:
+            with _lock:
+                _backfill["running"] = False
+    threading.Thread(target=run, name="journal-analysis-backfill", daemon=True).start()
+    return True
+
+
+def _on_lock() -> None:
+    with _lock:
+        _backfill["done"] = False  # work dropped while locked is picked up after the next unlock
+
+
+crypto.add_clear_listener(_on_lock)
@@ -0,0 +1,219 @@
+# Columnar NumPy cache of entry metadata (day, score, label, themes) for multi-year insights.
+import threading
+from datetime import date, datetime
+
+import numpy as np
+
+import db
+import sentiment
+
+LABELS = (None, "positive", "neutral", "negative")
+LABEL_CODES = {lbl: i for i, lbl in enumerate(LABELS)}
+THEME_WIDTH = sentiment.MAX_THEMES_PER_ENTRY
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+_MIN_CAPACITY = 256
+
+
+def _day_ordinal(ts_ms: int) -> int:
+    return datetime.fromtimestamp(ts_ms / 1000.0).toordinal()
+
+
+# Append-friendly arrays; deleted rows are masked out and compacted once they dominate.
+class EntryColumns:
+    def __init__(self, capacity: int = _MIN_CAPACITY):
+        capacity = max(capacity, _MIN_CAPACITY)
+        self.n = 0
+        self.dead = 0
+        self.rev = None
+        self.ids = []
+        self.row_of = {}
+        self.day = np.zeros(capacity, dtype=np.int32)
+        self.score = np.full(capacity, np.nan, dtype=np.float64)
+        self.label = np.zeros(capacity, dtype=np.int8)
+        self.themes = np.full((capacity, THEME_WIDTH), -1, dtype=np.int32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.vocab = {}
+        self.theme_names = []
+
+    @classmethod
+    def from_metadata(cls, rows: list) -> "EntryColumns":
+        cols = cls(len(rows))
+        n = len(rows)
+        cols.ids = [r["id"] for r in rows]
+        cols.row_of = {eid: i for i, eid in enumerate(cols.ids)}
+        cols.day[:n] = [_day_ordinal(r["createdAt"]) for r in rows]
+        cols.score[:n] = [np.nan if r.get("sentimentScore") is None else r["sentimentScore"] for r in rows]
+        cols.label[:n] = [LABEL_CODES.get(r.get("sentimentLabel"), 0) for r in rows]
+        for i, r in enumerate(rows):
+            cols._set_themes(i, r.get("themes"))
+        cols.alive[:n] = True
+        cols.n = n
+        return cols
+
+    def _theme_id(self, theme: str) -> int:
+        tid = self.vocab.get(theme)
+        if tid is None:
+            tid = self.vocab[theme] = len(self.theme_names)
+            self.theme_names.append(theme)
+        return tid
+
+    def _set_themes(self, i: int, themes) -> None:
+        ids = list(dict.fromkeys(self._theme_id(t.lower()) for t in (themes or [])))[:THEME_WIDTH]
+        self.themes[i] = -1
+        self.themes[i, :len(ids)] = ids
+
+    def _grow(self) -> None:
+        cap = len(self.day) * 2
+        self.day = np.resize(self.day, cap)
+        self.score = np.concatenate([self.score, np.full(cap - len(self.score), np.nan)])
+        self.label = np.resize(self.label, cap)
+        self.themes = np.vstack([self.themes, np.full((cap - len(self.themes), THEME_WIDTH), -1, dtype=np.int32)])
+        self.alive = np.concatenate([self.alive, np.zeros(cap - len(self.alive), dtype=bool)])
+
+    def upsert(self, eid: str, meta: dict) -> None:
+        i = self.row_of.get(eid)
+        if i is None:
+            if self.n == len(self.day):
+                self._grow()
+            i = self.n
+            self.n += 1
+            self.ids.append(eid)
+            self.row_of[eid] = i
+        self.day[i] = _day_ordinal(meta["createdAt"])
+        self.score[i] = np.nan if meta.get("sentimentScore") is None else meta["sentimentScore"]
+        self.label[i] = LABEL_CODES.get(meta.get("sentimentLabel"), 0)
+        self._set_themes(i, meta.get("themes"))
+        self.alive[i] = True
+
+    def delete(self, eid: str) -> None:
+        i = self.row_of.pop(eid, None)
+        if i is None:
+            return
+        self.alive[i] = False
+        self.dead += 1
+        if self.dead > _MIN_CAPACITY and self.dead * 2 > self.n:
+            self._compact()
+
+    def _compact(self) -> None:
+        keep = np.flatnonzero(self.alive[:self.n])
+        fresh = EntryColumns(len(keep))
+        k = len(keep)
+        fresh.ids = [self.ids[i] for i in keep]
+        fresh.row_of = {eid: j for j, eid in enumerate(fresh.ids)}
+        fresh.day[:k], fresh.score[:k], fresh.label[:k] = self.day[keep], self.score[keep], self.label[keep]
+        fresh.themes[:k], fresh.alive[:k] = self.themes[keep], True
+        fresh.vocab, fresh.theme_names, fresh.n = self.vocab, self.theme_names, k
+        self.__dict__.update(fresh.__dict__)
+
+    def live(self) -> np.ndarray:
+        return np.flatnonzero(self.alive[:self.n])
+
+    def __len__(self) -> int:
+        return self.n - self.dead
+
+
+# --- Vectorized analytics over the live rows ---
+
+# Entry-weighted mean score over a trailing window of `window` days, one value per calendar day.
+def rolling_mood(cols: EntryColumns, window: int = 7) -> tuple[list, np.ndarray]:
+    idx = cols.live()
+    idx = idx[~np.isnan(cols.score[idx])]
+    if not len(idx):
+        return [], np.array([])
+    days = cols.day[idx]
+    first = int(days.min())
+    offsets = days - first
+    sums = np.bincount(offsets, weights=cols.score[idx])
+    counts = np.bincount(offsets).astype(np.float64)
+    csum, ccount = np.concatenate([[0.0], np.cumsum(sums)]), np.concatenate([[0.0], np.cumsum(counts)])
+    hi = np.arange(1, len(sums) + 1)
+    lo = np.maximum(hi - window, 0)
+    wcount = ccount[hi] - ccount[lo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(wcount > 0, (csum[hi] - csum[lo]) / wcount, np.nan)
+    return [date.fromordinal(first + i) for i in range(len(sums))], means
+
+
+# Mean score and entry count per weekday (Monday first).
+def weekday_pattern(cols: EntryColumns) -> dict:
+    idx = cols.live()
+    weekday = (cols.day[idx] - 1) % 7
+    counts = np.bincount(weekday, minlength=7)
+    scored = ~np.isnan(cols.score[idx])
+    sums = np.bincount(weekday[scored], weights=cols.score[idx][scored], minlength=7)
+    n_scored = np.bincount(weekday[scored], minlength=7)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(n_scored > 0, sums / n_scored, np.nan)
+    return {"weekday": WEEKDAYS, "mean": means, "count": counts}
+
+
+# Co-occurrence counts between the `top` most frequent themes; returns (names, square matrix).
+def theme_cooccurrence(cols: EntryColumns, top: int = 10) -> tuple[list, np.ndarray]:
+    themes = cols.themes[cols.live()]
+    flat = themes[themes >= 0]
+    if not len(flat):
+        return [], np.zeros((0, 0), dtype=np.int64)
+    freq = np.bincount(flat, minlength=len(cols.theme_names))
+    top_ids = np.argsort(-freq, kind="stable")[:min(top, np.count_nonzero(freq))]
+    slot = np.full(len(cols.theme_names) + 1, -1, dtype=np.int64)
+    slot[top_ids] = np.arange(len(top_ids))
+    hit = slot[themes]  # padding (-1) indexes the trailing -1 sentinel
+    rows, which = np.nonzero(hit >= 0)
+    member = np.zeros((len(themes), len(top_ids)), dtype=np.float64)
+    member[rows, hit[rows, which]] = 1.0
+    co = (member.T @ member).astype(np.int64)
+    return [cols.theme_names[i] for i in top_ids], co
+
+
+# Strongest off-diagonal pairs from theme_cooccurrence as [{"pair": (a, b), "count": n}].
+def top_theme_pairs(cols: EntryColumns, limit: int = 5, top: int = 20) -> list:
+    names, co = theme_cooccurrence(cols, top)
+    if not names:
+        return []
+    upper = np.triu(co, k=1)
+    flat = np.argsort(-upper, axis=None, kind="stable")[:limit]
+    ii, jj = np.unravel_index(flat, upper.shape)
+    return [{"pair": (names[i], names[j]), "count": int(upper[i, j])} for i, j in zip(ii, jj) if upper[i, j] > 0]
+
+
+# --- Process-wide cache: incremental for in-process writes, rebuilt when the data revision jumps ---
+
+_lock = threading.Lock()
+_cache: EntryColumns | None = None
+
+
+def _on_write(event: dict) -> None:
+    global _cache
+    with _lock:
+        if _cache is None:
+            return
+        if _cache.rev not in (event["revision"] - 1, event["revision"]):
+            _cache = None  # missed a write from another session or process
+        elif event["op"] == "upsert":
+            _cache.upsert(event["id"], event)
+            _cache.rev = event["revision"]
+        elif event["op"] == "delete":
+            _cache.delete(event["id"])
+            _cache.rev = event["revision"]
+        else:
+            _cache = EntryColumns()
+            _cache.rev = event["revision"]
+
+
+def get_columns() -> EntryColumns:
+    global _cache
+    rev = db.get_revision()
+    with _lock:
+        if _cache is None or _cache.rev != rev:
+            _cache = EntryColumns.from_metadata(db.get_entry_metadata())
+            _cache.rev = rev
+        return _cache
+
+
+def invalidate() -> None:
+    global _cache
+    with _lock:
+        _cache = None
+
+
+db.add_write_listener(_on_write)
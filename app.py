@@ -1,11 +1,19 @@
 # Dear Diary — entry point: config, CSS, auth, tab routing.
-import streamlit as st
 from datetime import datetime
 from pathlib import Path
 
+import streamlit as st
+
+import analysis
 import auth
+import backup
 import crypto
 import db
+import drafts
+import llm
+import perf
+import rotation
+import tiering
 
 APP_NAME = "Dear Diary"
 TAGLINE = "A personal AI journaling companion"
@@ -18,9 +26,19 @@ st.set_page_config(
     layout="centered",
     initial_sidebar_state="collapsed",
 )
+perf.begin_rerun(st.session_state.get("perf_enabled", False))
 _css_path = Path(__file__).resolve().parent / "styles.css"
-if _css_path.exists():
-    st.markdown(f"<style>\n{_css_path.read_text()}\n</style>", unsafe_allow_html=True)
+
+
+# Read once per process (and again only if the file changes); reruns just re-emit the cached text.
+@st.cache_resource(show_spinner=False)
+def _css(mtime: float) -> str:
+    return f"<style>\n{_css_path.read_text()}\n</style>"
+
+
+with perf.span("app.read_css"):
+    if _css_path.exists():
+        st.markdown(_css(_css_path.stat().st_mtime), unsafe_allow_html=True)
 
 if "db_inited" not in st.session_state:
     db.init_db()
@@ -32,8 +50,6 @@ if "unlocked" not in st.session_state:
     st.session_state.unlocked = False
 if "page" not in st.session_state:
     st.session_state.page = "Journal"
-if "entries_changed" not in st.session_state:
-    st.session_state.entries_changed = 0
 
 
 # --- Helpers ---
@@ -42,7 +58,8 @@ def _load_has_vault():
     st.session_state.has_vault = db.get_vault() is not None
 
 
-def _load_write_dates():
+def _load_write_dates(rev):
+    st.session_state.write_dates_rev = rev
     st.session_state.write_dates = db.get_write_dates()
     dates = st.session_state.write_dates
     if not dates:
@@ -66,16 +83,15 @@ def _load_write_dates():
     st.session_state.streak = count
 
 
+# Reload when journal.db's revision moved, whichever session or process wrote.
 def _refresh_write_dates_if_needed():
-    if st.session_state.get("entries_changed", 0) > 0:
-        _load_write_dates()
-        st.session_state.entries_changed = 0
+    rev = db.get_revision()
+    if st.session_state.get("write_dates_rev") != rev:
+        _load_write_dates(rev)
 
 
 if st.session_state.has_vault is None:
     _load_has_vault()
-if "write_dates" not in st.session_state:
-    _load_write_dates()
 _refresh_write_dates_if_needed()
 
 streak = st.session_state.get("streak", 0)
@@ -92,6 +108,8 @@ def _render_header(with_nav=True):
             st.markdown(f"**🔥 {streak}**")
         with lock_col:
             if st.button("🔒 Lock", key="lock_btn"):
+                drafts.flush_all()
+                llm.flush_prompt_pool()
                 crypto.clear_key()
                 st.session_state.unlocked = False
                 st.rerun()
@@ -112,6 +130,8 @@ def main():
         _load_has_vault()
         st.rerun()
 
+    backup.maybe_backup_in_background()
+
     if not st.session_state.has_vault:
         st.markdown(f"# {APP_NAME}")
         st.markdown(f"**{TAGLINE}**")
@@ -128,6 +148,11 @@ def main():
         st.caption(FOOTER_TEXT)
         return
 
+    db.migrate_envelopes_in_background()
+    analysis.start_in_background()
+    rotation.resume_in_background()
+    tiering.maybe_maintain_in_background()
+    llm.warm_prompt_pool_in_background()
     _render_header()
     page = st.session_state.page
     if page == "Journal":
@@ -146,4 +171,9 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        _perf_summary = perf.end_rerun(st.session_state.get("page", ""))
+        if _perf_summary is not None:
+            st.session_state.perf_last = _perf_summary
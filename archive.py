@@ -0,0 +1,154 @@
+# Encrypted export archives: entries stream from db as NDJSON through zlib into fixed-size AES-GCM chunks.
+# Layout: header (magic, version, PBKDF2 iterations, salt, nonce prefix), then records of
+# [final flag: 1][length: 4][ciphertext]. Chunk i is sealed with nonce = prefix || i and associated data
+# header || i || flag, so reordered, dropped, spliced or truncated chunks fail authentication.
+import json
+import os
+import struct
+import zlib
+
+from cryptography.exceptions import InvalidTag
+
+import crypto
+import db
+import transfer
+
+MAGIC = b"DDARCH"
+VERSION = 1
+CHUNK_SIZE = 64 * 1024  # plaintext (compressed) bytes per sealed chunk
+NONCE_PREFIX_LENGTH = 8
+TAG_LENGTH = 16
+EXTENSION = ".ddarchive"
+
+_HEADER = struct.Struct(f">{len(MAGIC)}sBI{crypto.SALT_LENGTH}s{NONCE_PREFIX_LENGTH}s")
+_RECORD = struct.Struct(">BI")
+_AAD_TAIL = struct.Struct(">IB")
+MAX_ITERATIONS = 10 * crypto.PBKDF2_ITERATIONS
+
+
+def _nonce(prefix: bytes, index: int) -> bytes:
+    return prefix + index.to_bytes(crypto.IV_LENGTH - NONCE_PREFIX_LENGTH, "big")
+
+
+# Writes an archive of `entries` (any iterable, e.g. db.iter_entries()) to the binary file `out`.
+# Memory stays at about one chunk regardless of journal size. Returns entries written.
+def write_archive(out, passphrase: str, entries=None, progress=None) -> int:
+    if not passphrase:
+        raise ValueError("An archive passphrase is required.")
+    salt, prefix = crypto.generate_salt(), os.urandom(NONCE_PREFIX_LENGTH)
+    header = _HEADER.pack(MAGIC, VERSION, crypto.PBKDF2_ITERATIONS, salt, prefix)
+    key = crypto.derive_key(passphrase, salt)
+    out.write(header)
+    index = 0
+
+    def emit(chunk: bytes, final: bool) -> None:
+        nonlocal index
+        sealed = crypto.seal(chunk, key, _nonce(prefix, index), header + _AAD_TAIL.pack(index, final))
+        out.write(_RECORD.pack(final, len(sealed)))
+        out.write(sealed)
+        index += 1
+
+    compressor = zlib.compressobj(crypto.ZLIB_LEVEL)
+    buf = bytearray()
+    count = 0
+    for e in db.iter_entries() if entries is None else entries:
+        line = json.dumps(transfer.export_record(e), ensure_ascii=False) + "\n"
+        buf += compressor.compress(line.encode("utf-8"))
+        while len(buf) >= CHUNK_SIZE:
+            emit(bytes(buf[:CHUNK_SIZE]), False)
+            del buf[:CHUNK_SIZE]
+        count += 1
+        if progress:
+            progress(count)
+    buf += compressor.flush()
+    while len(buf) > CHUNK_SIZE:
+        emit(bytes(buf[:CHUNK_SIZE]), False)
+        del buf[:CHUNK_SIZE]
+    emit(bytes(buf), True)
+    return count
+
+
+def _read_exact(f, n: int) -> bytes:
+    data = f.read(n)
+    if len(data) != n:
+        raise ValueError("Archive is truncated.")
+    return data
+
+
+# Decrypted, decompressed chunks in order; raises ValueError on a wrong passphrase or any tampering,
+# including a missing final chunk or trailing data.
+def _chunks(f, passphrase: str):
+    header = f.read(_HEADER.size)
+    if len(header) != _HEADER.size or not header.startswith(MAGIC):
+        raise ValueError("Not an encrypted journal archive.")
+    _, version, iterations, salt, prefix = _HEADER.unpack(header)
+    if version != VERSION:
+        raise ValueError(f"Unsupported archive version {version}.")
+    if not 0 < iterations <= MAX_ITERATIONS:
+        raise ValueError("Archive header is corrupt.")
+    key = crypto.derive_key(passphrase, salt, iterations)
+    decompressor = zlib.decompressobj()
+    index, final = 0, False
+    while not final:
+        record = f.read(_RECORD.size)
+        if len(record) != _RECORD.size:
+            raise ValueError("Archive is truncated.")
+        final, length = _RECORD.unpack(record)
+        if final > 1 or not TAG_LENGTH <= length <= CHUNK_SIZE + TAG_LENGTH:
+            raise ValueError("Archive is corrupt.")
+        sealed = _read_exact(f, length)
+        try:
+            chunk = crypto.open_sealed(sealed, key, _nonce(prefix, index), header + _AAD_TAIL.pack(index, final))
+        except InvalidTag:
+            raise ValueError("Wrong passphrase, or the archive was modified." if index == 0
+                             else f"Archive chunk {index} failed authentication.") from None
+        try:
+            yield decompressor.decompress(chunk, CHUNK_SIZE * 4)
+            while decompressor.unconsumed_tail:
+                yield decompressor.decompress(decompressor.unconsumed_tail, CHUNK_SIZE * 4)
+        except zlib.error as e:
+            raise ValueError(f"Archive is corrupt: {e}") from None
+        index += 1
+    if f.read(1) or not decompressor.eof:
+        raise ValueError("Archive has unexpected trailing data.")
+
+
+# Entries from an archive as export dicts, verified chunk by chunk while streaming.
+def read_archive(f, passphrase: str):
+    pending = b""
+    for data in _chunks(f, passphrase):
+        lines = (pending + data).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if line:
+                yield json.loads(line)
+    if pending:
+        yield json.loads(pending)
+
+
+# Authenticates the whole archive without importing anything. Returns the entry count.
+def verify_archive(f, passphrase: str) -> int:
+    return sum(1 for _ in read_archive(f, passphrase))
+
+
+# Import an archive through transfer.import_entries. Seekable sources are verified end to end first, so a
+# tampered or truncated archive imports nothing; otherwise entries before the damage are kept.
+def import_archive(f, passphrase: str, progress=None) -> int:
+    if f.seekable():
+        start = f.tell()
+        verify_archive(f, passphrase)
+        f.seek(start)
+    items = read_archive(f, passphrase)
+    if progress:
+        items = _counted(items, progress)
+    return transfer.import_entries(items)
+
+
+def _counted(items, progress):
+    for n, item in enumerate(items, 1):
+        yield item
+        progress(n)
+
+
+def is_archive(head: bytes) -> bool:
+    return head.startswith(MAGIC)
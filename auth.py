@@ -1,5 +1,6 @@
 # Vault setup, unlock, lock, passphrase UI.
 import streamlit as st
+from cryptography.exceptions import InvalidTag
 
 import crypto
 import db
@@ -16,7 +17,7 @@ def setup_vault(passphrase: str) -> None:
     ciphertext, iv = crypto.encrypt(TEST_PLAINTEXT, key)
     db.set_vault({
         "id": "vault",
-        "salt": crypto.salt_to_b64(salt),
+        "salt": salt,
         "testCipher": ciphertext,
         "testIv": iv,
     })
@@ -27,14 +28,58 @@ def unlock_vault(passphrase: str) -> None:
     v = db.get_vault()
     if not v:
         raise ValueError("Set a passphrase first.")
-    salt = crypto.b64_to_salt(v["salt"])
-    key = crypto.derive_key(passphrase, salt)
+    rot = db.get_key_rotation()
+    if rot is not None:
+        _unlock_mid_rotation(passphrase, v, rot)
+        return
+    key = crypto.derive_key(passphrase, v["salt"])
     crypto.decrypt(v["testCipher"], v["testIv"], key)
     crypto.set_key(key)
 
 
+# During an unfinished passphrase change either passphrase unlocks; each key is stored wrapped by the other.
+def _unlock_mid_rotation(passphrase: str, v: dict, rot: dict) -> None:
+    new_key = crypto.derive_key(passphrase, v["salt"])
+    try:
+        crypto.decrypt(v["testCipher"], v["testIv"], new_key)
+        old_key = crypto.decrypt_bytes(rot["wrapped_old"], rot["wrapped_old_iv"], new_key)
+    except InvalidTag:
+        old_key = crypto.derive_key(passphrase, rot["old_salt"])
+        crypto.decrypt(rot["old_test_cipher"], rot["old_test_iv"], old_key)
+        new_key = crypto.decrypt_bytes(rot["wrapped_new"], rot["wrapped_new_iv"], old_key)
+    crypto.set_key(new_key)
+    crypto.set_previous_key(old_key)
+
+
+# Verify the current passphrase, switch the vault to the new one and keep both keys usable until
+# rotation.run() has re-encrypted everything.
+def begin_passphrase_change(old_passphrase: str, new_passphrase: str) -> None:
+    if db.get_key_rotation() is not None:
+        raise ValueError("A passphrase change is already in progress.")
+    v = db.get_vault()
+    old_key = crypto.derive_key(old_passphrase, v["salt"])
+    try:
+        crypto.decrypt(v["testCipher"], v["testIv"], old_key)
+    except InvalidTag:
+        raise ValueError("Current passphrase is incorrect.")
+    salt = crypto.generate_salt()
+    new_key = crypto.derive_key(new_passphrase, salt)
+    test_cipher, test_iv = crypto.encrypt(TEST_PLAINTEXT, new_key)
+    wrapped_old, wrapped_old_iv = crypto.encrypt_bytes(old_key, new_key)
+    wrapped_new, wrapped_new_iv = crypto.encrypt_bytes(new_key, old_key)
+    db.begin_key_rotation(
+        {"old_salt": v["salt"], "old_test_cipher": v["testCipher"], "old_test_iv": v["testIv"],
+         "wrapped_old": wrapped_old, "wrapped_old_iv": wrapped_old_iv,
+         "wrapped_new": wrapped_new, "wrapped_new_iv": wrapped_new_iv},
+        {"id": "vault", "salt": salt, "testCipher": test_cipher, "testIv": test_iv},
+    )
+    crypto.set_key(new_key)
+    crypto.set_previous_key(old_key)
+
+
 def reset_vault() -> None:
     db.delete_vault()
+    db.finish_key_rotation()
     crypto.clear_key()
 
 
@@ -0,0 +1,220 @@
+# Online backups of the (already encrypted) journal.db via the SQLite backup API; rotation and verified restore.
+# Usage: python -m backup [create | list | restore PATH]
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import db
+
+BACKUP_DIR = db.DB_DIR / "backups"
+BACKUP_PREFIX = "journal-"
+_NAME_RE = re.compile(r"^journal-\d{8}-\d{6}(-[a-z-]+)?\.db$")
+BACKUP_INTERVAL_S = 24 * 60 * 60
+PAGES_PER_STEP = 256
+STEP_PAUSE_S = 0.002
+KEEP_LAST = 5
+KEEP_DAILY = 14
+KEEP_MONTHLY = 6
+
+CHECK_EVERY_S = 60
+
+logger = logging.getLogger("dear_diary.backup")
+_lock = threading.Lock()
+_running = False
+_last_check = 0.0
+
+
+def _backup_dir() -> Path:
+    return Path(os.environ.get("DIARY_BACKUP_DIR") or BACKUP_DIR)
+
+
+def list_backups() -> list:
+    d = _backup_dir()
+    if not d.exists():
+        return []
+    return sorted((p for p in d.glob(f"{BACKUP_PREFIX}*.db") if _NAME_RE.match(p.name)), key=lambda p: p.name, reverse=True)
+
+
+# Copy in page-sized steps from one pinned read snapshot. journal.db runs in WAL mode, so writers
+# keep committing meanwhile and the copy never restarts because of them. With `archive_path`, archived
+# entries are folded into the copy's entries table, so a backup is one self-contained file.
+def _copy(src_path: Path, dst_path: Path, progress=None, archive_path: Path | None = None) -> None:
+    src = sqlite3.connect(src_path, isolation_level=None)
+    dst = sqlite3.connect(dst_path)
+
+    def step(status, remaining, total):
+        if progress:
+            progress(total - remaining, total)
+        time.sleep(STEP_PAUSE_S)
+    try:
+        if archive_path is not None:
+            src.execute("ATTACH DATABASE ? AS archive", (str(archive_path),))
+        src.execute("BEGIN")
+        if archive_path is not None:
+            # Lock the archive before the hot snapshot starts: an entry moving back to the hot table is then
+            # either in that snapshot or still in the archive.
+            src.execute("SELECT COUNT(*) FROM archive.sqlite_master").fetchone()
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        src.backup(dst, pages=PAGES_PER_STEP, progress=step)
+        if archive_path is not None:
+            _fold_archive(src, dst)
+        src.execute("COMMIT")
+    finally:
+        dst.close()
+        src.close()
+
+
+def _fold_archive(src, dst) -> None:
+    rows = src.execute(f"SELECT {db.TIER_COLS} FROM archive.entries WHERE id NOT IN (SELECT id FROM main.entries)")
+    while True:
+        batch = rows.fetchmany(db.BLOB_BATCH)
+        if not batch:
+            break
+        dst.executemany(f"INSERT OR IGNORE INTO entries ({db.TIER_COLS}) VALUES ({', '.join('?' * len(batch[0]))})", batch)
+    dst.commit()
+
+
+def create_backup(progress=None, suffix: str = "") -> Path:
+    d = _backup_dir()
+    d.mkdir(parents=True, exist_ok=True)
+    name = f"{BACKUP_PREFIX}{datetime.now().strftime('%Y%m%d-%H%M%S')}{suffix}.db"
+    tmp = d / (name + ".part")
+    _copy(db.DB_PATH, tmp, progress, db.archive_path() if db.archive_path().exists() else None)
+    final = d / name
+    os.replace(tmp, final)
+    prune_backups()
+    return final
+
+
+# Grandfather-father-son: newest KEEP_LAST, plus newest per day and per month for the configured spans.
+def prune_backups() -> list:
+    backups = list_backups()
+    keep = set(backups[:KEEP_LAST])
+    days, months = {}, {}
+    for p in backups:
+        stamp = p.stem[len(BACKUP_PREFIX):len(BACKUP_PREFIX) + 8]
+        days.setdefault(stamp, p)
+        months.setdefault(stamp[:6], p)
+    keep.update(sorted(days.values(), key=lambda p: p.name, reverse=True)[:KEEP_DAILY])
+    keep.update(sorted(months.values(), key=lambda p: p.name, reverse=True)[:KEEP_MONTHLY])
+    removed = [p for p in backups if p not in keep]
+    for p in removed:
+        p.unlink(missing_ok=True)
+    return removed
+
+
+def last_backup_time() -> float | None:
+    backups = list_backups()
+    return backups[0].stat().st_mtime if backups else None
+
+
+# Start a background backup when the newest one is older than BACKUP_INTERVAL_S; cheap to call per rerun.
+def maybe_backup_in_background() -> bool:
+    global _running, _last_check
+    now = time.time()
+    if now - _last_check < CHECK_EVERY_S or not db.DB_PATH.exists():
+        return False
+    _last_check = now
+    last = last_backup_time()
+    if last is not None and time.time() - last < BACKUP_INTERVAL_S:
+        return False
+    with _lock:
+        if _running:
+            return False
+        _running = True
+
+    def run():
+        global _running
+        try:
+            create_backup()
+        except Exception:
+            logger.exception("scheduled backup failed")
+        finally:
+            with _lock:
+                _running = False
+    threading.Thread(target=run, name="journal-backup", daemon=True).start()
+    return True
+
+
+def verify_backup(path: Path) -> None:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        if result != "ok":
+            raise ValueError(f"Backup failed integrity check: {result}")
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if not {"entries", "vault"} <= tables:
+            raise ValueError("Backup is not a journal database.")
+    finally:
+        conn.close()
+
+
+# Verify, stage next to journal.db, then swap atomically. The current database is backed up first.
+def restore_backup(path: Path) -> Path:
+    path = Path(path)
+    verify_backup(path)
+    safety = create_backup(suffix="-pre-restore") if db.DB_PATH.exists() else None
+    staged = db.DB_PATH.with_name(db.DB_PATH.name + ".restore")
+    _copy(path, staged)
+    verify_backup(staged)
+    # Move the revision past the current one so every cache reloads after the swap.
+    current = db.get_revision() if db.DB_PATH.exists() else 0
+    conn = sqlite3.connect(staged)
+    try:
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('revision', ?)",
+                     (max(current, _revision_of(conn)) + 1,))
+        conn.commit()
+    finally:
+        conn.close()
+    if db.DB_PATH.exists():
+        live = sqlite3.connect(db.DB_PATH)
+        try:
+            live.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            live.close()
+    os.replace(staged, db.DB_PATH)
+    # The restored file holds every entry in its hot table; the old archive would duplicate them.
+    for path in (db.archive_path(), db.archive_path().with_name(db.archive_path().name + "-journal")):
+        path.unlink(missing_ok=True)
+    db.init_db()
+    return safety
+
+
+def _revision_of(conn) -> int:
+    row = conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()
+    return row[0] if row else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Back up or restore journal.db")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("create", help="write a new backup and apply retention")
+    sub.add_parser("list", help="list backups, newest first")
+    restore = sub.add_parser("restore", help="verify a backup and swap it in")
+    restore.add_argument("path", type=Path)
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "create":
+            print(create_backup(lambda done, total: print(f"\r{done}/{total} pages", end="", file=sys.stderr)))
+        elif args.command == "list":
+            for p in list_backups():
+                print(f"{p.name}\t{p.stat().st_size}")
+        else:
+            safety = restore_backup(args.path)
+            print(f"Restored {args.path}" + (f" (previous database saved as {safety.name})" if safety else ""))
+    except (ValueError, sqlite3.Error, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+# Columnar analytics benchmark: build + vectorized insights at 1k/10k/100k entries.
+# Run from the repo root: python -m benchmarks.analytics_bench
+import argparse
+import random
+import time
+
+import analytics
+
+DAY_MS = 24 * 60 * 60 * 1000
+START_MS = 1_577_836_800_000  # 2020-01-01 UTC
+VOCAB = [f"theme{i}" for i in range(2000)]
+
+
+def synthetic_metadata(n: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        score = rng.uniform(-5, 5)
+        rows.append({
+            "id": f"entry_{i}",
+            "createdAt": START_MS + (i * 3 * DAY_MS) // 4 + rng.randrange(DAY_MS),
+            "sentimentScore": score,
+            "sentimentLabel": "positive" if score > 0.5 else ("negative" if score < -0.5 else "neutral"),
+            "themes": rng.sample(VOCAB[:200], 3) + rng.sample(VOCAB, 5),
+        })
+    return rows
+
+
+def _time(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def run(sizes) -> list:
+    results = []
+    for n in sizes:
+        rows = synthetic_metadata(n)
+        cols = analytics.EntryColumns.from_metadata(rows)
+        extra = synthetic_metadata(1000, seed=n)
+        results.append({
+            "entries": n,
+            "build_ms": _time(lambda rows=rows: analytics.EntryColumns.from_metadata(rows), 1),
+            "rolling_mood_ms": _time(lambda cols=cols: analytics.rolling_mood(cols, 30)),
+            "weekday_pattern_ms": _time(lambda cols=cols: analytics.weekday_pattern(cols)),
+            "theme_cooccurrence_ms": _time(lambda cols=cols: analytics.theme_cooccurrence(cols, 20)),
+            "upsert_1k_ms": _time(lambda cols=cols, extra=extra: [cols.upsert(f"x{r['id']}", r) for r in extra], 1),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar analytics benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    args = parser.parse_args()
+    for r in run(args.sizes):
+        print("  ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in r.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+# Concurrent-session load test: one real Streamlit server for app.py, N simulated browsers speaking its
+# websocket protocol against a seeded journal (open, unlock, Journal saves, Insights calendar browsing).
+# Reports p50/p95/p99 latency per action, SQLite lock waits and server CPU, for each concurrency level.
+# Widgets inside fragments rerun only their fragment, as in a browser.
+# Run from the repo root: python -m benchmarks.loadtest [--sessions 1 4 8] [--rounds 5] [--entries 2000]
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from websockets.sync.client import connect
+
+import analysis
+import auth
+import crypto
+import db
+import llm
+import tiering
+from benchmarks import synthetic
+
+try:
+    import resource
+except ImportError:  # not on Windows; peak RSS is then omitted
+    resource = None
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_PATH = ROOT / "app.py"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+PASSPHRASE = "loadtest-passphrase"
+DEFAULT_SESSIONS = [1, 2, 4, 8]
+RUN_TIMEOUT_S = 60
+START_TIMEOUT_S = 30
+BUSY_TIMEOUT_S = 5.0  # sqlite3.connect's default; waits past this fail as they would in the app
+BUSY_BACKOFF_S = (0.001, 0.002, 0.005, 0.01, 0.015, 0.02, 0.025)  # SQLite's own busy-handler steps
+STATS_EVERY_S = 0.25
+RECENT_DAYS = 90  # Insights browsing picks days from this window
+_FINISHED = (ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY)
+logger = logging.getLogger("dear_diary.loadtest")
+
+
+# --- Server side: SQLite lock waits and CPU ---
+# db.get_conn opens connections with db.CONNECTION_FACTORY; this one turns off SQLite's internal busy handler
+# and retries in Python instead, so every wait for another connection's lock is seen and timed.
+
+_waits_lock = threading.Lock()
+_waits = {}  # thread kind -> [waits, seconds, max seconds, timeouts]
+
+
+def _thread_kind() -> str:
+    return threading.current_thread().name.rstrip("-0123456789") or "main"
+
+
+def _record_wait(seconds: float, timed_out: bool) -> None:
+    with _waits_lock:
+        w = _waits.setdefault(_thread_kind(), [0, 0.0, 0.0, 0])
+        w[0] += 1
+        w[1] += seconds
+        w[2] = max(w[2], seconds)
+        w[3] += timed_out
+
+
+def _retry(call, *args):
+    started, tries = None, 0
+    while True:
+        try:
+            result = call(*args)
+        except sqlite3.OperationalError as e:
+            code = getattr(e, "sqlite_errorcode", sqlite3.SQLITE_BUSY)
+            # A stale read snapshot cannot become a write by waiting; SQLite fails it at once too.
+            if code & 0xFF not in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED) or code == sqlite3.SQLITE_BUSY_SNAPSHOT:
+                raise
+            now = time.perf_counter()
+            started = started or now
+            if now - started >= BUSY_TIMEOUT_S:
+                _record_wait(now - started, True)
+                raise
+            time.sleep(BUSY_BACKOFF_S[min(tries, len(BUSY_BACKOFF_S) - 1)])
+            tries += 1
+            continue
+        if started is not None:
+            _record_wait(time.perf_counter() - started, False)
+        return result
+
+
+class _TimedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        kwargs["timeout"] = 0
+        super().__init__(*args, **kwargs)
+
+    def execute(self, *args):
+        return _retry(super().execute, *args)
+
+    def executemany(self, *args):
+        return _retry(super().executemany, *args)
+
+    def executescript(self, *args):
+        return _retry(super().executescript, *args)
+
+    def commit(self):
+        return _retry(super().commit)
+
+
+def _dump_stats(path: Path) -> None:
+    while True:
+        with _waits_lock:
+            waits = {kind: list(w) for kind, w in _waits.items()}
+        stats = {"at": time.monotonic(), "cpu_s": time.process_time(), "waits": waits,
+                 "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None}
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(stats))
+        os.replace(tmp, path)
+        time.sleep(STATS_EVERY_S)
+
+
+# Server process: app.py under `streamlit run` in this interpreter, so the app imports the modules configured
+# here (journal and AI files in the work directory, timed connections); lock waits and CPU go to `stats`.
+def serve(db_path: Path, port: int, stats: Path) -> int:
+    from streamlit.web import cli as streamlit_cli
+    db.DB_PATH = db_path
+    db.CONNECTION_FACTORY = _TimedConnection
+    llm.STORAGE_DIR = db_path.parent
+    llm.CONFIG_PATH = llm.STORAGE_DIR / llm.CONFIG_PATH.name
+    llm.REFLECTION_PATH = llm.STORAGE_DIR / llm.REFLECTION_PATH.name
+    llm.POOL_PATH = llm.STORAGE_DIR / llm.POOL_PATH.name
+    threading.Thread(target=_dump_stats, args=(stats,), name="loadtest-stats", daemon=True).start()
+    sys.argv = ["streamlit", "run", str(APP_PATH), "--server.port", str(port), "--server.address", "127.0.0.1",
+                "--server.headless", "true", "--server.fileWatcherType", "none",
+                "--browser.gatherUsageStats", "false", "--logger.level", "error"]
+    return streamlit_cli.main()
+
+
+# --- Client side: a headless browser session ---
+
+class _Session:
+    def __init__(self, ws):
+        self.ws = ws
+        self.widgets = {}  # widget id -> (element, fragment id), most recently rendered last
+        self.values = {}  # widget id -> WidgetState holding its current value, sent with every rerun
+        self.page_hash = ""
+
+    def find(self, key: str | None = None, label: str | None = None) -> str:
+        for wid, (el, _) in reversed(self.widgets.items()):
+            if (key is not None and wid.endswith("-" + key)) or (label is not None and getattr(el, "label", None) == label):
+                return wid
+        raise LookupError(f"no widget {key or label!r} on the page")
+
+    def set_value(self, wid: str, field: str, value) -> None:
+        state = BackMsg().rerun_script.widget_states.widgets.add()
+        state.id = wid
+        setattr(state, field, value)
+        self.values[wid] = state
+
+    # One rerun as the browser sends it, through any st.rerun() the app makes; returns exceptions the app
+    # rendered. Only the fragment is rerun when the triggering widget lives in one.
+    def rerun(self, trigger: str | None = None, field: str = "trigger_value", value=True) -> list:
+        fragment = ""
+        if trigger is not None:
+            if field == "trigger_value":
+                self.values.pop(trigger, None)
+            else:
+                self.set_value(trigger, field, value)
+            fragment = self.widgets[trigger][1]
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = self.page_hash
+        msg.rerun_script.fragment_id = fragment
+        msg.rerun_script.widget_states.widgets.extend(self.values.values())
+        if trigger is not None and field == "trigger_value":
+            state = msg.rerun_script.widget_states.widgets.add()
+            state.id, state.trigger_value = trigger, True
+        if not fragment:
+            self.widgets.clear()
+        self.ws.send(msg.SerializeToString())
+        return self._receive()
+
+    def _receive(self) -> list:
+        errors = []
+        while True:
+            fm = ForwardMsg()
+            fm.ParseFromString(self.ws.recv(timeout=RUN_TIMEOUT_S))
+            kind = fm.WhichOneof("type")
+            if kind == "new_session":
+                self.page_hash = fm.new_session.page_script_hash
+            elif kind == "delta" and fm.delta.WhichOneof("type") == "new_element":
+                el = fm.delta.new_element
+                inner = getattr(el, el.WhichOneof("type"))
+                if el.WhichOneof("type") == "exception":
+                    errors.append(inner.message)
+                wid = getattr(inner, "id", "")
+                if wid:
+                    self.widgets.pop(wid, None)
+                    self.widgets[wid] = (inner, fm.delta.fragment_id)
+            elif kind == "script_finished" and fm.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                if fm.script_finished not in _FINISHED:
+                    errors.append("script failed to compile")
+                return errors
+
+
+class _User:
+    def __init__(self, index: int, url: str, rounds: int, think_s: float, days: list, timings: dict,
+                 lock: threading.Lock):
+        self.index, self.url, self.rounds, self.think_s, self.days = index, url, rounds, think_s, days
+        self.timings, self.lock = timings, lock
+        self.rng = random.Random(index)
+        self.nonce = 0
+        self.session = None
+        self.connections = contextlib.ExitStack()
+
+    # Runs one user action (widget interaction through to the end of its rerun) and records latency or failure.
+    def _act(self, name: str, step) -> bool:
+        t0 = time.perf_counter()
+        try:
+            ok = not step()
+        except Exception:
+            logger.exception("session %d: %s failed", self.index, name)
+            ok = False
+        elapsed = time.perf_counter() - t0
+        with self.lock:
+            t = self.timings.setdefault(name, {"ms": [], "errors": 0})
+            if ok:
+                t["ms"].append(elapsed * 1000)
+            else:
+                t["errors"] += 1
+        if self.think_s:
+            time.sleep(self.rng.uniform(0, self.think_s))
+        return ok
+
+    def _open(self) -> list:
+        self.session = _Session(self.connections.enter_context(
+            connect(self.url, max_size=None, open_timeout=START_TIMEOUT_S)))
+        return self.session.rerun()
+
+    def _unlock(self) -> list:
+        s = self.session
+        s.set_value(s.find(key="unlock_p"), "string_value", PASSPHRASE)
+        return s.rerun(s.find(label="Unlock"))
+
+    def _save(self) -> list:
+        s = self.session
+        editor = next(wid for wid in reversed(s.widgets) if "-journal_content_" in wid)
+        text = s.values[editor].string_value if editor in s.values else s.widgets[editor][0].default
+        s.set_value(editor, "string_value", f"{text}\n\nSession {self.index} at {datetime.now():%H:%M:%S.%f}.".strip())
+        try:
+            button = s.find(label="Update entry")
+        except LookupError:
+            button = s.find(label="Save entry")
+        return s.rerun(button)
+
+    def _calendar_click(self, action: str, value: int) -> list:
+        self.nonce += 1
+        click = json.dumps({"action": action, "value": value, "nonce": f"{self.index}-{self.nonce}"})
+        return self.session.rerun(self.session.find(key="insights_calendar"), "json_value", click)
+
+    def run(self, barrier: threading.Barrier) -> None:
+        barrier.wait()
+        with self.connections:
+            if not self._act("open", self._open) or not self._act("unlock", self._unlock):
+                return
+            for _ in range(self.rounds):
+                day = self.rng.choice(self.days)
+                previous_month = db.get_month_start_ms(db.get_month_start_ms(day) - 1)
+                self._act("journal_open", lambda: self.session.rerun(self.session.find(key="nav_Journal")))
+                self._act("journal_save", self._save)
+                self._act("insights_open", lambda: self.session.rerun(self.session.find(key="nav_Insights")))
+                self._act("insights_day", lambda day=day: self._calendar_click("day", day))
+                self._act("insights_next_day", lambda: self.session.rerun(self.session.find(label="Next day →")))
+                self._act("insights_month", lambda month=previous_month: self._calendar_click("month", month))
+
+
+# --- Driver ---
+
+# A fresh journal per level: `entries` synthetic entries ending yesterday, archived and analyzed, then locked.
+def _seed(db_path: Path, entries: int) -> list:
+    db.DB_PATH = db_path
+    db.init_db()
+    auth.setup_vault(PASSPHRASE)
+    generated = synthetic.generate_entries(entries)
+    today = db.get_day_start_ms(int(time.time() * 1000))
+    shift = today - synthetic.DAY_MS - db.get_day_start_ms(max(e["createdAt"] for e in generated))
+    db.insert_entries([{**e, "createdAt": e["createdAt"] + shift} for e in generated])
+    tiering.maintain()
+    analysis.backfill()
+    crypto.clear_key()
+    return [today - i * db.MS_DAY_MS for i in range(1, RECENT_DAYS + 1)]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _read_stats(path: Path) -> dict:
+    for _ in range(3):
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            time.sleep(STATS_EVERY_S)
+    raise RuntimeError("The server stopped reporting stats.")
+
+
+def _start_server(workdir: Path, port: int) -> subprocess.Popen:
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}  # keep sessions off the network
+    env["DIARY_BACKUP_DIR"] = str(workdir / "backups")
+    log = workdir / "server.log"
+    with open(log, "wb") as err:
+        proc = subprocess.Popen([sys.executable, "-m", "benchmarks.loadtest", "--serve", str(workdir / "journal.db"),
+                                 "--port", str(port), "--stats", str(workdir / "stats.json")],
+                                cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=err)
+    deadline = time.monotonic() + START_TIMEOUT_S
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"The server exited:\n{log.read_text()[-2000:]}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as r:
+                if r.status == 200 and (workdir / "stats.json").exists():
+                    return proc
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("The server did not start in time.")
+
+
+def _percentile(ordered: list, p: float) -> float:
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered) + 0.5) - 1))]
+
+
+def _summarize(timings: dict, first: dict, end: dict, peak: float, wall: float, sessions: int) -> dict:
+    actions = {}
+    for name, t in timings.items():
+        ms = sorted(t["ms"])
+        actions[name] = {"count": len(ms), "errors": t["errors"]}
+        if ms:
+            actions[name].update({f"p{p}_ms": round(_percentile(ms, p), 1) for p in (50, 95, 99)})
+            actions[name]["max_ms"] = round(ms[-1], 1)
+    waits = {}
+    for kind, (n, secs, longest, timeouts) in sorted(end["waits"].items()):
+        before = first["waits"].get(kind, [0, 0.0, 0.0, 0])
+        if n > before[0]:
+            waits[kind] = {"waits": n - before[0], "total_ms": round((secs - before[1]) * 1000, 1),
+                           "max_ms": round(longest * 1000, 1), "timeouts": timeouts - before[3]}
+    cpu = end["cpu_s"] - first["cpu_s"]
+    return {
+        "sessions": sessions,
+        "wall_s": round(wall, 2),
+        "actions_per_s": round(sum(a["count"] for a in actions.values()) / wall, 2),
+        "actions": actions,
+        "lock_waits": waits,
+        "server_cpu": {
+            "process_s": round(cpu, 2),
+            "mean_cores": round(cpu / (end["at"] - first["at"]), 2),
+            "peak_cores": round(peak, 2),
+            "cores": os.cpu_count(),
+            "max_rss_mb": round(end["max_rss_kb"] / 1024, 1) if end["max_rss_kb"] else None,
+        },
+    }
+
+
+def run_level(sessions: int, rounds: int, entries: int, think_s: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        days = _seed(workdir / "journal.db", entries)
+        port = _free_port()
+        server = _start_server(workdir, port)
+        try:
+            stats_path = workdir / "stats.json"
+            timings, lock = {}, threading.Lock()
+            url = f"ws://127.0.0.1:{port}/_stcore/stream"
+            users = [_User(i, url, rounds, think_s, days, timings, lock) for i in range(sessions)]
+            barrier = threading.Barrier(sessions)
+            threads = [threading.Thread(target=u.run, args=(barrier,), name=f"loadtest-user-{u.index}") for u in users]
+            first = last = _read_stats(stats_path)
+            peak = 0.0
+            t0 = time.perf_counter()
+            for t in threads:
+                t.start()
+            while any(t.is_alive() for t in threads):
+                time.sleep(STATS_EVERY_S)
+                now = _read_stats(stats_path)
+                if now["at"] > last["at"]:
+                    peak = max(peak, (now["cpu_s"] - last["cpu_s"]) / (now["at"] - last["at"]))
+                    last = now
+            wall = time.perf_counter() - t0
+            time.sleep(STATS_EVERY_S * 2)
+            end = _read_stats(stats_path)
+        finally:
+            server.terminate()
+            server.wait(10)
+    return _summarize(timings, first, end, peak, wall, sessions)
+
+
+def _print_level(r: dict) -> None:
+    cpu = r["server_cpu"]
+    print(f"\n{r['sessions']} session(s): {r['wall_s']}s wall, {r['actions_per_s']} actions/s, "
+          f"server CPU {cpu['mean_cores']} cores mean / {cpu['peak_cores']} peak of {cpu['cores']}")
+    print(f"  {'action':<18}{'n':>5}{'err':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    for name, a in r["actions"].items():
+        cells = "".join(f"{a.get(k, float('nan')):>9.1f}" for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms"))
+        print(f"  {name:<18}{a['count']:>5}{a['errors']:>5}{cells}")
+    if not r["lock_waits"]:
+        print("  lock waits: none")
+    for kind, w in r["lock_waits"].items():
+        print(f"  lock waits [{kind}]: {w['waits']} waits, {w['total_ms']} ms total, {w['max_ms']} ms max, "
+              f"{w['timeouts']} timed out")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Dear Diary concurrent-session load test")
+    parser.add_argument("--sessions", type=int, nargs="+", default=DEFAULT_SESSIONS, help="concurrency levels to run")
+    parser.add_argument("--rounds", type=int, default=5, help="save + browse rounds per session after unlock")
+    parser.add_argument("--entries", type=int, default=2_000, help="seeded journal size")
+    parser.add_argument("--think-ms", type=float, default=0, help="random pause of up to this after each action")
+    parser.add_argument("--out", type=Path, default=RESULTS_DIR / "loadtest-latest.json")
+    parser.add_argument("--serve", type=Path, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--stats", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.serve:
+        return serve(args.serve, args.port, args.stats)
+
+    report = {
+        "meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "entries": args.entries,
+                 "rounds": args.rounds, "think_ms": args.think_ms},
+        "levels": [],
+    }
+    for n in args.sessions:
+        r = run_level(n, args.rounds, args.entries, args.think_ms / 1000)
+        report["levels"].append(r)
+        _print_level(r)
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps(report, indent=2))
+    print(f"\nwrote {args.out}")
+    errors = sum(a["errors"] for r in report["levels"] for a in r["actions"].values())
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+# Data-path benchmark suite over synthetic journals; writes JSON and compares against a baseline.
+# Run from the repo root: python -m benchmarks.run [--sizes 1000 10000] [--baseline PATH]
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import analysis
+import analytics
+import auth
+import crypto
+import db
+import sentiment
+import transfer
+from benchmarks import synthetic
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+PASSPHRASE = "benchmark-passphrase"
+TEXT_SAMPLE = 1_000
+IMPORT_SAMPLE = 500
+LONG_ENTRY_PARAGRAPHS = 50
+
+
+def _best_ms(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return round(best * 1000, 3)
+
+
+# Mirrors the reads pages/insights.py performs on each render.
+def _insights_data_path():
+    write_dates = db.get_write_dates()
+    entries = db.get_all_entries()
+    day_sentiments = {}
+    for e in entries:
+        day_sentiments.setdefault(db.get_day_start_ms(e["createdAt"]), e.get("sentimentLabel") or "neutral")
+    sentiment.aggregate_themes(entries)
+    db.get_sentiment_rollups("week")
+    analytics.invalidate()
+    analytics.weekday_pattern(analytics.get_columns())
+    return write_dates, day_sentiments
+
+
+def _content_bytes() -> int:
+    return db._with_conn(lambda c: c.execute("SELECT COALESCE(SUM(LENGTH(encrypted_content)), 0) FROM entries").fetchone()[0])
+
+
+def bench_size(n: int, workdir: Path, repeat: int) -> dict:
+    db.DB_PATH = workdir / f"journal-{n}.db"
+    db.init_db()
+    crypto.clear_key()
+    auth.setup_vault(PASSPHRASE)
+    entries = synthetic.generate_entries(n)
+    t0 = time.perf_counter()
+    db.insert_entries(entries)
+    seed_ms = round((time.perf_counter() - t0) * 1000, 3)
+    slow = 1 if n >= 100_000 else repeat
+
+    crypto.clear_key()
+    result = {"entries": n, "seed_ms": seed_ms, "db_bytes": db.DB_PATH.stat().st_size, "content_bytes": _content_bytes()}
+    result["unlock_ms"] = _best_ms(lambda: auth.unlock_vault(PASSPHRASE), 1)
+    result["get_all_entries_ms"] = _best_ms(db.get_all_entries, slow)
+    result["get_write_dates_ms"] = _best_ms(db.get_write_dates, slow)
+    result["insights_data_path_ms"] = _best_ms(_insights_data_path, slow)
+    all_entries = db.get_all_entries()
+    result["export_ms"] = _best_ms(lambda: transfer.export_entries(all_entries), slow)
+
+    # Import a fresh sample into the seeded journal (new days, so every item is inserted).
+    sample = synthetic.generate_entries(IMPORT_SAMPLE, seed=n + 1)
+    shift = max(e["createdAt"] for e in entries) + synthetic.DAY_MS - min(e["createdAt"] for e in sample)
+    sample = [{**e, "createdAt": e["createdAt"] + shift} for e in sample]
+    t0 = time.perf_counter()
+    transfer.import_entries(sample)
+    analysis.wait()
+    result["import_per_entry_ms"] = round((time.perf_counter() - t0) * 1000 / IMPORT_SAMPLE, 3)
+
+    texts = [e["content"] for e in entries[:TEXT_SAMPLE]]
+    result["extract_themes_per_entry_ms"] = round(_best_ms(lambda: [sentiment.extract_themes(t) for t in texts], repeat) / len(texts), 4)
+    result["analyze_sentiment_per_entry_ms"] = round(_best_ms(lambda: [sentiment.analyze_sentiment(t) for t in texts], repeat) / len(texts), 4)
+
+    # A long merged entry (as imports build them) re-analyzed after appending one paragraph.
+    long_text = sentiment.PARAGRAPH_SEP.join(texts[:LONG_ENTRY_PARAGRAPHS])
+    edited = long_text + sentiment.PARAGRAPH_SEP + texts[LONG_ENTRY_PARAGRAPHS]
+    _, cache = sentiment.analyze_incremental(long_text)
+    result["reanalyze_long_full_ms"] = _best_ms(lambda: sentiment.analyze(edited), repeat)
+    result["reanalyze_long_incremental_ms"] = _best_ms(lambda: sentiment.analyze_incremental(edited, cache), repeat)
+    crypto.clear_key()
+    return result
+
+
+# Metrics ending in _ms that grew by more than `tolerance` (fraction) over the baseline.
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for size, metrics in current["results"].items():
+        base = baseline.get("results", {}).get(size, {})
+        for name, value in metrics.items():
+            old = base.get(name)
+            if not name.endswith("_ms") or not old or old < 0.01:
+                continue
+            if value > old * (1 + tolerance):
+                regressions.append({"size": size, "metric": name, "baseline": old, "current": value, "ratio": round(value / old, 2)})
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Dear Diary data-path benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", type=Path, default=RESULTS_DIR / "latest.json")
+    parser.add_argument("--baseline", type=Path, help="compare against this results file")
+    parser.add_argument("--save-baseline", action="store_true", help="also write results to results/baseline.json")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            r = bench_size(n, Path(tmp), args.repeat)
+            report["results"][str(n)] = r
+            print("  ".join(f"{k}={v}" for k, v in r.items()), flush=True)
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps(report, indent=2))
+    if args.save_baseline:
+        (RESULTS_DIR / "baseline.json").write_text(json.dumps(report, indent=2))
+    print(f"Results written to {args.out}")
+
+    if args.baseline:
+        regressions = compare(report, json.loads(args.baseline.read_text()), args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r['size']} {r['metric']}: {r['baseline']} -> {r['current']} ms (x{r['ratio']})")
+        if regressions:
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
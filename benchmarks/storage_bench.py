@@ -0,0 +1,101 @@
+# Storage benchmark: base64 TEXT ciphertext vs BLOB columns (size, bulk read) across the migration.
+# File sizes after migration include the rollup tables init_db backfills; column bytes compare like for like.
+# Run from the repo root: python -m benchmarks.storage_bench [--sizes 1000 10000 100000]
+import argparse
+import base64
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+import crypto
+import db
+from benchmarks import synthetic
+
+LEGACY_SCHEMA = """
+    CREATE TABLE entries (
+        id TEXT PRIMARY KEY, created_at INTEGER NOT NULL, encrypted_content TEXT NOT NULL, iv TEXT NOT NULL,
+        sentiment_score REAL, sentiment_label TEXT, themes TEXT, envelope INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX idx_entries_created_at ON entries(created_at);
+    CREATE TABLE vault (id TEXT PRIMARY KEY, salt TEXT NOT NULL, test_cipher TEXT NOT NULL, test_iv TEXT NOT NULL);
+    CREATE TABLE entry_terms (id TEXT PRIMARY KEY, encrypted_terms TEXT NOT NULL, iv TEXT NOT NULL, envelope INTEGER NOT NULL DEFAULT 0);
+"""
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+# A journal in the pre-BLOB layout: every ciphertext and IV stored as base64 text.
+def _write_legacy(path: Path, entries: list, key: bytes) -> None:
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    rows = []
+    for i, e in enumerate(entries):
+        ct, iv = crypto.encrypt_content(e["content"], key)
+        rows.append((f"entry_{i}", e["createdAt"], _b64(ct), _b64(iv), e["sentimentScore"], e["sentimentLabel"],
+                     json.dumps(e["themes"]), db.ENVELOPE_VERSION))
+    conn.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def _sizes(path: Path) -> tuple[int, int]:
+    conn = sqlite3.connect(path)
+    stored = conn.execute("SELECT SUM(LENGTH(encrypted_content) + LENGTH(iv)) FROM entries").fetchone()[0]
+    conn.execute("VACUUM")
+    conn.close()
+    return stored, path.stat().st_size
+
+
+# The bulk-read core of db.get_all_entries: fetch every row, decode if needed, decrypt.
+def _read_all(path: Path, key: bytes, decode) -> int:
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT encrypted_content, iv FROM entries ORDER BY created_at DESC").fetchall()
+    conn.close()
+    return len([crypto.decrypt_content(decode(ct), decode(iv), key) for ct, iv in rows])
+
+
+def _time(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def run(sizes, workdir: Path) -> list:
+    key = os.urandom(crypto.KEY_LENGTH)
+    crypto.set_key(key)
+    results = []
+    for n in sizes:
+        path = workdir / f"storage-{n}.db"
+        _write_legacy(path, synthetic.generate_entries(n), key)
+        r = {"entries": n}
+        r["text_column_bytes"], r["text_file_bytes"] = _sizes(path)
+        r["text_read_ms"] = _time(lambda path=path: _read_all(path, key, base64.b64decode))
+        db.DB_PATH = path
+        r["migrate_ms"] = _time(lambda: db._with_conn(db._migrate_blobs), 1)
+        db.init_db()
+        r["blob_column_bytes"], r["blob_file_bytes"] = _sizes(path)
+        r["blob_read_ms"] = _time(lambda path=path: _read_all(path, key, bytes))
+        results.append(r)
+    crypto.clear_key()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BLOB vs base64 storage benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        for r in run(args.sizes, Path(tmp)):
+            print("  ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in r.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# Deterministic synthetic journals in the shape of journal-export.json.
+import random
+
+import sentiment
+
+DAY_MS = 24 * 60 * 60 * 1000
+START_MS = 1_420_070_400_000  # 2015-01-01 UTC
+
+OPENERS = ["Today", "This morning", "Tonight", "After work", "During lunch", "On the walk home", "Before bed"]
+SUBJECTS = [
+    "work", "the project", "my sister", "the garden", "running", "the new job", "dinner with friends",
+    "the move", "my health", "the weekend trip", "reading", "the deadline", "the team meeting", "music",
+    "the kids", "cooking", "the apartment", "my budget", "therapy", "the interview", "coffee", "the rain",
+]
+POSITIVE = ["felt wonderful", "went really well", "made me happy", "was calm and good", "gave me energy", "was a real win"]
+NEGATIVE = ["felt heavy", "went badly", "made me anxious", "was exhausting", "left me frustrated", "was a struggle"]
+NEUTRAL = ["happened as usual", "took most of the afternoon", "was on my mind", "kept me busy", "came up again"]
+CLOSERS = [
+    "I want to remember this.", "Tomorrow is another chance.", "Still thinking about it.",
+    "Grateful for small things.", "Need more sleep.", "Trying to be patient with myself.",
+]
+
+
+def _sentence(rng: random.Random, mood: float) -> str:
+    pool = POSITIVE if mood > 0.2 else (NEGATIVE if mood < -0.2 else NEUTRAL)
+    return f"{rng.choice(OPENERS)} {rng.choice(SUBJECTS)} {rng.choice(pool)}."
+
+
+def _content(rng: random.Random, mood: float) -> str:
+    paragraphs = []
+    for _ in range(1 if rng.random() < 0.8 else rng.randint(2, 4)):
+        sentences = [_sentence(rng, mood + rng.uniform(-0.3, 0.3)) for _ in range(rng.randint(2, 7))]
+        paragraphs.append(" ".join(sentences + [rng.choice(CLOSERS)]))
+    return "\n\n".join(paragraphs)
+
+
+# n entries, one per day (with occasional gaps), newest first like an export.
+def generate_entries(n: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    entries, day = [], 0
+    for i in range(n):
+        day += 1 if rng.random() < 0.9 else rng.randint(2, 5)
+        mood = max(-1.0, min(1.0, rng.gauss(0.15, 0.5)))
+        content = _content(rng, mood)
+        score = round(mood * 5, 4)
+        label = "positive" if mood > 0.1 else ("negative" if mood < -0.1 else "neutral")
+        created = START_MS + day * DAY_MS + rng.randrange(8, 23) * 60 * 60 * 1000
+        entries.append({
+            "id": f"entry_{created}_{i:06x}",
+            "content": content,
+            "createdAt": created,
+            "sentimentScore": score,
+            "sentimentLabel": label,
+            "themes": sentiment.extract_themes(content),
+        })
+    entries.reverse()
+    return entries
@@ -0,0 +1,308 @@
+# Headless bulk operations on journal.db without Streamlit: import, export, backfill, verify, maintain,
+# llm-usage, wipe, benchmark.
+# Usage: python -m cli [--passphrase-fd N] COMMAND ...   (the passphrase is read from stdin by default)
+# Exit codes: 0 ok, 1 error, 2 usage, 3 wrong or missing passphrase, 4 verification found problems.
+import argparse
+import getpass
+import json
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from cryptography.exceptions import InvalidTag
+
+import analysis
+import archive
+import auth
+import crypto
+import db
+import llm
+import metering
+import related
+import rotation
+import sentiment
+import tiering
+import transfer
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_AUTH = 3
+EXIT_VERIFY = 4
+PROGRESS_EVERY_S = 0.2
+
+
+# Missing vault or wrong passphrase (EXIT_AUTH); kept apart from PermissionError, which file access raises.
+class AuthError(Exception):
+    pass
+
+
+class _Progress:
+    def __init__(self, label: str, quiet: bool):
+        self.label, self.quiet = label, quiet
+        self.shown, self.last = False, 0.0
+
+    def __call__(self, done: int, total: int | None = None, *_) -> None:
+        now = time.monotonic()
+        if self.quiet or now - self.last < PROGRESS_EVERY_S:
+            return
+        self.last, self.shown = now, True
+        print(f"\r{self.label}: {done}" + (f"/{total}" if total else ""), end="", file=sys.stderr, flush=True)
+
+    def done(self, message: str) -> None:
+        if self.shown:
+            print("\r\033[K", end="", file=sys.stderr)
+        if not self.quiet:
+            print(message, file=sys.stderr)
+
+
+def _read_secret(fd: int | None, prompt: str) -> str:
+    if fd is not None:
+        with os.fdopen(fd, "r", closefd=False) as f:
+            return f.readline().rstrip("\r\n")
+    if sys.stdin.isatty():
+        return getpass.getpass(prompt)
+    return sys.stdin.readline().rstrip("\r\n")
+
+
+def _unlock(args) -> str:
+    if not db.get_vault():
+        raise AuthError("No passphrase is set; create one in the app first.")
+    passphrase = _read_secret(args.passphrase_fd, "Passphrase: ")
+    try:
+        auth.unlock_vault(passphrase)
+    except InvalidTag:
+        raise AuthError("Incorrect passphrase.") from None
+    return passphrase
+
+
+def _archive_passphrase(args) -> str:
+    if args.archive_passphrase_fd is not None:
+        return _read_secret(args.archive_passphrase_fd, "")
+    return args.passphrase
+
+
+def _wait_for_analysis(quiet: bool) -> None:
+    p = _Progress("analysis queue", quiet)
+    while not analysis.wait(PROGRESS_EVERY_S):
+        p(analysis.pending())
+    p.done("analysis queue drained")
+
+
+def cmd_import(args) -> int:
+    p = _Progress("imported", args.quiet)
+    with open(args.path, "rb") as f:
+        if archive.is_archive(f.read(len(archive.MAGIC))):
+            f.seek(0)
+            imported = archive.import_archive(f, _archive_passphrase(args), p)
+        else:
+            f.seek(0)
+            data = json.load(f)
+            if not isinstance(data, list):
+                raise ValueError("Expected a JSON array of entries.")
+            imported = transfer.import_entries(data)
+    p.done(f"imported {imported} entries")
+    _wait_for_analysis(args.quiet)
+    return EXIT_OK
+
+
+# Writes to PATH.part and renames on success, so a failed export never leaves a partial file behind.
+def cmd_export(args) -> int:
+    fmt = args.format or ("archive" if args.path.endswith(archive.EXTENSION) else "json")
+    p = _Progress("exported", args.quiet)
+    if fmt == "archive":
+        passphrase = _archive_passphrase(args)
+
+        def write(out):
+            return archive.write_archive(out, passphrase, progress=p)
+        mode = "wb"
+    else:
+        def write(out):
+            return transfer.write_export(out, db.iter_entries(), p)
+        mode = "w"
+    if args.path == "-":
+        out = sys.stdout.buffer if mode == "wb" else sys.stdout
+        count = write(out)
+        out.flush()
+    else:
+        tmp = Path(args.path + ".part")
+        try:
+            with open(tmp, mode, **({} if mode == "wb" else {"encoding": "utf-8"})) as out:
+                count = write(out)
+            os.replace(tmp, args.path)
+        finally:
+            tmp.unlink(missing_ok=True)
+    p.done(f"exported {count} entries ({fmt})")
+    return EXIT_OK
+
+
+def cmd_backfill(args) -> int:
+    every = not (args.rotation or args.envelopes or args.analysis or args.terms or args.hashes)
+    if (every or args.rotation) and rotation.status() is not None:
+        p = _Progress("re-encrypted", args.quiet)
+        n = rotation.run(args.batch or db.ROTATION_BATCH, p)
+        p.done(f"passphrase change finished ({n} rows re-encrypted)")
+    if every or args.envelopes:
+        n = db.migrate_envelopes(args.batch or db.ENVELOPE_BATCH, compact=args.compact)
+        _Progress("", args.quiet).done(f"envelopes: {n} rows migrated")
+    if every or args.analysis:
+        p = _Progress("analyzed", args.quiet)
+        n = analysis.backfill(args.batch or analysis.BACKFILL_BATCH, progress=p)
+        p.done(f"analysis: {n} entries re-scored (analyzer {sentiment.ANALYZER_VERSION})")
+    if every or args.terms:
+        n = related.backfill()
+        _Progress("", args.quiet).done(f"related index: {n} entries indexed")
+    if every or args.hashes:
+        p = _Progress("hashed", args.quiet)
+        n = db.backfill_content_hashes(args.batch or 500, progress=p)
+        p.done(f"content hashes: {n} entries hashed")
+    return EXIT_OK
+
+
+def cmd_verify(args) -> int:
+    if args.archive:
+        with open(args.archive, "rb") as f:
+            n = archive.verify_archive(f, _archive_passphrase(args))
+        print(f"archive ok: {n} entries")
+        return EXIT_OK
+    problems = 0
+    integrity = db.integrity_check()
+    print(f"integrity: {integrity}")
+    problems += integrity != "ok"
+    p = _Progress("decrypted", args.quiet)
+    failed = db.find_undecryptable(progress=p)
+    p.done(f"decryption: {len(failed)} rows failed")
+    for table, rid in failed:
+        print(f"  undecryptable: {table} {rid}")
+    problems += len(failed)
+    print(f"entries: {db.count_entries()}")
+    print(f"stale analysis: {db.count_stale_analysis(sentiment.ANALYZER_VERSION)}")
+    print(f"legacy envelopes: {db.pending_envelope_rows()}")
+    print(f"entries without content hash: {db.count_unhashed_entries()}")
+    rot = rotation.status()
+    print("passphrase change: " + (f"in progress ({rot['done']}/{rot['total']})" if rot else "none"))
+    return EXIT_VERIFY if problems else EXIT_OK
+
+
+def cmd_maintain(args) -> int:
+    p = _Progress("archived", args.quiet)
+    result = tiering.maintain(args.days, progress=p)
+    p.done(f"archived {result['archived']} entries, reclaimed {result['reclaimedPages']} free pages")
+    status = tiering.status()
+    print(f"hot: {status['hot']} entries, {status['hotBytes']} bytes; "
+          f"archive: {status['archived']} entries, {status['archiveBytes']} bytes")
+    return EXIT_OK
+
+
+def cmd_llm_usage(args) -> int:
+    report = metering.usage_report(args.days, llm.get_prices(), llm.get_budgets())
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return EXIT_OK
+
+    def ms(v):
+        return "-" if v is None else f"{v / 1000:.1f}s"
+    print(f"{'day':<10} {'calls':>5} {'failed':>6} {'prompt':>9} {'completion':>10} {'cost $':>9} {'p50':>7} {'p95':>7}")
+    for d in report["days"]:
+        cost = "-" if d["costUsd"] is None else f"{d['costUsd']:.4f}"
+        mark = "~" if d["approx"] else ""
+        print(f"{d['day']:<10} {d['calls']:>5} {d['failures']:>6} {d['promptTokens']:>9} {d['completionTokens']:>10} "
+              f"{cost:>9} {mark + ms(d['p50Ms']):>7} {mark + ms(d['p95Ms']):>7}")
+    t, r, b = report["totals"], report["recent"], report["budgets"]
+    print(f"total: {t['calls']} calls, {t['failures']} failed, {t['promptTokens'] + t['completionTokens']} tokens"
+          + ("" if t["costUsd"] is None else f", ${t['costUsd']:.4f}"))
+    print(f"last {r['calls']} calls: p50 {ms(r['p50Ms'])}, p95 {ms(r['p95Ms'])}")
+    print(f"today: {report['todayTokens']} tokens; budgets: daily tokens {b['dailyTokens'] or 'unlimited'}, "
+          f"p95 {ms(b['p95Ms']) if b['p95Ms'] else 'unlimited'}")
+    return EXIT_OK
+
+
+def cmd_wipe(args) -> int:
+    if not args.yes:
+        raise ValueError("Refusing to delete everything without --yes.")
+    db.clear_all_entries()
+    llm.clear_all_llm_keys()
+    llm.clear_stored_reflections()
+    auth.reset_vault()
+    print("All entries, AI keys, reflections and the passphrase were deleted.")
+    return EXIT_OK
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Dear Diary bulk operations")
+    parser.add_argument("--passphrase-fd", type=int, help="read the passphrase from this file descriptor (default: stdin)")
+    parser.add_argument("--archive-passphrase-fd", type=int,
+                        help="read the archive passphrase from this descriptor (default: the journal passphrase)")
+    parser.add_argument("--db", type=Path, help=f"journal database (default: {db.DB_PATH.name} next to the app)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="no progress output on stderr")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("import", help="import a JSON export or encrypted archive; same-day content is merged")
+    p.add_argument("path")
+    p.set_defaults(fn=cmd_import)
+
+    p = sub.add_parser("export", help="export every entry; PATH may be - for stdout")
+    p.add_argument("path")
+    p.add_argument("--format", choices=("json", "archive"), help=f"default: archive for *{archive.EXTENSION}, else json")
+    p.set_defaults(fn=cmd_export)
+
+    p = sub.add_parser("backfill", help="finish a passphrase change, migrate envelopes, re-score analysis, "
+                                        "index terms, hash content for import dedupe (all unless flags are given)")
+    p.add_argument("--rotation", action="store_true")
+    p.add_argument("--envelopes", action="store_true")
+    p.add_argument("--analysis", action="store_true")
+    p.add_argument("--terms", action="store_true")
+    p.add_argument("--hashes", action="store_true")
+    p.add_argument("--batch", type=int, help="rows per transaction")
+    p.add_argument("--compact", action="store_true", help="VACUUM after migrating envelopes")
+    p.set_defaults(fn=cmd_backfill)
+
+    p = sub.add_parser("verify", help="check database integrity and that every encrypted row decrypts")
+    p.add_argument("--archive", help="verify this encrypted archive instead")
+    p.set_defaults(fn=cmd_verify)
+
+    p = sub.add_parser("maintain", help="move old entries to the archive tier and return free pages")
+    p.add_argument("--days", type=int, default=tiering.ARCHIVE_AFTER_DAYS, help="archive entries older than this")
+    p.set_defaults(fn=cmd_maintain)
+
+    p = sub.add_parser("llm-usage", help="AI calls per day: tokens, cost, latency percentiles (~ marks bucket bounds)")
+    p.add_argument("--days", type=int, default=30)
+    p.add_argument("--json", action="store_true", help="print the full report as JSON")
+    p.set_defaults(fn=cmd_llm_usage)
+
+    p = sub.add_parser("wipe", help="delete all entries, AI keys and the passphrase")
+    p.add_argument("--yes", action="store_true")
+    p.set_defaults(fn=cmd_wipe)
+
+    p = sub.add_parser("benchmark", help="run the data-path benchmarks (arguments go to benchmarks.run)")
+    p.add_argument("rest", nargs=argparse.REMAINDER)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = _parser().parse_args(argv)
+    if args.command == "benchmark":
+        from benchmarks import run as bench
+        return bench.main(args.rest)
+    if args.db:
+        db.DB_PATH = args.db
+    try:
+        db.init_db()
+        args.passphrase = _unlock(args)
+        return args.fn(args)
+    except AuthError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_AUTH
+    except (ValueError, sqlite3.Error, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    except KeyboardInterrupt:
+        print("\ninterrupted; completed batches are kept and the next run resumes", file=sys.stderr)
+        return 130
+    finally:
+        crypto.clear_key()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
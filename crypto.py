@@ -1,17 +1,43 @@
 # AES-GCM encryption, PBKDF2 key derivation for vault.
 import base64
+import hashlib
+import hmac
 import os
+import zlib
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.backends import default_backend
+
+import perf
+
+try:
+    import zstandard
+except ImportError:  # optional; zlib is always available
+    zstandard = None
 
 PBKDF2_ITERATIONS = 250_000
 SALT_LENGTH = 16
 IV_LENGTH = 12
 KEY_LENGTH = 32
 
+# Content envelope (inside the ciphertext): NUL, format byte, payload. Legacy rows are bare UTF-8 text,
+# which never starts with NUL, so both decrypt through decrypt_content.
+ENVELOPE_MARK = 0
+FORMAT_RAW = 1
+FORMAT_ZLIB = 2
+FORMAT_ZSTD = 3
+COMPRESS_MIN_BYTES = 128
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
 _in_memory_key: bytes | None = None
+_previous_key: bytes | None = None  # still accepted for decryption while a passphrase change is in progress
+_clear_listeners = []
+_subkeys = {}  # (key, purpose) -> HKDF subkey; dropped on lock
 
 
 def set_key(key: bytes) -> None:
@@ -23,9 +49,28 @@ def get_key() -> bytes | None:
     return _in_memory_key
 
 
+def set_previous_key(key: bytes | None) -> None:
+    global _previous_key
+    _previous_key = key
+
+
+def get_previous_key() -> bytes | None:
+    return _previous_key
+
+
 def clear_key() -> None:
-    global _in_memory_key
+    global _in_memory_key, _previous_key
     _in_memory_key = None
+    _previous_key = None
+    _subkeys.clear()
+    for fn in tuple(_clear_listeners):  # a listener may remove itself
+        fn()
+
+
+# Caches holding decrypted data register here so locking drops them.
+def add_clear_listener(fn) -> None:
+    if fn not in _clear_listeners:
+        _clear_listeners.append(fn)
 
 
 def is_unlocked() -> bool:
@@ -40,34 +85,123 @@ def generate_iv():
     return os.urandom(IV_LENGTH)
 
 
-def derive_key(passphrase: str, salt: bytes) -> bytes:
+@perf.timed("crypto.derive_key")
+def derive_key(passphrase: str, salt: bytes, iterations: int = PBKDF2_ITERATIONS) -> bytes:
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=KEY_LENGTH,
         salt=salt,
-        iterations=PBKDF2_ITERATIONS,
+        iterations=iterations,
         backend=default_backend(),
     )
     return kdf.derive(passphrase.encode("utf-8"))
 
 
-def encrypt(plaintext: str, key: bytes) -> tuple[str, str]:
+# Independent key for a non-encryption purpose (e.g. keyed hashes), so the vault key is never reused directly.
+def derive_subkey(key: bytes, purpose: str) -> bytes:
+    sub = _subkeys.get((key, purpose))
+    if sub is None:
+        hkdf = HKDF(algorithm=hashes.SHA256(), length=KEY_LENGTH, salt=None,
+                    info=f"dear-diary/{purpose}".encode(), backend=default_backend())
+        sub = _subkeys[(key, purpose)] = hkdf.derive(key)
+    return sub
+
+
+# Keyed hash of text: compares content without storing a guessable plain hash next to the ciphertext.
+def content_mac(text: str, key: bytes, purpose: str = "content-mac") -> bytes:
+    return hmac.new(derive_subkey(key, purpose), text.encode("utf-8"), hashlib.sha256).digest()
+
+
+# Ciphertext and IVs are raw bytes (BLOB columns); base64 only where they cross into JSON (see to_b64).
+@perf.timed("crypto.encrypt")
+def encrypt_bytes(data: bytes, key: bytes) -> tuple[bytes, bytes]:
     iv = generate_iv()
     aesgcm = AESGCM(key)
-    ct = aesgcm.encrypt(iv, plaintext.encode("utf-8"), None)
-    return base64.b64encode(ct).decode("ascii"), base64.b64encode(iv).decode("ascii")
+    return aesgcm.encrypt(iv, data, None), iv
 
 
-def decrypt(ciphertext_b64: str, iv_b64: str, key: bytes) -> str:
-    ct = base64.b64decode(ciphertext_b64)
-    iv = base64.b64decode(iv_b64)
+# Data not yet re-encrypted by a passphrase change fails the tag check under the current key and is
+# retried with the previous one.
+@perf.timed("crypto.decrypt")
+def decrypt_bytes(ciphertext: bytes, iv: bytes, key: bytes) -> bytes:
     aesgcm = AESGCM(key)
-    return aesgcm.decrypt(iv, ct, None).decode("utf-8")
+    try:
+        return aesgcm.decrypt(iv, ciphertext, None)
+    except InvalidTag:
+        previous = _previous_key
+        if previous is None or key is not _in_memory_key:
+            raise
+        return AESGCM(previous).decrypt(iv, ciphertext, None)
+
+
+# AES-GCM with a caller-chosen nonce and associated data, for framed streams (archive.py). The caller
+# guarantees a nonce is never reused under one key.
+def seal(data: bytes, key: bytes, nonce: bytes, aad: bytes) -> bytes:
+    return AESGCM(key).encrypt(nonce, data, aad)
+
+
+def open_sealed(ciphertext: bytes, key: bytes, nonce: bytes, aad: bytes) -> bytes:
+    return AESGCM(key).decrypt(nonce, ciphertext, aad)
+
+
+# Same plaintext bytes (envelope included) under new_key; None when it is already under new_key.
+def reencrypt(ciphertext: bytes, iv: bytes, old_key: bytes, new_key: bytes) -> tuple[bytes, bytes] | None:
+    try:
+        data = AESGCM(old_key).decrypt(iv, ciphertext, None)
+    except InvalidTag:
+        AESGCM(new_key).decrypt(iv, ciphertext, None)  # raises if neither key opens it
+        return None
+    return encrypt_bytes(data, new_key)
+
+
+def encrypt(plaintext: str, key: bytes) -> tuple[bytes, bytes]:
+    return encrypt_bytes(plaintext.encode("utf-8"), key)
+
+
+def decrypt(ciphertext: bytes, iv: bytes, key: bytes) -> str:
+    return decrypt_bytes(ciphertext, iv, key).decode("utf-8")
+
+
+# Compress with zstd when installed, else zlib; keep the raw bytes unless compression saves space.
+def pack_content(text: str) -> bytes:
+    data = text.encode("utf-8")
+    fmt, payload = FORMAT_RAW, data
+    if len(data) >= COMPRESS_MIN_BYTES:
+        if zstandard is not None:
+            packed, packed_fmt = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data), FORMAT_ZSTD
+        else:
+            packed, packed_fmt = zlib.compress(data, ZLIB_LEVEL), FORMAT_ZLIB
+        if len(packed) < len(data):
+            fmt, payload = packed_fmt, packed
+    return bytes((ENVELOPE_MARK, fmt)) + payload
+
+
+def unpack_content(data: bytes) -> str:
+    if not data or data[0] != ENVELOPE_MARK:
+        return data.decode("utf-8")
+    fmt, payload = data[1], data[2:]
+    if fmt == FORMAT_RAW:
+        return payload.decode("utf-8")
+    if fmt == FORMAT_ZLIB:
+        return zlib.decompress(payload).decode("utf-8")
+    if fmt == FORMAT_ZSTD:
+        if zstandard is None:
+            raise ValueError("This entry is zstd-compressed; install the zstandard package to read it.")
+        return zstandard.ZstdDecompressor().decompress(payload).decode("utf-8")
+    raise ValueError(f"Unknown content format {fmt}.")
+
+
+def encrypt_content(text: str, key: bytes) -> tuple[bytes, bytes]:
+    return encrypt_bytes(pack_content(text), key)
+
+
+def decrypt_content(ciphertext: bytes, iv: bytes, key: bytes) -> str:
+    return unpack_content(decrypt_bytes(ciphertext, iv, key))
 
 
-def salt_to_b64(salt: bytes) -> str:
-    return base64.b64encode(salt).decode("ascii")
+def to_b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
 
 
-def b64_to_salt(b64: str) -> bytes:
+def from_b64(b64: str) -> bytes:
     return base64.b64decode(b64)
@@ -2,22 +2,61 @@
 import json
 import os
 import sqlite3
+import threading
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 
+from cryptography.exceptions import InvalidTag
+
 import crypto
+import perf
+import revisions
 
 DB_DIR = Path(__file__).resolve().parent
 DB_PATH = DB_DIR / "journal.db"
 MS_DAY_MS = 24 * 60 * 60 * 1000
 ENTRY_ID_PREFIX = "entry_"
 ENTRIES_COLS = "id, created_at, encrypted_content, iv, sentiment_score, sentiment_label, themes"
+META_COLS = "created_at, sentiment_score, sentiment_label, themes"
+ROLLUP_PERIODS = ("day", "week", "month")
+SENTIMENT_LABELS = ("positive", "neutral", "negative")
+ENVELOPE_VERSION = 1  # rows below this still hold bare UTF-8 ciphertext (see crypto.pack_content)
+ENVELOPE_TABLES = (("entries", "encrypted_content"), ("entry_terms", "encrypted_terms"))
+ENVELOPE_BATCH = 200
+# Every table holding ciphertext (column name; the IV is in "iv"), in the order a passphrase change walks them.
+# The archive tier goes last: rows archived mid-change land behind its cursor and are still re-encrypted.
+ENCRYPTED_TABLES = (("entries", "encrypted_content"), ("entry_terms", "encrypted_terms"),
+                    ("entry_paragraphs", "encrypted_data"), ("drafts", "encrypted_content"),
+                    ("entry_revisions", "encrypted_data"), ("llm_calls", "encrypted_data"), ("llm_daily", "encrypted_data"),
+                    ("secrets", "encrypted_data"), ("archive.entries", "encrypted_content"))
+ROTATION_BATCH = 200
+CONNECTION_FACTORY = sqlite3.Connection  # benchmarks/loadtest.py swaps in one that times lock waits
+# Columns added after a table first shipped; init_db adds any that are missing.
+_ADDED_COLUMNS = (
+    ("entries", "envelope", "INTEGER NOT NULL DEFAULT 0"),
+    ("entry_terms", "envelope", "INTEGER NOT NULL DEFAULT 0"),
+    ("entries", "analyzer_version", "TEXT"),  # sentiment.ANALYZER_VERSION the metadata was computed with
+)
+
+
+# Cold tier (tiering.py): old entries live in a second file attached to every connection as "archive".
+# Unqualified "entries" is the hot table; reads that must see both use ALL_ENTRIES. The archive stays in
+# rollback-journal mode, which keeps ATTACH cheap (no WAL index to map) on a file that is rarely written.
+TIER_COLS = "id, created_at, encrypted_content, iv, sentiment_score, sentiment_label, themes, envelope, analyzer_version"
+# An entry briefly exists in both tiers while it moves (two commits, see _move_entries); the hot copy wins.
+ALL_ENTRIES = (f"(SELECT {TIER_COLS} FROM main.entries UNION ALL "
+               f"SELECT {TIER_COLS} FROM archive.entries WHERE id NOT IN (SELECT id FROM main.entries))")
+
+
+def archive_path() -> Path:
+    return DB_PATH.with_name(f"{DB_PATH.stem}-archive{DB_PATH.suffix}")
 
 
 def get_conn():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, factory=CONNECTION_FACTORY)
     conn.row_factory = sqlite3.Row
+    conn.execute("ATTACH DATABASE ? AS archive", (str(archive_path()),))
     return conn
 
 
@@ -29,23 +68,131 @@ def _with_conn(f):
         conn.close()
 
 
+# Tables holding ciphertext, salts and IVs as BLOBs; templates take the table name so migrations can rebuild them.
+_BLOB_SCHEMAS = {
+    "entries": """CREATE TABLE IF NOT EXISTS {name} (
+        id TEXT PRIMARY KEY,
+        created_at INTEGER NOT NULL,
+        encrypted_content BLOB NOT NULL,
+        iv BLOB NOT NULL,
+        sentiment_score REAL,
+        sentiment_label TEXT,
+        themes TEXT,
+        envelope INTEGER NOT NULL DEFAULT 0,
+        analyzer_version TEXT
+    )""",
+    "vault": """CREATE TABLE IF NOT EXISTS {name} (
+        id TEXT PRIMARY KEY, salt BLOB NOT NULL, test_cipher BLOB NOT NULL, test_iv BLOB NOT NULL
+    )""",
+    "entry_terms": """CREATE TABLE IF NOT EXISTS {name} (
+        id TEXT PRIMARY KEY,
+        encrypted_terms BLOB NOT NULL,
+        iv BLOB NOT NULL,
+        envelope INTEGER NOT NULL DEFAULT 0
+    )""",
+    "entry_paragraphs": """CREATE TABLE IF NOT EXISTS {name} (
+        id TEXT PRIMARY KEY,
+        encrypted_data BLOB NOT NULL,
+        iv BLOB NOT NULL
+    )""",
+    "key_rotation": """CREATE TABLE IF NOT EXISTS {name} (
+        id TEXT PRIMARY KEY,
+        old_salt BLOB NOT NULL,
+        old_test_cipher BLOB NOT NULL,
+        old_test_iv BLOB NOT NULL,
+        wrapped_old BLOB NOT NULL,
+        wrapped_old_iv BLOB NOT NULL,
+        wrapped_new BLOB NOT NULL,
+        wrapped_new_iv BLOB NOT NULL,
+        table_name TEXT NOT NULL,
+        last_rowid INTEGER NOT NULL DEFAULT 0,
+        done_rows INTEGER NOT NULL DEFAULT 0,
+        total_rows INTEGER NOT NULL DEFAULT 0,
+        started_at INTEGER NOT NULL
+    )""",
+    "drafts": """CREATE TABLE IF NOT EXISTS {name} (
+        id TEXT PRIMARY KEY,
+        encrypted_content BLOB NOT NULL,
+        iv BLOB NOT NULL,
+        content_mac BLOB NOT NULL,
+        updated_at INTEGER NOT NULL
+    )""",
+    # Past versions of entries: rev counts up per entry; snapshot rows hold the text, others a delta
+    # (revisions.py) from the next newer version. chars is the version's length, for listing without decrypting.
+    "entry_revisions": """CREATE TABLE IF NOT EXISTS {name} (
+        id TEXT NOT NULL,
+        rev INTEGER NOT NULL,
+        saved_at INTEGER NOT NULL,
+        snapshot INTEGER NOT NULL,
+        chars INTEGER NOT NULL,
+        encrypted_data BLOB NOT NULL,
+        iv BLOB NOT NULL,
+        PRIMARY KEY (id, rev)
+    )""",
+    # LLM call metering (metering.py): one row per call, kept for metering.RETAIN_DAYS, and one per-day
+    # aggregate (id is the day start) kept for good. Only the day is stored in the clear.
+    "llm_calls": """CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY,
+        day_start INTEGER NOT NULL,
+        encrypted_data BLOB NOT NULL,
+        iv BLOB NOT NULL
+    )""",
+    "llm_daily": """CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY,
+        encrypted_data BLOB NOT NULL,
+        iv BLOB NOT NULL
+    )""",
+    # Random keys wrapped by the vault key (a passphrase change re-encrypts them like any row): "content-hash".
+    "secrets": """CREATE TABLE IF NOT EXISTS {name} (
+        id TEXT PRIMARY KEY,
+        encrypted_data BLOB NOT NULL,
+        iv BLOB NOT NULL
+    )""",
+}
+# Tables that predate BLOB storage; ones added since are created with BLOB columns and need no migration.
+_BLOB_COLUMNS = {"entries": ("encrypted_content", "iv"), "vault": ("salt", "test_cipher", "test_iv"),
+                 "entry_terms": ("encrypted_terms", "iv")}
+BLOB_BATCH = 500
+
+
+@perf.timed("db.init_db")
 def init_db():
     def run(c):
+        _enable_incremental_vacuum(c)
+        # WAL lets readers (including online backups) proceed while a writer commits.
+        c.execute("PRAGMA main.journal_mode=WAL")
+        for name, schema in _BLOB_SCHEMAS.items():
+            c.execute(schema.format(name=name))
+        c.execute(_BLOB_SCHEMAS["entries"].format(name="archive.entries"))
+        c.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_created_at ON entries(created_at)")
         c.executescript("""
-            CREATE TABLE IF NOT EXISTS entries (
-                id TEXT PRIMARY KEY,
-                created_at INTEGER NOT NULL,
-                encrypted_content TEXT NOT NULL,
-                iv TEXT NOT NULL,
-                sentiment_score REAL,
-                sentiment_label TEXT,
-                themes TEXT
-            );
-            CREATE INDEX IF NOT EXISTS idx_entries_created_at ON entries(created_at);
-            CREATE INDEX IF NOT EXISTS idx_entries_sentiment ON entries(sentiment_score);
-            CREATE TABLE IF NOT EXISTS vault (
-                id TEXT PRIMARY KEY, salt TEXT NOT NULL, test_cipher TEXT NOT NULL, test_iv TEXT NOT NULL
-            );
+            CREATE TABLE IF NOT EXISTS sentiment_rollups (
+                period TEXT NOT NULL,
+                bucket_start INTEGER NOT NULL,
+                entry_count INTEGER NOT NULL DEFAULT 0,
+                scored_count INTEGER NOT NULL DEFAULT 0,
+                score_sum REAL NOT NULL DEFAULT 0,
+                positive INTEGER NOT NULL DEFAULT 0,
+                neutral INTEGER NOT NULL DEFAULT 0,
+                negative INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (period, bucket_start)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS theme_rollups (
+                day_start INTEGER NOT NULL,
+                theme TEXT NOT NULL,
+                entry_count INTEGER NOT NULL DEFAULT 0,
+                positive_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day_start, theme)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS content_hashes (
+                mac BLOB NOT NULL,
+                id TEXT NOT NULL,
+                kind INTEGER NOT NULL,
+                PRIMARY KEY (mac, id, kind)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_content_hashes_id ON content_hashes(id);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO meta (key, value) VALUES ('revision', 0);
         """)
         c.commit()
         # Migration: drop plain-text content column if present (all data must be encrypted)
@@ -57,14 +204,97 @@ def init_db():
                 c.commit()
         except sqlite3.OperationalError:
             pass
+        # Migration: add newer columns (envelope tracking, analyzer version) to older journals
+        for table, col, decl in _ADDED_COLUMNS:
+            schema, _, name = table.rpartition(".")
+            cols = [row[1] for row in c.execute(f"PRAGMA {schema or 'main'}.table_info({name})").fetchall()]
+            if col not in cols:
+                c.execute(f"ALTER TABLE {table} ADD COLUMN {col} {decl}")
+                c.commit()
+        _migrate_blobs(c)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_entries_created_at ON entries(created_at)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_entries_sentiment ON entries(sentiment_score)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_day ON llm_calls(day_start)")
+        c.commit()
+        # Finish moves interrupted between their two commits: the hot copy is the current one.
+        c.execute("DELETE FROM archive.entries WHERE id IN (SELECT id FROM main.entries)")
+        c.commit()
+        # Backfill rollups for journals written before they existed (metadata only, no decryption)
+        if (c.execute("SELECT 1 FROM sentiment_rollups LIMIT 1").fetchone() is None
+                and c.execute(f"SELECT 1 FROM {ALL_ENTRIES} LIMIT 1").fetchone() is not None):
+            _rebuild_rollups(c)
+            c.commit()
     _with_conn(run)
 
 
+# auto_vacuum only changes on an empty file or through a full VACUUM; existing journals pay that once here.
+# Afterwards freed pages are returned in small steps by reclaim_free_pages.
+def _enable_incremental_vacuum(c):
+    for schema in ("main", "archive"):
+        if c.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0] == 2:
+            continue
+        c.execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL")
+        if c.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0] != 2:
+            c.commit()
+            c.execute(f"VACUUM {schema}")
+
+
+def _b64_to_blob(value):
+    return crypto.from_b64(value) if isinstance(value, str) else value
+
+
+# Migration: base64 TEXT -> BLOB. Rows convert in place in short batches (a restart resumes, converted rows
+# are skipped), then the table is rebuilt once in a single transaction so its declared types read BLOB.
+def _migrate_blobs(c):
+    for table, cols in _BLOB_COLUMNS.items():
+        types = {row[1]: row[2] for row in c.execute(f"PRAGMA table_info({table})").fetchall()}
+        if not types or types.get(cols[0]) == "BLOB":
+            continue
+        is_text = " OR ".join(f"typeof({col}) = 'text'" for col in cols)
+        sets = ", ".join(f"{col} = ?" for col in cols)
+        after = 0
+        while True:
+            rows = c.execute(
+                f"SELECT rowid, {', '.join(cols)} FROM {table} WHERE rowid > ? AND ({is_text}) ORDER BY rowid LIMIT ?",
+                (after, BLOB_BATCH),
+            ).fetchall()
+            if not rows:
+                break
+            c.executemany(f"UPDATE {table} SET {sets} WHERE rowid = ?",
+                          [(*(_b64_to_blob(r[col]) for col in cols), r["rowid"]) for r in rows])
+            c.commit()
+            after = rows[-1]["rowid"]
+        tmp = f"{table}_blob"
+        c.execute("BEGIN IMMEDIATE")
+        c.execute(f"DROP TABLE IF EXISTS {tmp}")
+        c.execute(_BLOB_SCHEMAS[table].format(name=tmp))
+        shared = ", ".join(row[1] for row in c.execute(f"PRAGMA table_info({tmp})").fetchall() if row[1] in types)
+        c.execute(f"INSERT INTO {tmp} ({shared}) SELECT {shared} FROM {table}")
+        c.execute(f"DROP TABLE {table}")
+        c.execute(f"ALTER TABLE {tmp} RENAME TO {table}")
+        c.commit()
+
+
 def get_day_start_ms(ts_ms: int) -> int:
     dt = datetime.fromtimestamp(ts_ms / 1000.0)
     return int(dt.replace(hour=0, minute=0, second=0, microsecond=0).timestamp() * 1000)
 
 
+# Weeks start on Monday; computed on local dates so DST shifts don't skew buckets.
+def get_week_start_ms(ts_ms: int) -> int:
+    dt = datetime.fromtimestamp(ts_ms / 1000.0).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int((dt - timedelta(days=dt.weekday())).timestamp() * 1000)
+
+
+def get_month_start_ms(ts_ms: int) -> int:
+    dt = datetime.fromtimestamp(ts_ms / 1000.0)
+    return int(dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0).timestamp() * 1000)
+
+
+_BUCKET_FNS = {"day": get_day_start_ms, "week": get_week_start_ms, "month": get_month_start_ms}
+
+
+@perf.timed("db.get_vault")
 def get_vault():
     def run(c):
         row = c.execute("SELECT id, salt, test_cipher, test_iv FROM vault WHERE id = 'vault'").fetchone()
@@ -79,6 +309,7 @@ def get_vault():
     return _with_conn(run)
 
 
+@perf.timed("db.set_vault", rows=lambda _: 1)
 def set_vault(row):
     def run(c):
         c.execute("INSERT OR REPLACE INTO vault (id, salt, test_cipher, test_iv) VALUES (?, ?, ?, ?)",
@@ -105,7 +336,7 @@ def _stored_to_entry(row) -> dict:
         raise ValueError("Unlock required to read entries.")
     if not (r.get("encrypted_content") and r.get("iv")):
         raise ValueError("Entry is missing encrypted data.")
-    content = crypto.decrypt(r["encrypted_content"], r["iv"], key)
+    content = crypto.decrypt_content(r["encrypted_content"], r["iv"], key)
     return {
         "id": r["id"],
         "content": content,
@@ -117,11 +348,11 @@ def _stored_to_entry(row) -> dict:
     }
 
 
-def _encrypt_content(content: str) -> tuple[str, str]:
+def _encrypt_content(content: str) -> tuple[bytes, bytes]:
     key = crypto.get_key()
     if not key:
         raise ValueError("Unlock required to save entries.")
-    return crypto.encrypt(content.strip(), key)
+    return crypto.encrypt_content(content.strip(), key)
 
 
 # Unique entry id; random suffix avoids collisions on import.
@@ -129,45 +360,246 @@ def _eid():
     return f"{ENTRY_ID_PREFIX}{int(time.time() * 1000)}_{os.urandom(4).hex()}"
 
 
-def _save_new(conn, eid, created, enc, iv, score, label, themes_json):
+# --- Data revision: bumped inside every entry write so caches in any session or process can check it ---
+
+def _bump_revision(conn) -> int:
+    conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'revision'")
+    return conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+
+
+def get_revision() -> int:
+    def run(c):
+        row = c.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()
+        return row[0] if row else 0
+    return _with_conn(run)
+
+
+# Values computed from entries, dropped as soon as the revision moves (writes from any session or process).
+class RevisionCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rev = None
+        self._data = {}
+
+    def get(self, key, compute, rev: int | None = None):
+        rev = get_revision() if rev is None else rev
+        with self._lock:
+            if rev != self._rev:
+                self._data.clear()
+                self._rev = rev
+            if key in self._data:
+                return self._data[key]
+        value = compute()
+        with self._lock:
+            if self._rev == rev:
+                self._data[key] = value
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._rev = None
+
+
+_entry_cache = RevisionCache()
+crypto.add_clear_listener(_entry_cache.clear)
+
+
+# --- Sentiment rollups: kept in step with entries inside the same transaction ---
+
+def _rollup_apply(conn, created, score, label, themes, sign):
+    scored = 1 if score is not None else 0
+    hist = [1 if label == lbl else 0 for lbl in SENTIMENT_LABELS]
+    for period in ROLLUP_PERIODS:
+        conn.execute(
+            """INSERT INTO sentiment_rollups (period, bucket_start, entry_count, scored_count, score_sum, positive, neutral, negative)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(period, bucket_start) DO UPDATE SET
+                 entry_count = entry_count + excluded.entry_count,
+                 scored_count = scored_count + excluded.scored_count,
+                 score_sum = score_sum + excluded.score_sum,
+                 positive = positive + excluded.positive,
+                 neutral = neutral + excluded.neutral,
+                 negative = negative + excluded.negative""",
+            (period, _BUCKET_FNS[period](created), sign, sign * scored, sign * (score or 0.0), *(sign * h for h in hist)),
+        )
+    day = get_day_start_ms(created)
+    positive = 1 if label == "positive" else 0
+    for theme in {t.lower() for t in (themes or [])}:
+        conn.execute(
+            """INSERT INTO theme_rollups (day_start, theme, entry_count, positive_count) VALUES (?, ?, ?, ?)
+               ON CONFLICT(day_start, theme) DO UPDATE SET
+                 entry_count = entry_count + excluded.entry_count,
+                 positive_count = positive_count + excluded.positive_count""",
+            (day, theme, sign, sign * positive),
+        )
+    if sign < 0:
+        conn.execute("DELETE FROM sentiment_rollups WHERE entry_count <= 0")
+        conn.execute("DELETE FROM theme_rollups WHERE day_start = ? AND entry_count <= 0", (day,))
+
+
+def _rollup_row(conn, row, sign):
+    themes = json.loads(row["themes"]) if row["themes"] else []
+    _rollup_apply(conn, row["created_at"], row["sentiment_score"], row["sentiment_label"], themes, sign)
+
+
+def _rebuild_rollups(conn):
+    conn.execute("DELETE FROM sentiment_rollups")
+    conn.execute("DELETE FROM theme_rollups")
+    for row in conn.execute(f"SELECT {META_COLS} FROM {ALL_ENTRIES}").fetchall():
+        _rollup_row(conn, row, 1)
+
+
+def rebuild_sentiment_rollups() -> None:
+    def run(c):
+        _rebuild_rollups(c)
+        c.commit()
+    _with_conn(run)
+
+
+def _save_new(conn, eid, created, enc, iv, score, label, themes_json, version=None, mac=None):
     conn.execute(
-        "INSERT INTO entries (id, created_at, encrypted_content, iv, sentiment_score, sentiment_label, themes) VALUES (?, ?, ?, ?, ?, ?, ?)",
-        (eid, created, enc, iv, score, label, themes_json),
+        "INSERT INTO entries (id, created_at, encrypted_content, iv, sentiment_score, sentiment_label, themes, envelope, analyzer_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (eid, created, enc, iv, score, label, themes_json, ENVELOPE_VERSION, version),
     )
+    if mac is not None:
+        conn.execute("INSERT OR IGNORE INTO content_hashes (mac, id, kind) VALUES (?, ?, ?)", (mac, eid, HASH_ENTRY))
+    _rollup_apply(conn, created, score, label, json.loads(themes_json), 1)
+    rev = _bump_revision(conn)
     conn.commit()
+    return rev
 
 
+# --- Write listeners: in-process caches subscribe to entry changes after commit ---
+
+_write_listeners = []
+
+
+def add_write_listener(fn) -> None:
+    if fn not in _write_listeners:
+        _write_listeners.append(fn)
+
+
+def remove_write_listener(fn) -> None:
+    if fn in _write_listeners:
+        _write_listeners.remove(fn)
+
+
+# op is "upsert", "delete" or "clear"; upserts carry metadata and, when known, the new plaintext.
+# revision is the data revision the write committed (shared by every event of a bulk write).
+def _notify(op: str, rev: int, eid: str | None = None, meta: dict | None = None, content: str | None = None) -> None:
+    if not _write_listeners:
+        return
+    event = {"op": op, "revision": rev, "id": eid, **(meta or {})}
+    if content is not None:
+        event["content"] = content
+    for fn in tuple(_write_listeners):  # a listener may remove itself
+        fn(event)
+
+
+def _meta_dict(row) -> dict:
+    return {
+        "createdAt": row["created_at"],
+        "sentimentScore": row["sentiment_score"],
+        "sentimentLabel": row["sentiment_label"],
+        "themes": json.loads(row["themes"]) if row["themes"] else [],
+    }
+
+
+@perf.timed("db.create_entry", rows=lambda _: 1)
 def create_entry(content: str, meta: dict | None = None) -> dict:
     meta = meta or {}
     enc, iv = _encrypt_content(content.strip())
     eid, created = _eid(), int(time.time() * 1000)
     themes_json = json.dumps(meta.get("themes") or [])
+    mac = content_hash(created, content)
 
     def run(c):
-        _save_new(c, eid, created, enc, iv, meta.get("sentimentScore"), meta.get("sentimentLabel"), themes_json)
-    _with_conn(run)
+        return _save_new(c, eid, created, enc, iv, meta.get("sentimentScore"), meta.get("sentimentLabel"), themes_json,
+                         meta.get("analyzerVersion"), mac)
+    rev = _with_conn(run)
+    _notify("upsert", rev, eid, {"createdAt": created, "sentimentScore": meta.get("sentimentScore"),
+                            "sentimentLabel": meta.get("sentimentLabel"), "themes": meta.get("themes") or []}, content.strip())
     return {"id": eid, "content": content.strip(), "createdAt": created, **meta}
 
 
+@perf.timed("db.insert_entry", rows=lambda _: 1)
 def insert_entry(entry: dict) -> dict:
     enc, iv = _encrypt_content(entry["content"].strip())
     eid = _eid()
     created = entry.get("createdAt", int(time.time() * 1000))
     themes_json = json.dumps(entry.get("themes") or [])
+    mac = content_hash(created, entry["content"])
 
     def run(c):
-        _save_new(c, eid, created, enc, iv, entry.get("sentimentScore"), entry.get("sentimentLabel"), themes_json)
-    _with_conn(run)
+        return _save_new(c, eid, created, enc, iv, entry.get("sentimentScore"), entry.get("sentimentLabel"), themes_json,
+                         entry.get("analyzerVersion"), mac)
+    rev = _with_conn(run)
+    _notify("upsert", rev, eid, {"createdAt": created, "sentimentScore": entry.get("sentimentScore"),
+                            "sentimentLabel": entry.get("sentimentLabel"), "themes": entry.get("themes") or []}, entry["content"].strip())
     return {"id": eid, "content": entry["content"].strip(), "createdAt": created, **entry}
 
 
-def update_entry(eid: str, updates: dict) -> None:
+# Bulk insert in one transaction (imports, seeding); entries carry content, createdAt and metadata.
+@perf.timed("db.insert_entries", rows=len)
+def insert_entries(entries: list) -> list:
+    rows = []
+    for entry in entries:
+        enc, iv = _encrypt_content(entry["content"].strip())
+        created = entry.get("createdAt", int(time.time() * 1000))
+        rows.append((_eid(), created, enc, iv, entry.get("sentimentScore"), entry.get("sentimentLabel"), entry.get("themes") or [],
+                     entry.get("analyzerVersion"), content_hash(created, entry["content"])))
+
+    def run(c):
+        c.executemany(
+            "INSERT INTO entries (id, created_at, encrypted_content, iv, sentiment_score, sentiment_label, themes, envelope, analyzer_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(*r[:6], json.dumps(r[6]), ENVELOPE_VERSION, r[7]) for r in rows],
+        )
+        c.executemany("INSERT OR IGNORE INTO content_hashes (mac, id, kind) VALUES (?, ?, ?)",
+                      [(r[8], r[0], HASH_ENTRY) for r in rows])
+        for r in rows:
+            _rollup_apply(c, r[1], r[4], r[5], r[6], 1)
+        rev = _bump_revision(c)
+        c.commit()
+        return rev
+    rev = _with_conn(run)
+    out = []
+    for entry, r in zip(entries, rows):
+        meta = {"createdAt": r[1], "sentimentScore": r[4], "sentimentLabel": r[5], "themes": r[6]}
+        _notify("upsert", rev, r[0], meta, entry["content"].strip())
+        out.append({**entry, "id": r[0], "content": entry["content"].strip(), "createdAt": r[1]})
+    return out
+
+
+# fragment: text an import merged into the entry, whose hash is kept as well (see content_hash). New content
+# drops the hashes of earlier fragments, which may have been edited out; an import still finds the ones that
+# remain by decrypting (transfer._contains_fragment) and hashes them again.
+@perf.timed("db.update_entry", rows=lambda _: 1)
+def update_entry(eid: str, updates: dict, fragment: str | None = None) -> None:
+    unarchive_entries([eid])  # an edited entry is hot again
+    if updates.get("content") is not None:
+        _content_hash_key()  # created or read before the write below opens its transaction
+
     def run(c):
         if "content" in updates and updates["content"] is not None:
             enc, iv = _encrypt_content(updates["content"])
-            c.execute("UPDATE entries SET encrypted_content = ?, iv = ? WHERE id = ?", (enc, iv, eid))
+            c.execute("BEGIN IMMEDIATE")  # the replaced text is read and kept in the same write
+            _save_revision(c, eid, updates["content"].strip())
+            created = c.execute("SELECT created_at FROM entries WHERE id = ?", (eid,)).fetchone()
+            if created is not None:
+                c.execute("DELETE FROM content_hashes WHERE id = ?", (eid,))
+                c.execute("INSERT OR IGNORE INTO content_hashes (mac, id, kind) VALUES (?, ?, ?)",
+                          (content_hash(created[0], updates["content"]), eid, HASH_ENTRY))
+                if fragment is not None:
+                    c.execute("INSERT OR IGNORE INTO content_hashes (mac, id, kind) VALUES (?, ?, ?)",
+                              (content_hash(created[0], fragment), eid, HASH_FRAGMENT))
+            # New text invalidates the stored analysis until it is re-scored (see analysis.py).
+            c.execute("UPDATE entries SET encrypted_content = ?, iv = ?, envelope = ?, analyzer_version = NULL WHERE id = ?",
+                      (enc, iv, ENVELOPE_VERSION, eid))
+            c.execute("DELETE FROM entry_terms WHERE id = ?", (eid,))
         rest = {k: v for k, v in updates.items() if k != "content" and v is not None}
         if rest:
+            old = c.execute(f"SELECT {META_COLS} FROM entries WHERE id = ?", (eid,)).fetchone()
             args, sets = [], []
             if "sentimentScore" in rest:
                 sets.append("sentiment_score = ?")
@@ -178,18 +610,62 @@ def update_entry(eid: str, updates: dict) -> None:
             if "themes" in rest:
                 sets.append("themes = ?")
                 args.append(json.dumps(rest["themes"]))
-            if sets:
+            if "analyzerVersion" in rest:
+                sets.append("analyzer_version = ?")
+                args.append(rest["analyzerVersion"])
+            if sets and old is not None:
                 args.append(eid)
+                _rollup_row(c, old, -1)
                 c.execute(f"UPDATE entries SET {', '.join(sets)} WHERE id = ?", args)
+                _rollup_row(c, c.execute(f"SELECT {META_COLS} FROM entries WHERE id = ?", (eid,)).fetchone(), 1)
+        row = c.execute(f"SELECT {META_COLS} FROM entries WHERE id = ?", (eid,)).fetchone()
+        rev = _bump_revision(c)
         c.commit()
-    _with_conn(run)
+        return row, rev
+    row, rev = _with_conn(run)
+    if row is not None:
+        _notify("upsert", rev, eid, _meta_dict(row), updates.get("content"))
 
 
+# Keep the text an update is about to replace as the entry's next revision: a delta from new_text, or the
+# whole text every SNAPSHOT_EVERY revisions and whenever the delta would not be smaller.
+def _save_revision(c, eid: str, new_text: str) -> None:
+    row = c.execute("SELECT encrypted_content, iv FROM entries WHERE id = ?", (eid,)).fetchone()
+    if row is None:
+        return
+    key = crypto.get_key()
+    try:
+        old_text = crypto.decrypt_content(row["encrypted_content"], row["iv"], key)
+    except InvalidTag:
+        return  # unreadable text cannot be kept; the update still replaces it
+    if old_text == new_text:
+        return
+    rev = c.execute("SELECT COALESCE(MAX(rev), 0) + 1 FROM entry_revisions WHERE id = ?", (eid,)).fetchone()[0]
+    delta = revisions.make_delta(new_text, old_text)
+    snapshot = rev % revisions.SNAPSHOT_EVERY == 0 or len(delta) >= len(old_text)
+    enc, iv = crypto.encrypt_content(old_text if snapshot else delta, key)
+    c.execute("INSERT INTO entry_revisions (id, rev, saved_at, snapshot, chars, encrypted_data, iv) VALUES (?, ?, ?, ?, ?, ?, ?)",
+              (eid, rev, int(time.time() * 1000), int(snapshot), len(old_text), enc, iv))
+
+
+@perf.timed("db.delete_entry", rows=lambda _: 1)
 def delete_entry(eid: str) -> None:
+    unarchive_entries([eid])
+
     def run(c):
+        old = c.execute(f"SELECT {META_COLS} FROM entries WHERE id = ?", (eid,)).fetchone()
+        if old is not None:
+            _rollup_row(c, old, -1)
         c.execute("DELETE FROM entries WHERE id = ?", (eid,))
+        c.execute("DELETE FROM entry_terms WHERE id = ?", (eid,))
+        c.execute("DELETE FROM entry_paragraphs WHERE id = ?", (eid,))
+        c.execute("DELETE FROM entry_revisions WHERE id = ?", (eid,))
+        c.execute("DELETE FROM content_hashes WHERE id = ?", (eid,))
+        rev = _bump_revision(c)
         c.commit()
-    _with_conn(run)
+        return rev, None if old is None else {"createdAt": old["created_at"]}
+    rev, meta = _with_conn(run)
+    _notify("delete", rev, eid, meta)
 
 
 def _entries_from_rows(rows):
@@ -202,39 +678,779 @@ def _entries_query(sql, params=()):
     return _with_conn(run)
 
 
+@perf.timed("db.get_entry")
 def get_entry(eid: str) -> dict | None:
     def run(c):
-        row = c.execute(f"SELECT {ENTRIES_COLS} FROM entries WHERE id = ?", (eid,)).fetchone()
+        row = c.execute(f"SELECT {ENTRIES_COLS} FROM {ALL_ENTRIES} WHERE id = ?", (eid,)).fetchone()
         return None if not row else _stored_to_entry(_row_dict(row))
     return _with_conn(run)
 
 
+@perf.timed("db.get_entries_by_date_range", rows=len)
 def get_entries_by_date_range(start_ms: int, end_ms: int) -> list:
-    sql = f"SELECT {ENTRIES_COLS} FROM entries WHERE created_at >= ? AND created_at <= ? ORDER BY created_at DESC"
+    sql = f"SELECT {ENTRIES_COLS} FROM {ALL_ENTRIES} WHERE created_at >= ? AND created_at <= ? ORDER BY created_at DESC"
     return _entries_query(sql, (start_ms, end_ms))
 
 
+@perf.timed("db.get_recent_entries", rows=len)
 def get_recent_entries(limit: int) -> list:
-    return _entries_query(f"SELECT {ENTRIES_COLS} FROM entries ORDER BY created_at DESC LIMIT ?", (limit,))
+    return _entries_query(f"SELECT {ENTRIES_COLS} FROM {ALL_ENTRIES} ORDER BY created_at DESC LIMIT ?", (limit,))
 
 
+@perf.timed("db.get_all_entries", rows=len)
 def get_all_entries() -> list:
-    return _entries_query(f"SELECT {ENTRIES_COLS} FROM entries ORDER BY created_at DESC")
+    cached = _entry_cache.get("all", lambda: _entries_query(f"SELECT {ENTRIES_COLS} FROM {ALL_ENTRIES} ORDER BY created_at DESC"))
+    return list(cached)
 
 
+# Every entry, oldest first, `batch_size` rows per query (keyset on created_at, id) so large journals
+# stream without being held in memory. Bypasses the entry cache.
+def iter_entries(batch_size: int = 500):
+    after = (-1, "")
+    while True:
+        batch = _entries_query(
+            f"SELECT {ENTRIES_COLS} FROM {ALL_ENTRIES} WHERE (created_at, id) > (?, ?) ORDER BY created_at, id LIMIT ?",
+            (*after, batch_size))
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        after = (batch[-1]["createdAt"], batch[-1]["id"])
+
+
+def count_entries() -> int:
+    return _with_conn(lambda c: c.execute(f"SELECT COUNT(*) FROM {ALL_ENTRIES}").fetchone()[0])
+
+
+@perf.timed("db.get_write_dates", rows=len)
 def get_write_dates() -> list:
     def run(c):
-        rows = c.execute("SELECT created_at FROM entries").fetchall()
+        rows = c.execute(f"SELECT created_at FROM {ALL_ENTRIES}").fetchall()
         seen = set()
         for r in rows:
             dt = datetime.fromtimestamp(r["created_at"] / 1000.0)
             seen.add(int(dt.replace(hour=0, minute=0, second=0, microsecond=0).timestamp() * 1000))
         return sorted(seen, reverse=True)
-    return _with_conn(run)
+    return list(_entry_cache.get("write_dates", lambda: _with_conn(run)))
 
 
+@perf.timed("db.clear_all_entries")
 def clear_all_entries() -> None:
     def run(c):
         c.execute("DELETE FROM entries")
+        c.execute("DELETE FROM archive.entries")
+        c.execute("DELETE FROM sentiment_rollups")
+        c.execute("DELETE FROM theme_rollups")
+        c.execute("DELETE FROM entry_terms")
+        c.execute("DELETE FROM drafts")
+        c.execute("DELETE FROM entry_paragraphs")
+        c.execute("DELETE FROM entry_revisions")
+        c.execute("DELETE FROM llm_calls")
+        c.execute("DELETE FROM llm_daily")
+        c.execute("DELETE FROM content_hashes")
+        c.execute("DELETE FROM secrets")
+        rev = _bump_revision(c)
+        c.commit()
+        return rev
+    _notify("clear", _with_conn(run))
+    _hash_key.clear()
+    reclaim_free_pages()
+
+
+# Metadata columns only (no decryption): id, createdAt, sentimentScore, sentimentLabel, themes.
+@perf.timed("db.get_entry_metadata", rows=len)
+def get_entry_metadata() -> list:
+    def run(c):
+        rows = c.execute(f"SELECT id, {META_COLS} FROM {ALL_ENTRIES} ORDER BY created_at").fetchall()
+        return [{"id": r["id"], **_meta_dict(r)} for r in rows]
+    return _with_conn(run)
+
+
+# --- Encrypted per-entry term counts backing the related-entries index ---
+
+@perf.timed("db.save_entry_terms", rows=lambda _: 1)
+def save_entry_terms(eid: str, counts: dict) -> None:
+    enc, iv = _encrypt_content(json.dumps(counts))
+
+    def run(c):
+        c.execute("INSERT OR REPLACE INTO entry_terms (id, encrypted_terms, iv, envelope) VALUES (?, ?, ?, ?)",
+                  (eid, enc, iv, ENVELOPE_VERSION))
         c.commit()
     _with_conn(run)
+
+
+@perf.timed("db.get_all_entry_terms", rows=len)
+def get_all_entry_terms() -> dict:
+    key = crypto.get_key()
+    if not key:
+        raise ValueError("Unlock required to read entries.")
+
+    def run(c):
+        rows = c.execute("SELECT id, encrypted_terms, iv FROM entry_terms").fetchall()
+        return {r["id"]: json.loads(crypto.decrypt_content(r["encrypted_terms"], r["iv"], key)) for r in rows}
+    return _with_conn(run)
+
+
+# Ids of entries that have no term counts yet (written before the index existed).
+def get_unindexed_entry_ids(limit: int) -> list:
+    def run(c):
+        rows = c.execute(
+            f"SELECT e.id FROM {ALL_ENTRIES} e LEFT JOIN entry_terms t ON t.id = e.id WHERE t.id IS NULL LIMIT ?", (limit,)
+        ).fetchall()
+        return [r["id"] for r in rows]
+    return _with_conn(run)
+
+
+@perf.timed("db.get_entries_by_ids", rows=len)
+def get_entries_by_ids(ids: list) -> list:
+    if not ids:
+        return []
+    marks = ", ".join("?" * len(ids))
+    return _entries_query(f"SELECT {ENTRIES_COLS} FROM {ALL_ENTRIES} WHERE id IN ({marks}) ORDER BY created_at DESC", tuple(ids))
+
+
+# --- Analysis results: written behind entry saves by analysis.py ---
+
+# (rowid, id) of entries whose analysis is missing or from another analyzer version, after rowid `after`.
+def get_stale_analysis_ids(version: str, after: int = 0, limit: int = 100) -> list:
+    def run(c):
+        rows = c.execute(
+            """SELECT rowid, id FROM entries WHERE rowid > ? AND (analyzer_version IS NULL OR analyzer_version != ?)
+               ORDER BY rowid LIMIT ?""",
+            (after, version, limit),
+        ).fetchall()
+        return [(r[0], r[1]) for r in rows]
+    return _with_conn(run)
+
+
+def count_stale_analysis(version: str) -> int:
+    def run(c):
+        return c.execute("SELECT COUNT(*) FROM entries WHERE analyzer_version IS NULL OR analyzer_version != ?",
+                         (version,)).fetchone()[0]
+    return _with_conn(run)
+
+
+# Plaintext to analyze plus the IV, which identifies the exact ciphertext version the result belongs to,
+# and the entry's paragraph cache (sentiment.analyze_incremental) or None.
+@perf.timed("db.get_analysis_inputs", rows=len)
+def get_analysis_inputs(ids: list) -> list:
+    key = crypto.get_key()
+    if not key:
+        raise ValueError("Unlock required to read entries.")
+    if not ids:
+        return []
+    marks = ", ".join("?" * len(ids))
+
+    def run(c):
+        return c.execute(
+            f"""SELECT e.id, e.encrypted_content, e.iv, p.encrypted_data, p.iv AS p_iv FROM entries e
+                LEFT JOIN entry_paragraphs p ON p.id = e.id WHERE e.id IN ({marks})""",
+            tuple(ids),
+        ).fetchall()
+    out = []
+    for r in _with_conn(run):
+        cache = json.loads(crypto.decrypt_content(r["encrypted_data"], r["p_iv"], key)) if r["encrypted_data"] else None
+        out.append({"id": r["id"], "iv": r["iv"], "content": crypto.decrypt_content(r["encrypted_content"], r["iv"], key),
+                    "paragraphs": cache})
+    return out
+
+
+# Store analysis results (and their paragraph caches, when given) in one transaction. A result is dropped
+# when its entry was deleted or its text changed since it was read (IV differs), so a slow analysis never
+# overwrites a newer save. Returns ids applied.
+@perf.timed("db.apply_analysis", rows=len)
+def apply_analysis(results: list) -> list:
+    caches = {r["id"]: _encrypt_content(json.dumps(r["paragraphs"])) for r in results if r.get("paragraphs")}
+
+    def run(c):
+        applied = []
+        for r in results:
+            old = c.execute(f"SELECT iv, {META_COLS} FROM entries WHERE id = ?", (r["id"],)).fetchone()
+            if old is None or old["iv"] != r["iv"]:
+                continue
+            _rollup_row(c, old, -1)
+            c.execute(
+                "UPDATE entries SET sentiment_score = ?, sentiment_label = ?, themes = ?, analyzer_version = ? WHERE id = ?",
+                (r["sentimentScore"], r["sentimentLabel"], json.dumps(r["themes"]), r["analyzerVersion"], r["id"]),
+            )
+            row = c.execute(f"SELECT {META_COLS} FROM entries WHERE id = ?", (r["id"],)).fetchone()
+            _rollup_row(c, row, 1)
+            if r["id"] in caches:
+                c.execute("INSERT OR REPLACE INTO entry_paragraphs (id, encrypted_data, iv) VALUES (?, ?, ?)",
+                          (r["id"], *caches[r["id"]]))
+            applied.append((r["id"], _meta_dict(row)))
+        rev = _bump_revision(c) if applied else None
+        c.commit()
+        return applied, rev
+    applied, rev = _with_conn(run)
+    for eid, meta in applied:
+        _notify("upsert", rev, eid, meta)
+    return [eid for eid, _ in applied]
+
+
+# --- Revision history: versions replaced by update_entry (see _save_revision) ---
+
+# Past versions of an entry, newest first, listed without decrypting: [{"rev", "savedAt", "chars"}].
+@perf.timed("db.get_entry_history", rows=len)
+def get_entry_history(eid: str) -> list:
+    def run(c):
+        rows = c.execute("SELECT rev, saved_at, chars FROM entry_revisions WHERE id = ? ORDER BY rev DESC", (eid,)).fetchall()
+        return [{"rev": r["rev"], "savedAt": r["saved_at"], "chars": r["chars"]} for r in rows]
+    return _with_conn(run)
+
+
+# Text of one past version: start from the nearest snapshot at or above `rev` (or the current text when there
+# is none) and apply the deltas down to it, at most SNAPSHOT_EVERY - 1. Everything is read in one transaction.
+@perf.timed("db.get_entry_version")
+def get_entry_version(eid: str, rev: int) -> str:
+    key = crypto.get_key()
+    if not key:
+        raise ValueError("Unlock required to read entries.")
+
+    def run(c):
+        c.execute("BEGIN")
+        try:
+            # Without a snapshot above, COALESCE falls back to the row's own rev and keeps every newer row.
+            rows = c.execute(
+                """SELECT rev, snapshot, encrypted_data, iv FROM entry_revisions WHERE id = ? AND rev >= ? AND rev <=
+                   COALESCE((SELECT MIN(rev) FROM entry_revisions WHERE id = ? AND rev >= ? AND snapshot = 1), rev)
+                   ORDER BY rev DESC""", (eid, rev, eid, rev)).fetchall()
+            current = None
+            if rows and not rows[0]["snapshot"]:
+                current = c.execute(f"SELECT encrypted_content, iv FROM {ALL_ENTRIES} WHERE id = ?", (eid,)).fetchone()
+            return rows, current
+        finally:
+            c.rollback()
+    rows, current = _with_conn(run)
+    if not rows or rows[-1]["rev"] != rev or (current is None and not rows[0]["snapshot"]):
+        raise ValueError("That version is no longer available.")
+    if current is not None:
+        text = crypto.decrypt_content(current["encrypted_content"], current["iv"], key)
+    else:
+        text, rows = crypto.decrypt_content(rows[0]["encrypted_data"], rows[0]["iv"], key), rows[1:]
+    for r in rows:
+        text = revisions.apply_delta(text, crypto.decrypt_content(r["encrypted_data"], r["iv"], key))
+    return text
+
+
+# --- Content hashes: a keyed HMAC of (day, text) for every entry and every fragment an import merged into
+# one, indexed, so imports find content the journal already holds without decrypting anything. The HMAC key
+# is random and kept in "secrets", so a passphrase change re-wraps it and the hashes stay valid ---
+
+HASH_ENTRY, HASH_FRAGMENT = 0, 1  # content_hashes.kind: an entry's whole text, or text merged into it
+_hash_key = {}
+crypto.add_clear_listener(_hash_key.clear)
+
+
+def _content_hash_key() -> bytes:
+    key = crypto.get_key()
+    if not key:
+        raise ValueError("Unlock required to save entries.")
+    cached = _hash_key.get(key)
+    if cached is not None:
+        return cached
+
+    def run(c):
+        c.execute("BEGIN IMMEDIATE")  # two processes creating the key at once must agree on one
+        row = c.execute("SELECT encrypted_data, iv FROM secrets WHERE id = 'content-hash'").fetchone()
+        if row is not None:
+            c.rollback()
+            return crypto.decrypt_bytes(row["encrypted_data"], row["iv"], key)
+        new = os.urandom(32)
+        enc, iv = crypto.encrypt_bytes(new, key)
+        c.execute("INSERT INTO secrets (id, encrypted_data, iv) VALUES ('content-hash', ?, ?)", (enc, iv))
+        c.commit()
+        return new
+    hk = _hash_key[key] = _with_conn(run)
+    return hk
+
+
+def content_hash(created_at: int, text: str) -> bytes:
+    return crypto.content_mac(f"{get_day_start_ms(created_at)}\n{text.strip()}", _content_hash_key(), "content-hash")
+
+
+def has_content_hash(mac: bytes) -> bool:
+    return _with_conn(lambda c: c.execute("SELECT 1 FROM content_hashes WHERE mac = ? LIMIT 1", (mac,)).fetchone()) is not None
+
+
+def add_content_hash(eid: str, mac: bytes, kind: int = HASH_FRAGMENT) -> None:
+    def run(c):
+        c.execute("INSERT OR IGNORE INTO content_hashes (mac, id, kind) VALUES (?, ?, ?)", (mac, eid, kind))
+        c.commit()
+    _with_conn(run)
+
+
+def count_unhashed_entries() -> int:
+    return _with_conn(lambda c: c.execute(
+        f"SELECT COUNT(*) FROM {ALL_ENTRIES} WHERE id NOT IN (SELECT id FROM content_hashes WHERE kind = {HASH_ENTRY})"
+    ).fetchone()[0])
+
+
+# Hash entries written before content hashes existed, batch_size per transaction. Returns entries hashed.
+@perf.timed("db.backfill_content_hashes", rows=lambda n: n)
+def backfill_content_hashes(batch_size: int = 500, progress=None) -> int:
+    done, after = 0, ""
+    while True:
+        batch = _entries_query(
+            f"SELECT {ENTRIES_COLS} FROM {ALL_ENTRIES} WHERE id > ? AND id NOT IN "
+            f"(SELECT id FROM content_hashes WHERE kind = {HASH_ENTRY}) ORDER BY id LIMIT ?", (after, batch_size))
+        if not batch:
+            return done
+        after = batch[-1]["id"]
+        rows = [(content_hash(e["createdAt"], e["content"]), e["id"], HASH_ENTRY) for e in batch]
+
+        def run(c, rows=rows):
+            c.executemany("INSERT OR IGNORE INTO content_hashes (mac, id, kind) VALUES (?, ?, ?)", rows)
+            c.commit()
+        _with_conn(run)
+        done += len(batch)
+        if progress:
+            progress(done)
+
+
+# --- Drafts: unsaved editor text, encrypted, one row per draft id. Not entries, so no revision bump ---
+
+@perf.timed("db.save_draft", rows=lambda _: 1)
+def save_draft(draft_id: str, content: str, mac: bytes) -> None:
+    enc, iv = _encrypt_content(content)
+
+    def run(c):
+        c.execute(
+            """INSERT INTO drafts (id, encrypted_content, iv, content_mac, updated_at) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(id) DO UPDATE SET encrypted_content = excluded.encrypted_content, iv = excluded.iv,
+               content_mac = excluded.content_mac, updated_at = excluded.updated_at""",
+            (draft_id, enc, iv, mac, int(time.time() * 1000)),
+        )
+        c.commit()
+    _with_conn(run)
+
+
+@perf.timed("db.get_draft")
+def get_draft(draft_id: str) -> dict | None:
+    key = crypto.get_key()
+    if not key:
+        raise ValueError("Unlock required to read entries.")
+
+    def run(c):
+        return c.execute("SELECT encrypted_content, iv, content_mac, updated_at FROM drafts WHERE id = ?", (draft_id,)).fetchone()
+    row = _with_conn(run)
+    if row is None:
+        return None
+    return {"content": crypto.decrypt_content(row["encrypted_content"], row["iv"], key),
+            "mac": row["content_mac"], "updatedAt": row["updated_at"]}
+
+
+def get_draft_mac(draft_id: str) -> bytes | None:
+    def run(c):
+        row = c.execute("SELECT content_mac FROM drafts WHERE id = ?", (draft_id,)).fetchone()
+        return row[0] if row else None
+    return _with_conn(run)
+
+
+def delete_draft(draft_id: str) -> None:
+    def run(c):
+        c.execute("DELETE FROM drafts WHERE id = ?", (draft_id,))
+        c.commit()
+    _with_conn(run)
+
+
+# --- LLM call metering (metering.py). Not entries, so no revision bump ---
+
+# Store one call and fold it into its day's aggregate with merge(aggregate or None, call) in one write;
+# calls older than keep_after_ms are dropped.
+@perf.timed("db.add_llm_call", rows=lambda _: 1)
+def add_llm_call(day_start: int, call: dict, merge, keep_after_ms: int) -> None:
+    key = crypto.get_key()
+    if not key:
+        raise ValueError("Unlock required to save entries.")
+    enc, iv = crypto.encrypt_content(json.dumps(call), key)
+
+    def run(c):
+        c.execute("BEGIN IMMEDIATE")  # the aggregate is read and rewritten in the same write
+        c.execute("INSERT INTO llm_calls (day_start, encrypted_data, iv) VALUES (?, ?, ?)", (day_start, enc, iv))
+        row = c.execute("SELECT encrypted_data, iv FROM llm_daily WHERE id = ?", (day_start,)).fetchone()
+        try:
+            agg = json.loads(crypto.decrypt_content(row["encrypted_data"], row["iv"], key)) if row else None
+        except InvalidTag:
+            agg = None  # unreadable aggregate: start the day over rather than lose the call
+        agg_enc, agg_iv = crypto.encrypt_content(json.dumps(merge(agg, call)), key)
+        c.execute("INSERT OR REPLACE INTO llm_daily (id, encrypted_data, iv) VALUES (?, ?, ?)", (day_start, agg_enc, agg_iv))
+        c.execute("DELETE FROM llm_calls WHERE day_start < ?", (keep_after_ms,))
+        c.commit()
+    _with_conn(run)
+
+
+# Calls on days starting at or after since_ms, oldest first.
+@perf.timed("db.get_llm_calls", rows=len)
+def get_llm_calls(since_ms: int) -> list:
+    key = crypto.get_key()
+    if not key:
+        raise ValueError("Unlock required to read entries.")
+    rows = _with_conn(lambda c: c.execute(
+        "SELECT encrypted_data, iv FROM llm_calls WHERE day_start >= ? ORDER BY id", (since_ms,)).fetchall())
+    return [json.loads(crypto.decrypt_content(r["encrypted_data"], r["iv"], key)) for r in rows]
+
+
+# Per-day aggregates for days starting in [start_ms, end_ms], oldest first, each with its "day".
+@perf.timed("db.get_llm_daily", rows=len)
+def get_llm_daily(start_ms: int = 0, end_ms: int | None = None) -> list:
+    key = crypto.get_key()
+    if not key:
+        raise ValueError("Unlock required to read entries.")
+    rows = _with_conn(lambda c: c.execute(
+        "SELECT id, encrypted_data, iv FROM llm_daily WHERE id >= ? AND id <= ? ORDER BY id",
+        (start_ms, end_ms if end_ms is not None else 2 ** 62)).fetchall())
+    return [{"day": r["id"], **json.loads(crypto.decrypt_content(r["encrypted_data"], r["iv"], key))} for r in rows]
+
+
+# --- Passphrase change: one checkpoint row; the vault already holds the new passphrase's salt and test ---
+
+_ROTATION_COLS = ("old_salt", "old_test_cipher", "old_test_iv", "wrapped_old", "wrapped_old_iv", "wrapped_new", "wrapped_new_iv")
+
+
+def get_key_rotation() -> dict | None:
+    def run(c):
+        row = c.execute("SELECT * FROM key_rotation WHERE id = 'rotation'").fetchone()
+        return _row_dict(row) if row else None
+    return _with_conn(run)
+
+
+# Switch the vault to the new passphrase and record the checkpoint in one transaction.
+def begin_key_rotation(rotation: dict, vault: dict) -> None:
+    def run(c):
+        total = sum(c.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t, _ in ENCRYPTED_TABLES)
+        c.execute(
+            f"""INSERT INTO key_rotation (id, {", ".join(_ROTATION_COLS)}, table_name, last_rowid, done_rows, total_rows, started_at)
+                VALUES ('rotation', {", ".join("?" * len(_ROTATION_COLS))}, ?, 0, 0, ?, ?)""",
+            (*(rotation[k] for k in _ROTATION_COLS), ENCRYPTED_TABLES[0][0], total, int(time.time() * 1000)),
+        )
+        c.execute("INSERT OR REPLACE INTO vault (id, salt, test_cipher, test_iv) VALUES (?, ?, ?, ?)",
+                  (vault["id"], vault["salt"], vault["testCipher"], vault["testIv"]))
+        c.commit()
+    _with_conn(run)
+
+
+# Re-encrypt up to `limit` rows of `table` after the checkpoint, then advance it. A row rewritten by another
+# writer between the read and the write (IV changed) is read again, so nothing under the old key is left
+# behind the checkpoint; a crash before the checkpoint just repeats the batch (finished rows are skipped).
+# Returns rows re-encrypted, or None when the table is done.
+@perf.timed("db.reencrypt_batch", rows=lambda n: n or 0)
+def reencrypt_batch(table: str, col: str, limit: int, old_key: bytes, new_key: bytes) -> int | None:
+    def read(c, where, args, limit=-1):
+        # The alias keeps the key "rowid" on tables whose INTEGER PRIMARY KEY would otherwise name it.
+        return c.execute(f"SELECT rowid AS rowid, {col}, iv FROM {table} WHERE {where} ORDER BY rowid LIMIT ?", (*args, limit)).fetchall()
+    rot = get_key_rotation()
+    rows = _with_conn(lambda c: read(c, "rowid > ?", (rot["last_rowid"],), limit))
+    if not rows:
+        return None
+    done = 0
+    pending = rows
+    while pending:
+        updates = []
+        for r in pending:
+            new = crypto.reencrypt(r[col], r["iv"], old_key, new_key)
+            if new is not None:
+                updates.append((*new, r["rowid"], r["iv"]))
+
+        def write(c, updates=updates):
+            changed = [u[2] for u in updates
+                       if c.execute(f"UPDATE {table} SET {col} = ?, iv = ? WHERE rowid = ? AND iv = ?", u).rowcount == 0]
+            c.commit()
+            return changed
+        missed = _with_conn(write)
+        done += len(updates) - len(missed)
+        marks = ", ".join("?" * len(missed))
+        pending = _with_conn(lambda c, marks=marks, missed=missed: read(c, f"rowid IN ({marks})", tuple(missed))) if missed else []
+
+    def checkpoint(c):
+        c.execute("UPDATE key_rotation SET table_name = ?, last_rowid = ?, done_rows = done_rows + ? WHERE id = 'rotation'",
+                  (table, rows[-1]["rowid"], len(rows)))
+        c.commit()
+    _with_conn(checkpoint)
+    return done
+
+
+def advance_key_rotation(table: str) -> None:
+    def run(c):
+        c.execute("UPDATE key_rotation SET table_name = ?, last_rowid = 0 WHERE id = 'rotation'", (table,))
+        c.commit()
+    _with_conn(run)
+
+
+def finish_key_rotation() -> None:
+    def run(c):
+        c.execute("DELETE FROM key_rotation WHERE id = 'rotation'")
+        c.commit()
+    _with_conn(run)
+
+
+# --- Archive tier: old entries move to archive.entries (see tiering.py); rollups and term rows stay in main ---
+
+_tier_lock = threading.Lock()
+
+
+# Move entries between tiers in two commits, copy then delete, because a transaction spanning a WAL database
+# and an attached one is not atomic across a crash; in between, ALL_ENTRIES and init_db prefer the hot copy.
+# Rows are re-encrypted under the new key while a passphrase change runs, so neither tier's cursor misses one.
+# Hot rows rewritten meanwhile (IV changed) stay hot. Returns entries moved.
+def _move_entries(ids: list, src: str, dst: str) -> int:
+    if not ids:
+        return 0
+    marks = ", ".join("?" * len(ids))
+    key, previous = crypto.get_key(), crypto.get_previous_key()
+
+    def copy(c):
+        rows = [list(r) for r in c.execute(f"SELECT {TIER_COLS} FROM {src}.entries WHERE id IN ({marks})", tuple(ids))]
+        moved = []
+        for r in rows:
+            moved.append((r[0], r[3]))
+            if key and previous:
+                r[2], r[3] = crypto.reencrypt(r[2], r[3], previous, key) or (r[2], r[3])
+        # The hot copy is authoritative: never overwrite it with an archived one.
+        conflict = "IGNORE" if dst == "main" else "REPLACE"
+        c.executemany(f"INSERT OR {conflict} INTO {dst}.entries ({TIER_COLS}) VALUES ({', '.join('?' * 9)})", rows)
+        c.commit()
+        return moved
+
+    def drop(c, moved):
+        if src == "main":
+            c.executemany("DELETE FROM main.entries WHERE id = ? AND iv = ?", moved)
+            c.execute(f"DELETE FROM entry_paragraphs WHERE id IN ({marks})", tuple(ids))
+        c.execute(f"DELETE FROM archive.entries WHERE id IN ({marks}) AND id IN (SELECT id FROM main.entries)", tuple(ids))
+        c.commit()
+    with _tier_lock:
+        moved = _with_conn(copy)
+        _with_conn(lambda c: drop(c, moved))
+    return len(moved)
+
+
+# Archive up to `limit` entries created before cutoff_ms. Only rows already analyzed with `version` and in the
+# current envelope move, so the analysis and envelope backfills never need to look in the archive.
+@perf.timed("db.archive_entries_before", rows=lambda n: n)
+def archive_entries_before(cutoff_ms: int, version: str, limit: int) -> int:
+    def run(c):
+        return [r[0] for r in c.execute(
+            """SELECT id FROM main.entries WHERE created_at < ? AND analyzer_version = ? AND envelope = ?
+               ORDER BY created_at LIMIT ?""", (cutoff_ms, version, ENVELOPE_VERSION, limit))]
+    return _move_entries(_with_conn(run), "main", "archive")
+
+
+# Bring entries back to the hot table (before an edit or delete). Cheap when none of them is archived.
+def unarchive_entries(ids: list) -> int:
+    if not ids:
+        return 0
+    marks = ", ".join("?" * len(ids))
+    archived = _with_conn(lambda c: [r[0] for r in c.execute(
+        f"SELECT id FROM archive.entries WHERE id IN ({marks})", tuple(ids))])
+    return _move_entries(archived, "archive", "main")
+
+
+# Archived entries analyzed with another analyzer version go back to the hot table for re-scoring.
+def unarchive_stale(version: str, batch_size: int = 500) -> int:
+    moved = 0
+    while True:
+        ids = _with_conn(lambda c: [r[0] for r in c.execute(
+            "SELECT id FROM archive.entries WHERE analyzer_version IS NULL OR analyzer_version != ? LIMIT ?",
+            (version, batch_size))])
+        if not ids:
+            return moved
+        moved += _move_entries(ids, "archive", "main")
+
+
+def tier_counts() -> dict:
+    def run(c):
+        hot = c.execute("SELECT COUNT(*) FROM main.entries").fetchone()[0]
+        return {"hot": hot, "archived": c.execute(f"SELECT COUNT(*) FROM {ALL_ENTRIES}").fetchone()[0] - hot}
+    return _with_conn(run)
+
+
+def free_pages() -> dict:
+    return _with_conn(lambda c: {s: c.execute(f"PRAGMA {s}.freelist_count").fetchone()[0] for s in ("main", "archive")})
+
+
+# Return up to max_pages free pages per file to the filesystem (auto_vacuum=INCREMENTAL); None frees all.
+# Returns pages freed.
+def reclaim_free_pages(max_pages: int | None = None) -> int:
+    def run(c):
+        freed = 0
+        for schema in ("main", "archive"):
+            before = c.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+            if before:
+                # executescript steps the pragma to completion; execute() would free a single page.
+                c.executescript(f"PRAGMA {schema}.incremental_vacuum({max_pages or 0});")
+                freed += before - c.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+        return freed
+    return _with_conn(run)
+
+
+# --- Envelope migration: rewrite rows stored before the compressed envelope, in small resumable batches ---
+
+_envelope_lock = threading.Lock()
+_envelope_state = {"running": False, "done": False}
+
+
+# Re-encrypts one batch of `table` after rowid `after`; returns (last rowid seen or None, rows rewritten).
+def _migrate_envelope_batch(table: str, col: str, after: int, batch_size: int, key: bytes):
+    def read(c):
+        return c.execute(
+            f"SELECT rowid, {col}, iv FROM {table} WHERE rowid > ? AND envelope < ? ORDER BY rowid LIMIT ?",
+            (after, ENVELOPE_VERSION, batch_size),
+        ).fetchall()
+    rows = _with_conn(read)
+    if not rows:
+        return None, 0
+    updates = []
+    for r in rows:
+        enc, iv = crypto.encrypt_content(crypto.decrypt_content(r[col], r["iv"], key), key)
+        updates.append((enc, iv, ENVELOPE_VERSION, r["rowid"], r[col]))
+
+    def write(c):
+        # Matching on the old ciphertext skips rows a user edit replaced since the read.
+        n = 0
+        for u in updates:
+            n += c.execute(f"UPDATE {table} SET {col} = ?, iv = ?, envelope = ? WHERE rowid = ? AND {col} = ?", u).rowcount
+        c.commit()
+        return n
+    return rows[-1]["rowid"], _with_conn(write)
+
+
+# Content is unchanged, so the data revision is not bumped. Stops early if the journal is locked.
+@perf.timed("db.migrate_envelopes", rows=lambda n: n)
+def migrate_envelopes(batch_size: int = ENVELOPE_BATCH, pause_s: float = 0.0, compact: bool = False) -> int:
+    key = crypto.get_key()
+    if not key:
+        raise ValueError("Unlock required to migrate entries.")
+    migrated = 0
+    for table, col in ENVELOPE_TABLES:
+        after = 0
+        while crypto.get_key() is key:
+            after, n = _migrate_envelope_batch(table, col, after, batch_size, key)
+            if after is None:
+                break
+            migrated += n
+            time.sleep(pause_s)
+    if compact and migrated:
+        # Return the space freed by the smaller rows to the filesystem.
+        conn = sqlite3.connect(DB_PATH, isolation_level=None)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+    return migrated
+
+
+def pending_envelope_rows() -> int:
+    def run(c):
+        return sum(c.execute(f"SELECT COUNT(*) FROM {t} WHERE envelope < ?", (ENVELOPE_VERSION,)).fetchone()[0]
+                   for t, _ in ENVELOPE_TABLES)
+    return _with_conn(run)
+
+
+# SQLite's own structural check of both databases; "ok" when nothing is wrong.
+def integrity_check() -> str:
+    return _with_conn(lambda c: c.execute("PRAGMA integrity_check").fetchone()[0])
+
+
+# Decrypt every row of ENCRYPTED_TABLES (previous-key fallback included) and return (table, id) pairs
+# that fail authentication. Walks each table by rowid, batch_size rows per read.
+def find_undecryptable(batch_size: int = 500, progress=None) -> list:
+    key = crypto.get_key()
+    if not key:
+        raise ValueError("Unlock required to verify entries.")
+    failed, checked = [], 0
+    for table, col in ENCRYPTED_TABLES:
+        after = 0
+        while True:
+            rows = _with_conn(lambda c, table=table, col=col, after=after: c.execute(
+                f"SELECT rowid, id, {col}, iv FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (after, batch_size)).fetchall())
+            for rowid, rid, ct, iv in rows:
+                try:
+                    crypto.decrypt_bytes(ct, iv, key)
+                except InvalidTag:
+                    failed.append((table, rid))
+            checked += len(rows)
+            if progress:
+                progress(checked)
+            if len(rows) < batch_size:
+                break
+            after = rows[-1][0]
+    return failed
+
+
+# Start the migration on a daemon thread once per process after unlock; cheap to call per rerun.
+def migrate_envelopes_in_background() -> bool:
+    with _envelope_lock:
+        if _envelope_state["running"] or _envelope_state["done"] or not crypto.is_unlocked():
+            return False
+        _envelope_state["running"] = True
+
+    def run():
+        try:
+            migrate_envelopes(pause_s=0.01, compact=True)
+            with _envelope_lock:
+                _envelope_state["done"] = pending_envelope_rows() == 0
+        except (ValueError, sqlite3.Error):
+            pass
+        finally:
+            with _envelope_lock:
+                _envelope_state["running"] = False
+    threading.Thread(target=run, name="journal-envelope-migration", daemon=True).start()
+    return True
+
+
+# --- Rollup queries: cost scales with the number of periods, not entries ---
+
+def _rollup_dict(row) -> dict:
+    return {
+        "start": row["bucket_start"],
+        "count": row["entry_count"],
+        "mean": row["score_sum"] / row["scored_count"] if row["scored_count"] else None,
+        "labels": {lbl: row[lbl] for lbl in SENTIMENT_LABELS},
+    }
+
+
+# Buckets for period ("day", "week" or "month") whose start lies in [start_ms, end_ms], oldest first.
+@perf.timed("db.get_sentiment_rollups", rows=len)
+def get_sentiment_rollups(period: str, start_ms: int = 0, end_ms: int | None = None) -> list:
+    if period not in ROLLUP_PERIODS:
+        raise ValueError(f"Unknown rollup period: {period}")
+    end_ms = end_ms if end_ms is not None else 2 ** 62
+
+    def run(c):
+        rows = c.execute(
+            "SELECT * FROM sentiment_rollups WHERE period = ? AND bucket_start >= ? AND bucket_start <= ? ORDER BY bucket_start",
+            (period, start_ms, end_ms),
+        ).fetchall()
+        return [_rollup_dict(r) for r in rows]
+    return _with_conn(run)
+
+
+# Count, mean score and label histogram over whole days in [start_ms, end_ms].
+@perf.timed("db.get_sentiment_summary")
+def get_sentiment_summary(start_ms: int, end_ms: int) -> dict:
+    def run(c):
+        row = c.execute(
+            """SELECT COALESCE(SUM(entry_count), 0) AS entry_count, COALESCE(SUM(scored_count), 0) AS scored_count,
+                      COALESCE(SUM(score_sum), 0) AS score_sum, COALESCE(SUM(positive), 0) AS positive,
+                      COALESCE(SUM(neutral), 0) AS neutral, COALESCE(SUM(negative), 0) AS negative, ? AS bucket_start
+               FROM sentiment_rollups WHERE period = 'day' AND bucket_start >= ? AND bucket_start <= ?""",
+            (start_ms, start_ms, end_ms),
+        ).fetchone()
+        return _rollup_dict(row)
+    return _with_conn(run)
+
+
+# Theme counts over whole days in [start_ms, end_ms]; positive_only counts positive entries only.
+@perf.timed("db.get_theme_counts", rows=len)
+def get_theme_counts(start_ms: int = 0, end_ms: int | None = None, positive_only: bool = False, limit: int | None = None) -> list:
+    col = "positive_count" if positive_only else "entry_count"
+    end_ms = end_ms if end_ms is not None else 2 ** 62
+
+    def run(c):
+        rows = c.execute(
+            f"""SELECT theme, SUM({col}) AS n FROM theme_rollups WHERE day_start >= ? AND day_start <= ?
+                GROUP BY theme HAVING n > 0 ORDER BY n DESC, theme LIMIT ?""",
+            (start_ms, end_ms, limit if limit is not None else -1),
+        ).fetchall()
+        return [{"theme": r["theme"], "count": r["n"]} for r in rows]
+    return _with_conn(run)
@@ -0,0 +1,112 @@
+# Draft autosave for the journal editor: debounced, coalesced encrypted writes to db.drafts.
+import threading
+import time
+
+import crypto
+import db
+
+SAVE_INTERVAL_S = 5.0  # at most one draft write per interval per draft
+FLUSH_CHANGED_CHARS = 400  # write sooner once this much text has changed since the last write
+
+_lock = threading.Lock()
+_drafts = {}  # draft_id -> {"text", "mac", "saved_mac", "saved_len", "saved_at", "timer", "write_lock"}
+
+
+# The stored draft's MAC is read outside _lock so one draft's lookup never blocks the other drafts.
+def _state(draft_id: str) -> dict:
+    with _lock:
+        s = _drafts.get(draft_id)
+    if s is None:
+        saved_mac = db.get_draft_mac(draft_id)
+        with _lock:
+            s = _drafts.setdefault(draft_id, {"text": None, "mac": None, "saved_mac": saved_mac, "saved_len": 0,
+                                              "saved_at": 0.0, "timer": None, "write_lock": threading.Lock()})
+    return s
+
+
+# Called with the editor text on every rerun. Unchanged text (same keyed hash as the stored draft) costs
+# one HMAC; changed text is held in memory and written when the interval or size threshold is reached,
+# or by a timer if no further rerun arrives. `baseline` is the saved entry text, which needs no draft.
+def note(draft_id: str, text: str, baseline: str = "") -> None:
+    key = crypto.get_key()
+    if not key:
+        return
+    text = text or ""
+    if text.strip() == (baseline or "").strip():
+        discard(draft_id)
+        return
+    mac = crypto.content_mac(text, key)
+    s = _state(draft_id)
+    with _lock:
+        if mac == s["saved_mac"]:
+            s["text"] = s["mac"] = None
+            return
+        s["text"], s["mac"] = text, mac
+        due = s["saved_at"] + SAVE_INTERVAL_S - time.monotonic()
+        if due > 0 and abs(len(text) - s["saved_len"]) < FLUSH_CHANGED_CHARS:
+            if s["timer"] is None:
+                s["timer"] = threading.Timer(due, flush, (draft_id,))
+                s["timer"].daemon = True
+                s["timer"].start()
+            return
+    flush(draft_id)
+
+
+# Writes the pending text, if any. Safe to call from the timer thread. The draft's write lock is held from
+# taking the pending text until saved_* is updated, so a later flush or discard cannot be overtaken by an
+# older write still in flight.
+def flush(draft_id: str) -> bool:
+    with _lock:
+        s = _drafts.get(draft_id)
+    if s is None:
+        return False
+    with s["write_lock"]:
+        with _lock:
+            if s["timer"] is not None:
+                s["timer"].cancel()
+                s["timer"] = None
+            text, mac = s["text"], s["mac"]
+            if text is None or mac == s["saved_mac"] or not crypto.is_unlocked():
+                return False
+            s["text"] = s["mac"] = None
+        db.save_draft(draft_id, text, mac)
+        with _lock:
+            s["saved_mac"], s["saved_len"], s["saved_at"] = mac, len(text), time.monotonic()
+    return True
+
+
+def flush_all() -> None:
+    for draft_id in list(_drafts):
+        flush(draft_id)
+
+
+# Stored draft text, or None; used to restore the editor after a reload.
+def load(draft_id: str) -> dict | None:
+    flush(draft_id)
+    return db.get_draft(draft_id)
+
+
+# Drop the draft (the text was saved as an entry, or matches it again). Deletes only if one is stored.
+def discard(draft_id: str) -> None:
+    s = _state(draft_id)
+    with s["write_lock"]:
+        with _lock:
+            if s["timer"] is not None:
+                s["timer"].cancel()
+                s["timer"] = None
+            stored = s["saved_mac"] is not None
+            s["text"] = s["mac"] = s["saved_mac"] = None
+            s["saved_len"] = 0
+        if stored:
+            db.delete_draft(draft_id)
+
+
+def _clear() -> None:
+    with _lock:
+        for s in _drafts.values():
+            if s["timer"] is not None:
+                s["timer"].cancel()
+        _drafts.clear()
+
+
+crypto.add_clear_listener(_clear)
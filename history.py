@@ -0,0 +1,35 @@
+# Entry history UI shared by the Journal editor and the Insights day popup: past versions are listed from
+# metadata and only the chosen one is rebuilt and decrypted.
+from datetime import datetime
+
+import streamlit as st
+
+import analysis
+import db
+
+
+def _label(h: dict) -> str:
+    until = datetime.fromtimestamp(h["savedAt"] / 1000.0)
+    return f"Version {h['rev']} · until {until:%b %d, %Y %H:%M} · {h['chars']} characters"
+
+
+# editor_key is the entry's text area, reset on restore so it shows the restored text.
+def render_history(entry: dict, key_suffix: str, editor_key: str) -> None:
+    history = db.get_entry_history(entry["id"])
+    if not history:
+        return
+    labels = {h["rev"]: _label(h) for h in history}
+    with st.expander(f"History ({len(history)} earlier version{'s' if len(history) != 1 else ''})"):
+        rev = st.selectbox("Version", list(labels), format_func=labels.get, index=None,
+                           placeholder="Choose a version to view", key=f"history_{key_suffix}")
+        if rev is None:
+            return
+        text = db.get_entry_version(entry["id"], rev)
+        st.text_area("Version content", value=text, height=160, disabled=True, key=f"history_text_{key_suffix}_{rev}",
+                     label_visibility="collapsed")
+        if st.button("Restore this version", key=f"history_restore_{key_suffix}"):
+            db.update_entry(entry["id"], {"content": text})
+            analysis.enqueue(entry["id"])
+            st.session_state.pop(editor_key, None)
+            st.session_state.pop(f"history_{key_suffix}", None)
+            st.rerun()
@@ -1,8 +1,11 @@
 # OpenAI integration, prompts, reflection (local + AI).
+import copy
 import json
 import os
 import random
 import re
+import sqlite3
+import threading
 import time
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -10,13 +13,21 @@ from pathlib import Path
 from dotenv import load_dotenv
 
 import crypto
-import sentiment
+import db
+import metering
+import perf
+import providers
 
 load_dotenv(Path(__file__).resolve().parent / ".env")
 STORAGE_DIR = Path(__file__).resolve().parent
 CONFIG_PATH = STORAGE_DIR / ".llm_config.json"
 REFLECTION_PATH = STORAGE_DIR / ".ai_reflection.json"
+POOL_PATH = STORAGE_DIR / ".journal_prompt_pool.json"
 ROTATE_AFTER_MS = 1000 * 60 * 60
+POOL_MAX = 24  # queued prompts kept
+POOL_REFILL_BELOW = 6
+POOL_REFILL_COUNT = 8  # prompts asked of the AI per refill
+POOL_FLUSH_S = 5.0  # pool changes are written this long after the first unsaved one
 
 GENERIC_PROMPTS = [
     "What's one small win from today?",
@@ -40,6 +51,20 @@ def get_server_api_key() -> str | None:
     return os.environ.get("OPENAI_API_KEY") or None
 
 
+# Configured endpoints (providers.normalize), OpenAI with OPENAI_API_KEY unless "providers" is set.
+def get_providers() -> list:
+    return providers.normalize(_config().get("providers"))
+
+
+def has_provider() -> bool:
+    return bool(providers.usable(get_providers()))
+
+
+def get_deadline_s() -> float:
+    return float(_config().get("deadlineS") or providers.DEADLINE_S)
+
+
+@perf.timed("llm.read_config")
 def _config():
     try:
         return json.loads(CONFIG_PATH.read_text()) if CONFIG_PATH.exists() else {}
@@ -57,35 +82,89 @@ def set_use_ai(value: bool) -> None:
     CONFIG_PATH.write_text(json.dumps(c, indent=2))
 
 
+# Token and latency budgets (metering.check_budget); None means unlimited.
+def get_budgets() -> dict:
+    b = _config().get("budgets") or {}
+    return {"dailyTokens": b.get("dailyTokens"), "p95Ms": b.get("p95Ms")}
+
+
+def set_budgets(daily_tokens: int | None, p95_ms: int | None) -> None:
+    c = _config()
+    c["budgets"] = {"dailyTokens": daily_tokens or None, "p95Ms": p95_ms or None}
+    CONFIG_PATH.write_text(json.dumps(c, indent=2))
+
+
+# USD per million (prompt, completion) tokens by model: metering.PRICES overlaid with "prices" from the config.
+def get_prices() -> dict:
+    extra = _config().get("prices") or {}
+    return {**metering.PRICES, **{m: tuple(p) for m, p in extra.items() if isinstance(p, list) and len(p) == 2}}
+
+
+# Why generation should not run now (budget spent or provider too slow), or None.
+def budget_block_reason() -> str | None:
+    return metering.check_budget(get_budgets())
+
+
 def clear_all_llm_keys() -> None:
     c = _config()
     c.pop("useAi", None)
     CONFIG_PATH.write_text(json.dumps(c, indent=2))
 
 
+# Decrypted file contents keyed by path, valid while (mtime_ns, size) is unchanged; any
+# session or process rewriting the file changes the stamp. Dropped on lock.
+_file_cache = {}
+crypto.add_clear_listener(_file_cache.clear)
+
+
 # Read/decrypt JSON from path; returns dict or None.
+@perf.timed("llm.read_file")
 def _read_encrypted(path: Path) -> dict | None:
     key = crypto.get_key()
     if not key or not path.exists():
         return None
     try:
+        info = path.stat()
+        stamp = (info.st_mtime_ns, info.st_size)
+        hit = _file_cache.get(path)
+        if hit is not None and hit[0] == stamp:
+            return copy.deepcopy(hit[1])
         raw = json.loads(path.read_text())
         if "ciphertext" not in raw or "iv" not in raw:
             return None
-        plain = crypto.decrypt(raw["ciphertext"], raw["iv"], key)
-        return json.loads(plain)
+        plain = crypto.decrypt(crypto.from_b64(raw["ciphertext"]), crypto.from_b64(raw["iv"]), key)
+        data = json.loads(plain)
+        _file_cache[path] = (stamp, data)
+        return copy.deepcopy(data)
     except Exception:
         return None
 
 
 # Encrypt and write data as JSON to path.
+@perf.timed("llm.write_file")
 def _write_encrypted(path: Path, data: dict) -> None:
     key = crypto.get_key()
     if not key:
         raise ValueError("Unlock required to save.")
     plain = json.dumps(data, indent=2)
     ciphertext, iv = crypto.encrypt(plain, key)
-    path.write_text(json.dumps({"ciphertext": ciphertext, "iv": iv}))
+    path.write_text(json.dumps({"ciphertext": crypto.to_b64(ciphertext), "iv": crypto.to_b64(iv)}))
+
+
+def _encrypted_files() -> list:
+    return [REFLECTION_PATH, POOL_PATH, STORAGE_DIR / ".journal_last_prompt.json"]
+
+
+# Rewrite every encrypted file under the current key (after a passphrase change). Returns files rewritten.
+def reencrypt_files() -> int:
+    n = 0
+    with _pool_write_lock:  # a pool flush racing the rewrite could be overwritten by the older copy
+        for path in _encrypted_files():
+            data = _read_encrypted(path)
+            if data is not None:
+                _write_encrypted(path, data)
+                n += 1
+    return n
 
 
 def _last_prompt():
@@ -104,42 +183,179 @@ def _last_prompt():
     return None
 
 
-def _set_prompt(text: str) -> None:
-    try:
-        data = {"text": text, "ts": int(time.time() * 1000)}
-        _write_encrypted(STORAGE_DIR / ".journal_last_prompt.json", data)
-        # Remove legacy ts file if present
-        pt = STORAGE_DIR / ".journal_last_prompt_ts.json"
-        if pt.exists():
-            pt.unlink()
-    except Exception:
-        pass
-
-
 def _pick(arr, exclude=None):
     f = [x for x in arr if x != exclude] if exclude else arr
     return random.choice(f) if f else (arr[0] if arr else "")
 
 
-# Return saved AI prompt or generic; rotates hourly unless force_new.
-def get_prompt(force_new: bool = False) -> str:
-    stored = get_stored_reflection()
+# Prompts of a stored reflection; older reflections kept them split by time of day.
+def _reflection_prompts(stored: dict | None) -> list:
     raw = (stored.get("prompts") or []) if stored else []
-    ai_list = raw if isinstance(raw, list) else ((raw.get("afternoon") or []) + (raw.get("evening") or []))
-    last = _last_prompt()
-    now_ms = int(time.time() * 1000)
-    rotate = force_new or not last or (now_ms - last["ts"] > ROTATE_AFTER_MS)
-    if ai_list:
-        if rotate:
-            chosen = _pick(ai_list, last.get("text") if last else None)
-        elif last and last["text"] in ai_list:
-            chosen = last["text"]
-        else:
-            chosen = _pick(ai_list, None)
+    return raw if isinstance(raw, list) else ((raw.get("afternoon") or []) + (raw.get("evening") or []))
+
+
+# Prompt pool: the prompt on show and a bounded queue of upcoming ones, loaded into memory once per unlock
+# and written to POOL_PATH on a timer POOL_FLUSH_S after a change, so showing or rotating a prompt reads no
+# file and runs no cipher. A background job tops the queue up when it runs low. Dropped on lock; the Lock
+# button saves it first (flush_prompt_pool).
+_pool = {"loaded": False, "warming": False, "refilling": False, "queue": [], "current": None, "dirty": False, "timer": None}
+_pool_lock = threading.RLock()
+_pool_write_lock = threading.Lock()
+
+
+# Caller holds _pool_lock. Journals from before the pool start from the last-prompt file and the reflection.
+def _load_pool() -> None:
+    data = _read_encrypted(POOL_PATH)
+    if data is not None:
+        _pool["queue"] = [p for p in data.get("queue") or [] if isinstance(p, str)][:POOL_MAX]
+        _pool["current"] = data.get("current")
     else:
-        chosen = _pick(GENERIC_PROMPTS, last.get("text") if last else None) if rotate else (last["text"] if last else _pick(GENERIC_PROMPTS, None))
-    if rotate or (ai_list and (not last or last["text"] not in ai_list)) or (not ai_list and not last):
-        _set_prompt(chosen)
+        _pool["current"] = _last_prompt()
+        _pool["queue"] = [p for p in _reflection_prompts(get_stored_reflection()) if p][:POOL_MAX]
+        _pool["dirty"] = True
+    _pool["loaded"] = crypto.get_key() is not None  # loaded while locked, it is read again after unlock
+
+
+# Caller holds _pool_lock.
+def _mark_pool_dirty() -> None:
+    _pool["dirty"] = True
+    if _pool["timer"] is None:
+        t = threading.Timer(POOL_FLUSH_S, flush_prompt_pool)
+        t.daemon = True
+        _pool["timer"] = t
+        t.start()
+
+
+def flush_prompt_pool() -> None:
+    with _pool_write_lock:
+        with _pool_lock:
+            _pool["timer"] = None
+            if not (_pool["loaded"] and _pool["dirty"]) or crypto.get_key() is None:
+                return
+            data = {"queue": list(_pool["queue"]), "current": _pool["current"]}
+            _pool["dirty"] = False
+        try:
+            _write_encrypted(POOL_PATH, data)
+        except (ValueError, OSError):
+            return
+        for legacy in (".journal_last_prompt.json", ".journal_last_prompt_ts.json"):
+            (STORAGE_DIR / legacy).unlink(missing_ok=True)
+
+
+def _reset_pool() -> None:
+    with _pool_lock:
+        if _pool["timer"] is not None:
+            _pool["timer"].cancel()
+        _pool.update(loaded=False, warming=False, queue=[], current=None, dirty=False, timer=None)
+
+
+crypto.add_clear_listener(_reset_pool)
+
+
+# Queue prompts (deduplicated, at most POOL_MAX kept); front=True for ones that should be shown next.
+def _add_to_pool(prompts: list, front: bool = False) -> None:
+    with _pool_lock:
+        if not crypto.is_unlocked():
+            return
+        if not _pool["loaded"]:
+            _load_pool()
+        current = (_pool["current"] or {}).get("text")
+        seen = set(_pool["queue"]) | {current}
+        fresh = [p for p in dict.fromkeys(prompts) if p and p not in seen]
+        if not fresh:
+            return
+        queue = fresh + _pool["queue"] if front else _pool["queue"] + fresh
+        _pool["queue"] = queue[:POOL_MAX]
+        _mark_pool_dirty()
+
+
+def _prompts_system_prompt(n: int) -> str:
+    return f"""You are Diary, the user's private journaling companion. Your voice is warm, calm, and non-judgmental.
+
+Using their journal entries from the past 7 days only, write {n} short journal prompts, one per line, each starting with "- ". Each prompt is a single open-ended question or invitation (one line only), e.g. "What felt alive in you today?" Vary them: some about feelings, some about people, some about what comes next. No greetings or other text."""
+
+
+def _parse_prompts(raw: str) -> list:
+    lines = (re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line).strip() for line in raw.split("\n"))
+    return [line for line in lines if line and len(line) <= 200]
+
+
+# New prompts for the pool: from the AI when it is on and within budget, otherwise the generic ones shuffled.
+def _generate_pool_prompts() -> list:
+    available = providers.usable(get_providers()) if get_use_ai() else []
+    if available and budget_block_reason() is None:
+        start_ms, end_ms = get_period_range("week")
+        entries = db.get_entries_by_date_range(start_ms, end_ms)
+        if entries:
+            try:
+                user = _build_user_prompt(entries, 7, "Write the prompts as specified.")
+                raw = providers.complete(available, _prompts_system_prompt(POOL_REFILL_COUNT), user, get_deadline_s(), purpose="prompts")
+                prompts = _parse_prompts(raw)
+                if prompts:
+                    return prompts
+            except RuntimeError:
+                pass
+    return random.sample(GENERIC_PROMPTS, len(GENERIC_PROMPTS))
+
+
+def refill_prompt_pool_in_background() -> bool:
+    with _pool_lock:
+        if _pool["refilling"] or not crypto.is_unlocked():
+            return False
+        _pool["refilling"] = True
+
+    def run():
+        try:
+            _add_to_pool(_generate_pool_prompts())
+        except (ValueError, OSError, sqlite3.Error):
+            pass  # locked mid-refill or storage trouble; the next low pool tries again
+        finally:
+            with _pool_lock:
+                _pool["refilling"] = False
+    threading.Thread(target=run, name="journal-prompt-refill", daemon=True).start()
+    return True
+
+
+# Load the pool on a daemon thread once per unlock, ahead of the first Journal render; cheap to call per rerun.
+def warm_prompt_pool_in_background() -> bool:
+    with _pool_lock:
+        if _pool["loaded"] or _pool["warming"] or not crypto.is_unlocked():
+            return False
+        _pool["warming"] = True
+
+    def run():
+        with _pool_lock:
+            if not _pool["loaded"]:
+                _load_pool()
+            low = len(_pool["queue"]) < POOL_REFILL_BELOW
+        if low:
+            refill_prompt_pool_in_background()
+    threading.Thread(target=run, name="journal-prompt-pool", daemon=True).start()
+    return True
+
+
+# Current prompt, rotated hourly or on force_new to the next queued one (a generic prompt if the queue is
+# empty). Served from memory; only the very first call after unlock may load the pool itself.
+def get_prompt(force_new: bool = False) -> str:
+    with _pool_lock:
+        if not _pool["loaded"]:
+            _load_pool()
+        current = _pool["current"]
+        now_ms = int(time.time() * 1000)
+        if current and not force_new and now_ms - current["ts"] <= ROTATE_AFTER_MS:
+            return current["text"]
+        exclude = current["text"] if current else None
+        queue = _pool["queue"]
+        chosen = next((p for p in queue if p != exclude), None)
+        if chosen is not None:
+            queue.remove(chosen)
+        else:
+            chosen = _pick(GENERIC_PROMPTS, exclude)
+        _pool["current"] = {"text": chosen, "ts": now_ms}
+        _mark_pool_dirty()
+        low = len(queue) < POOL_REFILL_BELOW
+    if low:
+        refill_prompt_pool_in_background()
     return chosen
 
 
@@ -149,19 +365,15 @@ def get_period_range(period: str) -> tuple[int, int]:
     return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
 
 
-def generate_reflection_summary(entries: list, period: str) -> dict:
+# Rule-based summary served from the SQL rollups; cost scales with days in range, not entries.
+def generate_reflection_summary(period: str) -> dict:
     start_ms, end_ms = get_period_range(period)
-    in_range = [e for e in entries if start_ms <= e.get("createdAt", 0) <= end_ms]
     prev_start, prev_end = start_ms - (end_ms - start_ms + 1), start_ms - 1
-    prev_entries = [e for e in entries if prev_start <= e.get("createdAt", 0) <= prev_end]
-    agg = sentiment.aggregate_themes(in_range)
-    top_themes = [a["theme"] for a in agg[:5]]
-
-    def avg_score(arr):
-        with_s = [e for e in arr if e.get("sentimentScore") is not None]
-        return sum(e["sentimentScore"] for e in with_s) / len(with_s) if with_s else 0
+    current = db.get_sentiment_summary(start_ms, end_ms)
+    previous = db.get_sentiment_summary(prev_start, prev_end)
+    top_themes = [a["theme"] for a in db.get_theme_counts(start_ms, end_ms, limit=5)]
 
-    diff = avg_score(in_range) - avg_score(prev_entries)
+    diff = (current["mean"] or 0) - (previous["mean"] or 0)
     trend = "up" if diff > 0.3 else ("down" if diff < -0.3 else "stable")
     highlights = []
     if top_themes:
@@ -170,9 +382,8 @@ def generate_reflection_summary(entries: list, period: str) -> dict:
         highlights.append("Your entries tended to be more positive than the previous period.")
     elif trend == "down":
         highlights.append("Your entries reflected more difficult moments. Journaling can help process them.")
-    pos = [e for e in in_range if e.get("sentimentLabel") == "positive"]
-    if 0 < len(pos) <= 3:
-        tp = sentiment.aggregate_themes(pos)[:2]
+    if 0 < current["labels"]["positive"] <= 3:
+        tp = db.get_theme_counts(start_ms, end_ms, positive_only=True, limit=2)
         if tp:
             highlights.append(f"You felt better when writing about: {' and '.join(a['theme'] for a in tp)}.")
     if not highlights:
@@ -191,12 +402,12 @@ Using their journal entries from the past {n_days} days only:
 Output format: reflection text first, then a blank line, then "PROMPTS:" and the bullet list. Use only the entries provided; do not invent events or dates."""
 
 
-def _build_user_prompt(entries: list, n_days: int) -> str:
+def _build_user_prompt(entries: list, n_days: int, closing: str = "Write the reflection and PROMPTS as specified.") -> str:
     lines = []
     for e in sorted(entries, key=lambda x: x.get("createdAt", 0)):
         ts = e.get("createdAt", 0) / 1000.0
         lines.append(f"[{datetime.fromtimestamp(ts).strftime('%a, %b %d, %Y')}]\n{e.get('content', '')}")
-    return f"Entries from the past {n_days} days:\n\n" + "\n\n---\n\n".join(lines) + "\n\nWrite the reflection and PROMPTS as specified."
+    return f"Entries from the past {n_days} days:\n\n" + "\n\n---\n\n".join(lines) + "\n\n" + closing
 
 
 def _parse_reflection(raw: str) -> dict:
@@ -205,35 +416,25 @@ def _parse_reflection(raw: str) -> dict:
     prompts = []
     if idx >= 0:
         rest = raw[idx + len("PROMPTS:"):].strip()
-        prompts = [re.sub(r"^\s*-\s*", "", line).strip() for line in rest.split("\n") if line.strip()]
+        prompts = _parse_prompts(rest)
     return {"reflection": reflection, "prompts": prompts}
 
 
-def _call_openai(api_key: str, system: str, user: str) -> str:
-    try:
-        from openai import OpenAI
-        client = OpenAI(api_key=api_key)
-        r = client.chat.completions.create(
-            model="gpt-4.1-nano",
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": user},
-            ],
-            max_tokens=800,
-        )
-        text = (r.choices[0].message.content or "").strip()
-        if not text:
-            raise ValueError("Empty response")
-        return text
-    except Exception as e:
-        raise RuntimeError(str(e))
-
-
+# When no provider answers within the deadline the rule-based weekly summary stands in, marked "fallback"
+# (not stored, so a later call can still produce the AI reflection).
 def generate_reflection_with_llm(entries: list) -> dict:
-    key = get_server_api_key()
-    if not key:
-        raise ValueError("OpenAI API key not set. Set OPENAI_API_KEY in .env or environment.")
-    raw = _call_openai(key, _system_prompt(7), _build_user_prompt(entries, 7))
+    available = providers.usable(get_providers())
+    if not available:
+        raise ValueError("No AI provider available. Set OPENAI_API_KEY in .env or environment, "
+                         "or list endpoints under \"providers\" in .llm_config.json.")
+    reason = budget_block_reason()
+    if reason:
+        raise ValueError(reason)
+    try:
+        raw = providers.complete(available, _system_prompt(7), _build_user_prompt(entries, 7), get_deadline_s())
+    except RuntimeError as e:
+        summary = generate_reflection_summary("week")
+        return {"reflection": " ".join(summary["highlights"]), "prompts": [], "fallback": True, "fallbackReason": str(e)}
     return _parse_reflection(raw)
 
 
@@ -261,8 +462,10 @@ def set_stored_reflection(payload: dict):
         "generatedDate": now.strftime("%Y-%m-%d"),
     }
     _write_encrypted(REFLECTION_PATH, data)
+    _add_to_pool(_reflection_prompts(data), front=True)  # the week's own prompts are shown next
 
 
 def clear_stored_reflections():
-    if REFLECTION_PATH.exists():
-        REFLECTION_PATH.unlink()
+    _reset_pool()
+    for path in (REFLECTION_PATH, POOL_PATH):
+        path.unlink(missing_ok=True)
@@ -0,0 +1,160 @@
+# LLM usage, latency and cost metering: every call's model, tokens, wall time and outcome are kept encrypted
+# in journal.db (db.llm_calls), folded into per-day aggregates (db.llm_daily), and checked against the
+# token and latency budgets from .llm_config.json (see llm.get_budgets) before generation runs.
+import bisect
+import math
+import sqlite3
+import time
+from datetime import datetime
+
+import crypto
+import db
+
+RETAIN_DAYS = 90  # individual calls; per-day aggregates are kept for good
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000)  # per-day histogram bounds, plus one slower bucket
+LATENCY_WINDOW = 20  # most recent calls the latency budget is judged on
+DEFER_S = 60 * 60  # while over the latency budget, generation waits this long after the last call
+# USD per million (prompt, completion) tokens; "prices" in .llm_config.json overrides or adds models (local
+# ones can be priced at 0).
+PRICES = {"gpt-4.1-nano": (0.10, 0.40)}
+
+
+def _empty_day() -> dict:
+    return {"calls": 0, "failures": 0, "promptTokens": 0, "completionTokens": 0, "ms": 0,
+            "hist": [0] * (len(LATENCY_BUCKETS_MS) + 1), "models": {}}
+
+
+def _merge(agg: dict | None, call: dict) -> dict:
+    agg = agg or _empty_day()
+    agg["calls"] += 1
+    agg["failures"] += call["outcome"] != "ok"
+    agg["promptTokens"] += call["promptTokens"]
+    agg["completionTokens"] += call["completionTokens"]
+    agg["ms"] += call["ms"]
+    agg["hist"][bisect.bisect_left(LATENCY_BUCKETS_MS, call["ms"])] += 1
+    m = agg["models"].setdefault(call["model"], {"calls": 0, "promptTokens": 0, "completionTokens": 0})
+    m["calls"] += 1
+    m["promptTokens"] += call["promptTokens"]
+    m["completionTokens"] += call["completionTokens"]
+    return agg
+
+
+# Store one call. Metering never fails a generation: without a key or on a database error it is dropped.
+def record(purpose: str, provider: str, model: str, prompt_tokens: int | None, completion_tokens: int | None, ms: float, outcome: str) -> None:
+    if not crypto.get_key():
+        return
+    now = int(time.time() * 1000)
+    call = {"at": now, "purpose": purpose, "provider": provider, "model": model, "promptTokens": int(prompt_tokens or 0),
+            "completionTokens": int(completion_tokens or 0), "ms": round(ms), "outcome": outcome}
+    day = db.get_day_start_ms(now)
+    try:
+        db.add_llm_call(day, call, _merge, day - RETAIN_DAYS * db.MS_DAY_MS)
+    except (sqlite3.Error, ValueError):
+        pass
+
+
+# Nearest-rank percentile of a list of numbers (q in 0..100); None when empty.
+def percentile(values: list, q: float) -> int | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered), max(1, math.ceil(q * len(ordered) / 100))) - 1]
+
+
+# Upper bound of the histogram bucket holding the q-th percentile; None past the last bound (or no calls).
+def _hist_percentile(hist: list, q: float) -> int | None:
+    total = sum(hist)
+    if not total:
+        return None
+    rank, seen = max(1, math.ceil(q * total / 100)), 0
+    for bound, n in zip(LATENCY_BUCKETS_MS + (None,), hist):
+        seen += n
+        if seen >= rank:
+            return bound
+    return None
+
+
+def cost_usd(models: dict, prices: dict) -> float | None:
+    total = 0.0
+    for model, m in models.items():
+        if model not in prices:
+            return None
+        p_in, p_out = prices[model]
+        total += (m["promptTokens"] * p_in + m["completionTokens"] * p_out) / 1_000_000
+    return total
+
+
+# Per-day usage for the last `days` days (today included), newest first. Latency percentiles are exact for
+# days whose calls are still kept and histogram upper bounds ("approx") before that.
+def daily_usage(days: int, prices: dict) -> list:
+    today = db.get_day_start_ms(int(time.time() * 1000))
+    start = today - (days - 1) * db.MS_DAY_MS
+    by_day = {}
+    for call in db.get_llm_calls(start):
+        by_day.setdefault(db.get_day_start_ms(call["at"]), []).append(call["ms"])
+    out = []
+    for agg in reversed(db.get_llm_daily(start)):
+        ms = by_day.get(agg["day"])
+        out.append({
+            "day": datetime.fromtimestamp(agg["day"] / 1000.0).strftime("%Y-%m-%d"),
+            "calls": agg["calls"], "failures": agg["failures"],
+            "promptTokens": agg["promptTokens"], "completionTokens": agg["completionTokens"],
+            "costUsd": cost_usd(agg["models"], prices),
+            "meanMs": agg["ms"] // agg["calls"] if agg["calls"] else None,
+            "p50Ms": percentile(ms, 50) if ms else _hist_percentile(agg["hist"], 50),
+            "p95Ms": percentile(ms, 95) if ms else _hist_percentile(agg["hist"], 95),
+            "approx": not ms,
+            "models": agg["models"],
+        })
+    return out
+
+
+# Everything the Settings view and `python -m cli llm-usage` show: per-day rows, totals, and the
+# recent-latency figures the budget is judged on.
+def usage_report(days: int, prices: dict, budgets: dict) -> dict:
+    rows = daily_usage(days, prices)
+    recent = _recent_calls()
+    costs = [r["costUsd"] for r in rows]
+    return {
+        "days": rows,
+        "totals": {
+            "calls": sum(r["calls"] for r in rows), "failures": sum(r["failures"] for r in rows),
+            "promptTokens": sum(r["promptTokens"] for r in rows),
+            "completionTokens": sum(r["completionTokens"] for r in rows),
+            "costUsd": None if None in costs else sum(costs),
+        },
+        "recent": {"calls": len(recent), "p50Ms": percentile([c["ms"] for c in recent], 50),
+                   "p95Ms": percentile([c["ms"] for c in recent], 95)},
+        "todayTokens": _tokens_today(),
+        "budgets": budgets,
+    }
+
+
+def _recent_calls() -> list:
+    today = db.get_day_start_ms(int(time.time() * 1000))
+    return db.get_llm_calls(today - db.MS_DAY_MS)[-LATENCY_WINDOW:]
+
+
+def _tokens_today() -> int:
+    today = db.get_day_start_ms(int(time.time() * 1000))
+    rows = db.get_llm_daily(today, today)
+    return rows[0]["promptTokens"] + rows[0]["completionTokens"] if rows else 0
+
+
+# Why generation should not run now, or None. budgets: {"dailyTokens": int | None, "p95Ms": int | None}.
+# A spent token budget skips generation until tomorrow; a p95 over the latency budget defers it until
+# DEFER_S after the last call, which then probes whether the provider has recovered.
+def check_budget(budgets: dict) -> str | None:
+    daily_tokens, p95_budget = budgets.get("dailyTokens"), budgets.get("p95Ms")
+    if daily_tokens:
+        used = _tokens_today()
+        if used >= daily_tokens:
+            return f"Today's AI token budget is used up ({used:,} of {daily_tokens:,} tokens). Generation resumes tomorrow."
+    if p95_budget:
+        recent = _recent_calls()
+        p95 = percentile([c["ms"] for c in recent], 95)
+        retry_at = recent[-1]["at"] / 1000.0 + DEFER_S if recent else 0
+        if p95 is not None and p95 > p95_budget and time.time() < retry_at:
+            return (f"AI responses have been slow (p95 {p95 / 1000:.1f} s, budget {p95_budget / 1000:.1f} s). "
+                    f"Generation is deferred until {datetime.fromtimestamp(retry_at):%H:%M}.")
+    return None
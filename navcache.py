@@ -0,0 +1,161 @@
+# Navigation cache for the Insights day popup and month grid: the viewed day's and month's neighbours are
+# decrypted on a background thread after each view, so paging through days or months is a memory hit.
+# Bounded LRU with a TTL; kept in step with writes (revision-aware) and cleared on lock.
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import crypto
+import db
+
+MAX_ITEMS = 64
+TTL_S = 120.0
+PREFETCH_DAYS = 3  # days either side of the viewed one
+PREFETCH_MONTHS = 1
+
+logger = logging.getLogger("dear_diary.navcache")
+_lock = threading.Lock()
+_items = OrderedDict()  # ("day", day_ms) | ("month", month_start) -> (value, expires_at)
+_state = {"rev": None, "want": None, "worker": None}
+_wake = threading.Condition(_lock)
+
+
+def _get(key):
+    now = time.monotonic()
+    with _lock:
+        hit = _items.get(key)
+        if hit is None:
+            return None
+        if hit[1] < now:
+            del _items[key]
+            return None
+        _items.move_to_end(key)
+        return hit[0]
+
+
+def _put(key, value, rev: int) -> None:
+    with _lock:
+        if _state["rev"] != rev:
+            return  # a write landed while this was being read
+        _items[key] = (value, time.monotonic() + TTL_S)
+        _items.move_to_end(key)
+        while len(_items) > MAX_ITEMS:
+            _items.popitem(last=False)
+
+
+# Drop everything if journal.db moved past what the cache has seen (another session or process wrote).
+def _sync(rev: int) -> None:
+    with _lock:
+        if _state["rev"] != rev:
+            _items.clear()
+            _state["rev"] = rev
+
+
+def _month_after(month_start: int) -> int:
+    return db.get_month_start_ms(month_start + 32 * db.MS_DAY_MS)
+
+
+def _month_before(month_start: int) -> int:
+    return db.get_month_start_ms(month_start - 1)
+
+
+def _load_day(day_ms: int) -> list:
+    return db.get_entries_by_date_range(day_ms, day_ms + db.MS_DAY_MS - 1)
+
+
+def _load_month(month_start: int) -> dict:
+    rollups = db.get_sentiment_rollups("day", month_start, _month_after(month_start) - 1)
+    return {r["start"]: r for r in rollups}
+
+
+def _cached(key, load, arg):
+    rev = db.get_revision()
+    _sync(rev)
+    value = _get(key)
+    if value is None:
+        value = load(arg)
+        _put(key, value, rev)
+    return value
+
+
+# Entries on the day starting at day_ms, newest first (as db.get_entries_by_date_range).
+def get_day(day_ms: int) -> list:
+    return list(_cached(("day", day_ms), _load_day, day_ms))
+
+
+# {day_ms: rollup} for the month starting at month_start.
+def get_month(month_start: int) -> dict:
+    return _cached(("month", month_start), _load_month, month_start)
+
+
+def _fill(day_ms, month_start) -> None:
+    keys = []
+    if day_ms is not None:
+        for i in range(1, PREFETCH_DAYS + 1):
+            keys += [("day", day_ms + i * db.MS_DAY_MS), ("day", day_ms - i * db.MS_DAY_MS)]
+    if month_start is not None:
+        after = before = month_start
+        for _ in range(PREFETCH_MONTHS):
+            after, before = _month_after(after), _month_before(before)
+            keys += [("month", after), ("month", before)]
+    for kind, value in keys:
+        with _lock:
+            if _state["want"] is not None or not crypto.is_unlocked():
+                return  # a newer view superseded this one, or the journal was locked
+        if _get((kind, value)) is None:
+            _cached((kind, value), _load_day if kind == "day" else _load_month, value)
+
+
+def _worker() -> None:
+    while True:
+        with _lock:
+            while _state["want"] is None:
+                _wake.wait()
+            want, _state["want"] = _state["want"], None
+        # Best effort: a miss just falls back to a query on the next click.
+        try:
+            _fill(*want)
+        except (ValueError, sqlite3.Error):
+            pass  # locked or busy mid-fill
+        except Exception:
+            logger.exception("navigation prefetch failed")
+
+
+# Queue neighbours of the viewed day and/or month for background decryption; the latest call wins.
+def prefetch(day_ms: int | None = None, month_start: int | None = None) -> None:
+    if not crypto.is_unlocked():
+        return
+    with _lock:
+        _state["want"] = (day_ms, month_start)
+        if _state["worker"] is None:
+            _state["worker"] = threading.Thread(target=_worker, name="journal-navcache", daemon=True)
+            _state["worker"].start()
+        _wake.notify()
+
+
+def clear() -> None:
+    with _lock:
+        _items.clear()
+        _state["rev"] = None
+        _state["want"] = None
+
+
+# Writes from this process invalidate only the affected day and month; a missed revision drops everything.
+def _on_write(event: dict) -> None:
+    with _lock:
+        if _state["rev"] not in (event["revision"] - 1, event["revision"]) or "createdAt" not in event:
+            _items.clear()
+            _state["rev"] = event["revision"]
+            return
+        _state["rev"] = event["revision"]
+        created = event["createdAt"]
+        for kind, start in list(_items):
+            # Day keys are whatever the popup navigated to (not always a local midnight across DST).
+            if (start <= created < start + db.MS_DAY_MS) if kind == "day" else start == db.get_month_start_ms(created):
+                del _items[(kind, start)]
+
+
+db.add_write_listener(_on_write)
+crypto.add_clear_listener(clear)
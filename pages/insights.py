@@ -1,92 +1,129 @@
-# Insights tab: calendar, day popup, recurring themes.
-import streamlit as st
-import pandas as pd
-from datetime import datetime, timedelta
+# Insights tab: calendar, year heatmap, day popup, trends, recurring themes.
 from calendar import monthrange
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+import streamlit.components.v1 as components
 
+import analysis
+import analytics
 import db
-import sentiment
+import history
+import navcache
+
+YEAR_DAYS = 365
+TREND_RANGES = {"Day": ("day", 30), "Week": ("week", 26 * 7), "Month": ("month", 365)}
+
+# Month grid and year heatmap render as one iframe each and report clicks as one value.
+_mood_calendar = components.declare_component(
+    "mood_calendar", path=str(Path(__file__).resolve().parent.parent / "components" / "mood_calendar")
+)
+
 
-EMOJI = {"positive": "☺️", "neutral": "😐", "negative": "☹️"}
+def _day_label(rollup):
+    labels = rollup["labels"]
+    if not any(labels.values()):
+        return "neutral"
+    return max(db.SENTIMENT_LABELS, key=lambda lbl: labels[lbl])
 
 
-def _day_sentiments(entries):
-    out = {}
-    for e in entries:
-        day_ms = db.get_day_start_ms(e["createdAt"])
-        if day_ms not in out:
-            out[day_ms] = e.get("sentimentLabel") or "neutral"
-    return out
+# One aggregate query: {day_ms: rollup} for days in [start_ms, end_ms].
+def _day_rollups(start_ms, end_ms):
+    return {r["start"]: r for r in db.get_sentiment_rollups("day", start_ms, end_ms)}
 
 
-def _render_calendar(write_dates, day_sentiments, month_start, on_month, on_day):
-    write_set = set(write_dates)
+def _month_start_ms(y, m):
+    return int(datetime(y, m, 1).timestamp() * 1000)
+
+
+# Consume a click from a calendar component once; its value persists across reruns.
+def _take_click(key):
+    value = st.session_state.get(key)
+    if not value or value.get("nonce") == st.session_state.get(f"{key}_seen"):
+        return None
+    st.session_state[f"{key}_seen"] = value["nonce"]
+    return value
+
+
+def _render_calendar(month_start, selected_day):
     dt = datetime.fromtimestamp(month_start / 1000.0)
     y, m = dt.year, dt.month
     pad = (datetime(y, m, 1).weekday() + 1) % 7
     _, ndays = monthrange(y, m)
-    st.markdown(f"**{dt.strftime('%B %Y')}**")
-    col_prev, col_next = st.columns(2)
-    with col_prev:
-        if st.button("← Previous month", key="cal_prev"):
-            prev = datetime(y, m, 1) - timedelta(days=1)
-            on_month(int(datetime(prev.year, prev.month, 1).timestamp() * 1000))
-    with col_next:
-        if st.button("Next month →", key="cal_next"):
-            nxt = datetime(y, m + 1, 1) if m < 12 else datetime(y + 1, 1, 1)
-            on_month(int(nxt.timestamp() * 1000))
-    weekdays = ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]
-    header_cols = st.columns(7)
-    for i, wd in enumerate(weekdays):
-        with header_cols[i]:
-            st.markdown(f'<p class="insights-cal-weekday">{wd}</p>', unsafe_allow_html=True)
+    first = _month_start_ms(y, m)
+    nxt = _month_start_ms(y + 1, 1) if m == 12 else _month_start_ms(y, m + 1)
+    prev = datetime(y, m, 1) - timedelta(days=1)
+    days = navcache.get_month(first)
     cells = [None] * pad
     for d in range(1, ndays + 1):
-        cell_dt = datetime(y, m, d)
-        cells.append((d, int(cell_dt.replace(hour=0, minute=0, second=0, microsecond=0).timestamp() * 1000)))
+        day_ms = int(datetime(y, m, d).timestamp() * 1000)
+        r = days.get(day_ms)
+        cells.append({"day": d, "ms": day_ms, "label": _day_label(r) if r else None})
     while len(cells) % 7:
         cells.append(None)
-    for i in range(0, len(cells), 7):
-        row, cols = cells[i:i + 7], st.columns(7)
-        for j, cell in enumerate(row):
-            with cols[j]:
-                if cell is None:
-                    st.write("")
-                else:
-                    day_num, day_ms = cell
-                    lbl = day_sentiments.get(day_ms)
-                    em = EMOJI.get(lbl, "") if lbl else ""
-                    if st.button(f"{day_num} {em}".strip(), key=f"cal_{day_ms}"):
-                        on_day(day_ms)
-                        st.rerun()
-
-
-def _render_day_popup(day_ms, on_close, on_prev, on_next):
-    entries_list = db.get_entries_by_date_range(day_ms, day_ms + db.MS_DAY_MS - 1)
+    _mood_calendar(
+        mode="month",
+        title=dt.strftime("%B %Y"),
+        cells=cells,
+        prev_month=_month_start_ms(prev.year, prev.month),
+        next_month=nxt,
+        today=db.get_day_start_ms(int(datetime.now().timestamp() * 1000)),
+        selected=selected_day,
+        key="insights_calendar",
+        default=None,
+    )
+
+
+def _render_year_heatmap():
+    st.markdown("### Year at a glance")
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = today - timedelta(days=YEAR_DAYS - 1)
+    start -= timedelta(days=(start.weekday() + 1) % 7)  # align columns to Sunday
+    days = _day_rollups(int(start.timestamp() * 1000), int(today.timestamp() * 1000) + db.MS_DAY_MS - 1)
+    cells, d = [], start
+    while d <= today:
+        day_ms = int(d.timestamp() * 1000)
+        r = days.get(day_ms)
+        cells.append({"ms": day_ms, "date": d.strftime("%b %d, %Y"), "count": r["count"] if r else 0, "mean": r["mean"] if r else None})
+        d += timedelta(days=1)
+    _mood_calendar(
+        mode="year",
+        cells=cells,
+        legend=f"{len(days)} days written in the last year. Green is brighter days, red harder ones.",
+        key="insights_year",
+        default=None,
+    )
+
+
+def _select_day(day_ms):
+    st.session_state.insights_selected_day = day_ms
+
+
+# Its own fragment: day navigation and Close rerun only the popup, and navcache has usually decrypted the
+# neighbouring days already. Writes rerun the whole app, since the calendar, heatmap, trends and themes
+# all change with them.
+@st.fragment
+def _render_day_popup():
+    day_ms = st.session_state.insights_selected_day
+    if day_ms is None:
+        return
+    entries_list = navcache.get_day(day_ms)
     entry = entries_list[0] if entries_list else None
     key_suffix = str(day_ms)
     day_str = datetime.fromtimestamp(day_ms / 1000.0).strftime("%A, %B %d, %Y")
 
+    st.markdown("---")
     st.markdown(f"### {day_str}")
-    if st.button("× Close", key=f"close_{key_suffix}"):
-        on_close()
-        st.rerun()
+    st.button("× Close", key=f"close_{key_suffix}", on_click=_select_day, args=(None,))
 
     if not entry:
         st.markdown("No entry for this day. Add one below.")
         content = st.text_area("Entry content", key=f"new_{key_suffix}", height=160, placeholder="What happened that day?")
         if st.button("Add entry", key=f"add_{key_suffix}") and (content or "").strip():
-            sent_result = sentiment.analyze_sentiment(content.strip())
-            themes = sentiment.extract_themes(content.strip())
-            db.insert_entry({
-                "content": content.strip(),
-                "createdAt": day_ms,
-                "sentimentScore": sent_result["score"],
-                "sentimentLabel": sent_result["label"],
-                "themes": themes,
-            })
-            st.session_state.entries_changed = st.session_state.get("entries_changed", 0) + 1
-            on_close()
+            analysis.enqueue(db.insert_entry({"content": content.strip(), "createdAt": day_ms})["id"])
+            _select_day(None)
             st.rerun()
     else:
         content = st.text_area("Entry content", value=entry["content"], key=f"edit_{key_suffix}", height=160)
@@ -94,76 +131,108 @@ def _render_day_popup(day_ms, on_close, on_prev, on_next):
         with btn_col1:
             if st.button("Save", key=f"save_{key_suffix}"):
                 if (content or "").strip() and content.strip() != entry.get("content", ""):
-                    sent_result = sentiment.analyze_sentiment(content.strip())
-                    themes = sentiment.extract_themes(content.strip())
-                    db.update_entry(entry["id"], {
-                        "content": content.strip(),
-                        "sentimentScore": sent_result["score"],
-                        "sentimentLabel": sent_result["label"],
-                        "themes": themes,
-                    })
-                    st.session_state.entries_changed = st.session_state.get("entries_changed", 0) + 1
-                st.rerun()
+                    db.update_entry(entry["id"], {"content": content.strip()})
+                    analysis.enqueue(entry["id"])
+                    st.rerun()
         with btn_col2:
             if st.button("Remove entry", key=f"rm_{key_suffix}"):
                 db.delete_entry(entry["id"])
-                st.session_state.entries_changed = st.session_state.get("entries_changed", 0) + 1
-                on_close()
+                _select_day(None)
                 st.rerun()
+        history.render_history(entry, key_suffix, f"edit_{key_suffix}")
 
     nav_col1, nav_col2 = st.columns(2)
     with nav_col1:
-        if st.button("← Previous day", key=f"prev_{key_suffix}"):
-            on_prev()
-            st.rerun()
+        st.button("← Previous day", key=f"prev_{key_suffix}", on_click=_select_day, args=(day_ms - db.MS_DAY_MS,))
     with nav_col2:
-        if st.button("Next day →", key=f"next_{key_suffix}"):
-            on_next()
-            st.rerun()
+        st.button("Next day →", key=f"next_{key_suffix}", on_click=_select_day, args=(day_ms + db.MS_DAY_MS,))
+    navcache.prefetch(day_ms, st.session_state.insights_month_start)
+
+
+@st.fragment
+def _render_mood_trend():
+    st.markdown("### Mood over time")
+    st.caption("Average mood score per period (−5 to 5).")
+    choice = st.radio("Group by", list(TREND_RANGES), index=1, horizontal=True, key="insights_trend_period", label_visibility="collapsed")
+    period, span_days = TREND_RANGES[choice]
+    end_ms = int(datetime.now().timestamp() * 1000)
+    rollups = [r for r in db.get_sentiment_rollups(period, end_ms - span_days * db.MS_DAY_MS, end_ms) if r["mean"] is not None]
+    if len(rollups) < 2:
+        st.caption("Write on a few more days to see your mood trend.")
+        return
+    df = pd.DataFrame({
+        "Period": [datetime.fromtimestamp(r["start"] / 1000.0) for r in rollups],
+        "Mood": [r["mean"] for r in rollups],
+    }).set_index("Period")
+    st.line_chart(df, y="Mood", x_label=choice, y_label="Mood")
+
+
+def _render_patterns():
+    cols = analytics.get_columns()
+    if len(cols) < 7:
+        return
+    st.markdown("### Patterns")
+    days, rolling = analytics.rolling_mood(cols, window=30)
+    if len(days) > 1:
+        st.caption("30-day rolling mood average.")
+        st.line_chart(pd.DataFrame({"Date": pd.to_datetime(days), "Mood": rolling}).set_index("Date"), y="Mood", y_label="Mood")
+    week = analytics.weekday_pattern(cols)
+    st.caption("Average mood by weekday.")
+    # An ordered categorical keeps Monday..Sunday order; bar_chart would otherwise sort the labels alphabetically.
+    weekdays = pd.CategoricalIndex(week["weekday"], categories=week["weekday"], ordered=True, name="Weekday")
+    st.bar_chart(pd.DataFrame({"Mood": week["mean"]}, index=weekdays), y="Mood", x_label="Weekday", y_label="Mood")
+    pairs = analytics.top_theme_pairs(cols)
+    if pairs:
+        st.caption("Themes that often appear together: " + ", ".join(f"{a} + {b} ({p['count']})" for p in pairs for a, b in [p["pair"]]))
+
+
+def _apply_click(click):
+    if click and click["action"] == "month":
+        st.session_state.insights_month_start = click["value"]
+    elif click and click["action"] == "day":
+        st.session_state.insights_selected_day = click["value"]
+        day = datetime.fromtimestamp(click["value"] / 1000.0)
+        st.session_state.insights_month_start = _month_start_ms(day.year, day.month)
+
+
+# Month grid plus the day popup: month navigation and day clicks rerun this fragment (one rollup query),
+# not the page.
+@st.fragment
+def _render_calendar_section():
+    # Apply the click before rendering so it costs a single rerun.
+    _apply_click(_take_click("insights_calendar"))
+    _render_calendar(st.session_state.insights_month_start, st.session_state.insights_selected_day)
+    _render_day_popup()
+    if st.session_state.insights_selected_day is None:
+        navcache.prefetch(month_start=st.session_state.insights_month_start)
+
+
+@st.fragment
+def _render_themes():
+    st.markdown("### Recurring themes")
+    st.caption("Topics that appear often. Top 5 below.")
+    theme_data = db.get_theme_counts(limit=5)
+    if theme_data:
+        st.bar_chart(pd.DataFrame(theme_data).set_index("theme"), y="count", x_label="Theme", y_label="Count")
+    else:
+        st.caption("Write more entries to see themes here.")
 
 
 def render():
-    write_dates = db.get_write_dates()
-    entries = db.get_all_entries()
-    day_sentiments = _day_sentiments(entries)
-
     if "insights_month_start" not in st.session_state:
         now = datetime.now()
-        st.session_state.insights_month_start = int(datetime(now.year, now.month, 1).timestamp() * 1000)
+        st.session_state.insights_month_start = _month_start_ms(now.year, now.month)
     if "insights_selected_day" not in st.session_state:
         st.session_state.insights_selected_day = None
 
+    # Year heatmap clicks move the month grid and open the popup, so they are applied on the full rerun.
+    _apply_click(_take_click("insights_year"))
+
     st.markdown("### Entries by day")
     st.caption("Click a date to view or edit that day's entry.")
+    _render_calendar_section()
 
-    def on_month_change(ms):
-        st.session_state.insights_month_start = ms
-        st.rerun()
-
-    def on_day_click(ms):
-        st.session_state.insights_selected_day = ms
-        st.rerun()
-
-    def on_close():
-        st.session_state.insights_selected_day = None
-        st.rerun()
-
-    _render_calendar(write_dates, day_sentiments, st.session_state.insights_month_start, on_month_change, on_day_click)
-
-    selected = st.session_state.insights_selected_day
-    if selected is not None:
-        st.markdown("---")
-        _render_day_popup(
-            selected,
-            on_close,
-            lambda: setattr(st.session_state, "insights_selected_day", selected - db.MS_DAY_MS),
-            lambda: setattr(st.session_state, "insights_selected_day", selected + db.MS_DAY_MS),
-        )
-
-    st.markdown("### Recurring themes")
-    st.caption("Topics that appear often. Top 5 below.")
-    theme_data = sentiment.aggregate_themes(entries)[:5]
-    if theme_data:
-        st.bar_chart(pd.DataFrame(theme_data).set_index("theme"), y="count", x_label="Theme", y_label="Count")
-    else:
-        st.caption("Write more entries to see themes here.")
+    _render_year_heatmap()
+    _render_mood_trend()
+    _render_patterns()
+    _render_themes()
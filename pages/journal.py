@@ -1,42 +1,86 @@
 # Journal tab: daily prompt and entry editor.
-import streamlit as st
 from datetime import datetime
 
+import streamlit as st
+
+import analysis
 import db
+import drafts
+import history
 import llm
-import sentiment
+import related
+
+RELATED_COUNT = 3
+SNIPPET_CHARS = 160
+
+
+def _render_related(content, today_entry):
+    exclude = {today_entry["id"]} if today_entry else None
+    matches = related.find_related(content or "", RELATED_COUNT, exclude)
+    if not matches:
+        return
+    with st.expander("Related past entries"):
+        by_id = {e["id"]: e for e in db.get_entries_by_ids([eid for eid, _ in matches])}
+        for eid, _ in matches:
+            e = by_id.get(eid)
+            if not e:
+                continue
+            day_str = datetime.fromtimestamp(e["createdAt"] / 1000.0).strftime("%A, %B %d, %Y")
+            snippet = e["content"] if len(e["content"]) <= SNIPPET_CHARS else e["content"][:SNIPPET_CHARS].rstrip() + "…"
+            st.markdown(f"**{day_str}**")
+            st.caption(snippet)
+
+
+def _new_prompt():
+    st.session_state.prompt_force_new = 1
+
+
+# Its own fragment: "Get another prompt" reruns only the card, not the editor or the page.
+@st.fragment
+def _render_prompt():
+    force_new = st.session_state.pop("prompt_force_new", 0) > 0
+    st.markdown("**Today's prompt**")
+    st.info(llm.get_prompt(force_new=force_new))
+    col1, _ = st.columns([1, 3])
+    with col1:
+        st.button("Get another prompt", on_click=_new_prompt)
 
 
 def render():
-    entries = db.get_all_entries()
     today_start = db.get_day_start_ms(int(datetime.now().timestamp() * 1000))
-    today_entry = next((e for e in entries if db.get_day_start_ms(e["createdAt"]) == today_start), None)
+    today_entries = db.get_entries_by_date_range(today_start, today_start + db.MS_DAY_MS - 1)
+    today_entry = today_entries[0] if today_entries else None
 
-    ai_enabled = llm.get_use_ai() and bool(llm.get_server_api_key())
+    ai_enabled = llm.get_use_ai() and llm.has_provider()
     today_reflection = llm.get_stored_reflection()
     today_date_str = datetime.now().strftime("%Y-%m-%d")
-    force_new = st.session_state.pop("prompt_force_new", 0) > 0
-    display_prompt = llm.get_prompt(force_new=force_new)
 
-    st.markdown("**Today's prompt**")
-    st.info(display_prompt)
-    col1, _ = st.columns([1, 3])
-    with col1:
-        if st.button("Get another prompt"):
-            st.session_state.prompt_force_new = 1
-            st.rerun()
+    _render_prompt()
 
     # Entry text area
     st.markdown("**Your thoughts**")
     content_key = "journal_content_" + (today_entry["id"] if today_entry else "new")
+    draft_id = today_entry["id"] if today_entry else f"new_{today_start}"
+    saved_text = today_entry["content"] if today_entry else ""
+    initial, restored = saved_text, None
+    if content_key not in st.session_state:
+        # First render of this editor (e.g. after a reload): bring back unsaved text.
+        draft = drafts.load(draft_id)
+        if draft and draft["content"].strip() != saved_text.strip():
+            initial, restored = draft["content"], draft["updatedAt"]
     content = st.text_area(
         "Journal content",
-        value=today_entry["content"] if today_entry else "",
+        value=initial,
         placeholder="Write freely—no one else will see this.",
         height=140,
         key=content_key,
         label_visibility="collapsed",
     )
+    if restored:
+        st.caption(f"Restored an unsaved draft from {datetime.fromtimestamp(restored / 1000.0).strftime('%H:%M')}.")
+    drafts.note(draft_id, content, saved_text)
+
+    _render_related(content, today_entry)
 
     def _on_submit():
         trimmed = (content or "").strip()
@@ -46,26 +90,11 @@ def render():
             if not trimmed:
                 db.delete_entry(today_entry["id"])
             else:
-                sent_result = sentiment.analyze_sentiment(trimmed)
-                themes = sentiment.extract_themes(trimmed)
-                db.update_entry(
-                    today_entry["id"],
-                    {
-                        "content": trimmed,
-                        "sentimentScore": sent_result["score"],
-                        "sentimentLabel": sent_result["label"],
-                        "themes": themes,
-                    },
-                )
+                db.update_entry(today_entry["id"], {"content": trimmed})
+                analysis.enqueue(today_entry["id"])
         elif trimmed:
-            sent_result = sentiment.analyze_sentiment(trimmed)
-            themes = sentiment.extract_themes(trimmed)
-            db.create_entry(trimmed, {
-                "sentimentScore": sent_result["score"],
-                "sentimentLabel": sent_result["label"],
-                "themes": themes,
-            })
-        st.session_state.entries_changed = st.session_state.get("entries_changed", 0) + 1
+            analysis.enqueue(db.create_entry(trimmed)["id"])
+        drafts.discard(draft_id)
         st.rerun()
 
     btn_label = "Saving…"
@@ -77,21 +106,29 @@ def render():
         btn_label = "Save entry"
     if st.button(btn_label, type="primary"):
         _on_submit()
+    if today_entry:
+        history.render_history(today_entry, "journal", content_key)
 
     # auto-generate AI reflection when opening app
-    if ai_enabled and entries and (not today_reflection or today_reflection.get("generatedDate") != today_date_str):
+    if ai_enabled and (not today_reflection or today_reflection.get("generatedDate") != today_date_str):
         if "generating_reflection" not in st.session_state:
             st.session_state.generating_reflection = False
-        if not st.session_state.generating_reflection:
+        # Over a token or latency budget the reflection is skipped for now, not reported as an error.
+        deferred = llm.budget_block_reason() if not st.session_state.generating_reflection else None
+        if deferred:
+            st.caption(deferred)
+        elif not st.session_state.generating_reflection:
             start_ms, end_ms = llm.get_period_range("week")
-            in_range = [e for e in entries if start_ms <= e["createdAt"] <= end_ms]
+            in_range = db.get_entries_by_date_range(start_ms, end_ms)
             if in_range:
                 st.session_state.generating_reflection = True
                 try:
                     result = llm.generate_reflection_with_llm(in_range)
-                    llm.set_stored_reflection(result)
                     st.session_state.generating_reflection = False
-                    st.rerun()
+                    # A deadline miss is retried on a later render, once the slow providers' back-off ends.
+                    if not result.get("fallback"):
+                        llm.set_stored_reflection(result)
+                        st.rerun()
                 except Exception as e:
                     st.session_state.generating_reflection = False
                     st.error(str(e))
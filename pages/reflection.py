@@ -1,14 +1,15 @@
 # Reflection tab: AI (Diary) week-in-reflection.
-import streamlit as st
 from datetime import datetime
 
+import streamlit as st
+
 import db
 import llm
 
 
 def render():
     entries = db.get_all_entries()
-    ai_enabled = llm.get_use_ai() and bool(llm.get_server_api_key())
+    ai_enabled = llm.get_use_ai() and llm.has_provider()
     stored = llm.get_stored_reflection()
 
     if ai_enabled:
@@ -26,9 +27,15 @@ def render():
                 with st.spinner("Generating…"):
                     try:
                         result = llm.generate_reflection_with_llm(in_range)
-                        llm.set_stored_reflection(result)
-                        st.success("Reflection generated.")
-                        st.rerun()
+                        if result.get("fallback"):
+                            st.info("Diary didn't answer in time, so here is a summary from your entries instead. "
+                                    "Try again in a little while.")
+                            st.caption(result["fallbackReason"])
+                            st.write(result["reflection"])
+                        else:
+                            llm.set_stored_reflection(result)
+                            st.success("Reflection generated.")
+                            st.rerun()
                     except Exception as e:
                         st.error(str(e))
     else:
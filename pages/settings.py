@@ -1,26 +1,190 @@
-# Settings tab: AI toggle, export/import, data reset.
+# Settings tab: AI toggle and usage, export/import, passphrase change, backups, performance stats, data reset.
 import json
-import streamlit as st
+import sqlite3
+import tempfile
 from datetime import datetime
 
+import pandas as pd
+import streamlit as st
+
+import archive
 import auth
+import backup
+import crypto
 import db
 import llm
-import sentiment
+import metering
+import providers
+import rotation
+import transfer
+
+
+def _run_rotation():
+    bar = st.progress(0.0)
+    note = st.empty()
+
+    def progress(done, total, rate):
+        bar.progress(min(done / total, 1.0) if total else 1.0)
+        note.caption(f"{done:,} of {total:,} items re-encrypted · {rate:,.0f} items/s")
+    try:
+        rotation.run(progress=progress)
+    except ValueError as e:
+        st.error(str(e))
+        return
+    if rotation.status() is None:
+        bar.progress(1.0)
+        st.success("Passphrase changed.")
+
+
+def _render_passphrase():
+    st.markdown("### Passphrase")
+    status = rotation.status()
+    if status is not None:
+        st.info(f"Passphrase change in progress: {status['done']:,} of {status['total']:,} items re-encrypted. "
+                "Either passphrase unlocks the journal until it finishes.")
+        if st.button("Continue now", key="rotation_resume_btn", disabled=rotation.is_running()):
+            _run_rotation()
+        return
+    st.caption("Entries are re-encrypted under the new passphrase in small batches. Backups made before the change still need the old one.")
+    with st.form("change_passphrase"):
+        old = st.text_input("Current passphrase", type="password", key="rot_old")
+        new1 = st.text_input("New passphrase", type="password", placeholder="At least 8 characters", key="rot_new1")
+        new2 = st.text_input("Confirm new passphrase", type="password", key="rot_new2")
+        submitted = st.form_submit_button("Change passphrase")
+    if submitted:
+        if len(new1) < 8:
+            st.error("Passphrase must be at least 8 characters.")
+        elif new1 != new2:
+            st.error("Passphrases do not match.")
+        elif new1 == old:
+            st.error("The new passphrase is the same as the current one.")
+        else:
+            try:
+                auth.begin_passphrase_change(old, new1)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                _run_rotation()
+
+
+def _render_backups():
+    st.markdown("### Backups")
+    st.caption("Encrypted copies of your journal database, taken daily while the app is open. Older copies are rotated out.")
+    if st.button("Back up now", key="backup_now_btn"):
+        bar = st.progress(0.0)
+        path = backup.create_backup(lambda done, total: bar.progress(done / total if total else 1.0))
+        st.success(f"Saved {path.name}.")
+    backups = backup.list_backups()
+    if not backups:
+        st.caption("No backups yet.")
+        return
+    choice = st.selectbox(
+        "Backup", backups, key="backup_choice",
+        format_func=lambda p: f"{p.name} ({p.stat().st_size / 1024:.0f} KB)",
+    )
+    if st.button("Restore this backup", key="backup_restore_btn"):
+        st.session_state.backup_restore_confirm = str(choice)
+    if st.session_state.get("backup_restore_confirm") == str(choice):
+        st.warning("Replace your current journal with this backup? The current one is backed up first.")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Yes, restore", key="backup_restore_confirm_btn"):
+                try:
+                    backup.restore_backup(choice)
+                except (ValueError, sqlite3.Error, OSError) as e:
+                    st.error(str(e))
+                else:
+                    # The restored vault may use a different passphrase.
+                    crypto.clear_key()
+                    st.session_state.backup_restore_confirm = None
+                    st.session_state.has_vault = None
+                    st.session_state.unlocked = False
+                    st.rerun()
+        with col2:
+            if st.button("Cancel", key="backup_restore_cancel"):
+                st.session_state.backup_restore_confirm = None
+                st.rerun()
 
 
-def _export_entries(entries):
-    out = []
-    for e in entries:
-        out.append({
-            "id": e.get("id"),
-            "content": e.get("content", ""),
-            "createdAt": e.get("createdAt"),
-            "sentimentScore": e.get("sentimentScore"),
-            "sentimentLabel": e.get("sentimentLabel"),
-            "themes": e.get("themes") or [],
-        })
-    return json.dumps(out, indent=2)
+def _render_performance():
+    st.markdown("### Performance")
+    st.caption("Time spent in the database, encryption, sentiment analysis, files and AI during the previous page load.")
+    enabled = st.toggle("Collect performance stats", value=st.session_state.get("perf_enabled", False), key="perf_toggle")
+    if enabled != st.session_state.get("perf_enabled", False):
+        st.session_state.perf_enabled = enabled
+        st.session_state.pop("perf_last", None)
+        st.rerun()
+    last = st.session_state.get("perf_last")
+    if not enabled or not last:
+        return
+    st.caption(f"{last['label'] or 'Page'} load: {last['wall_ms']:.0f} ms total.")
+    rows = [{"Hook": name, "Calls": h["calls"], "Total ms": round(h["total_ms"], 1), "Rows": h["rows"]} for name, h in last["hooks"].items()]
+    if rows:
+        st.dataframe(pd.DataFrame(rows).set_index("Hook"))
+
+
+def _ms(v):
+    return "–" if v is None else f"{v / 1000:.1f} s"
+
+
+def _render_ai_usage():
+    st.markdown("### AI usage")
+    report = metering.usage_report(30, llm.get_prices(), llm.get_budgets())
+    budgets, recent = report["budgets"], report["recent"]
+    cost = report["totals"]["costUsd"]
+    st.caption(f"Today: {report['todayTokens']:,} tokens"
+               + (f" of {budgets['dailyTokens']:,}" if budgets["dailyTokens"] else "")
+               + f" · last {recent['calls']} calls: p50 {_ms(recent['p50Ms'])}, p95 {_ms(recent['p95Ms'])}"
+               + (f" · 30 days: ${cost:,.4f}" if cost is not None else ""))
+    if report["days"]:
+        rows = [{"Day": d["day"], "Calls": d["calls"], "Failed": d["failures"], "Prompt tokens": d["promptTokens"],
+                 "Completion tokens": d["completionTokens"],
+                 "Cost $": None if d["costUsd"] is None else round(d["costUsd"], 4),
+                 "p50": ("≤ " if d["approx"] else "") + _ms(d["p50Ms"]),
+                 "p95": ("≤ " if d["approx"] else "") + _ms(d["p95Ms"])} for d in report["days"]]
+        st.dataframe(pd.DataFrame(rows).set_index("Day"))
+    configured = llm.get_providers()
+    usable = {p["name"] for p in providers.usable(configured)}
+    rows = [{"Provider": p["name"], "Model": p["model"], "Endpoint": p["baseUrl"] or "OpenAI",
+             "Latency (EWMA)": "–" if p["ewmaMs"] is None else f"{p['ewmaMs'] / 1000:.1f} s",
+             "Status": ("no API key" if p["name"] not in usable else
+                        f"backing off ({p['retryInS']:.0f} s)" if p["retryInS"] else "ready")}
+            for p in providers.status(configured)]
+    if rows:
+        st.caption(f"Requests go to the fastest ready provider; with no answer within {llm.get_deadline_s():g} s "
+                   "a summary from your entries is shown instead.")
+        st.dataframe(pd.DataFrame(rows).set_index("Provider"))
+    st.caption("Budgets: past the daily tokens, generation is skipped until tomorrow; while the p95 of recent "
+               "calls is over the latency budget, automatic generation waits an hour between attempts. 0 means no limit.")
+    with st.form("ai_budgets"):
+        col1, col2 = st.columns(2)
+        tokens = col1.number_input("Daily token budget", min_value=0, step=1000, value=budgets["dailyTokens"] or 0)
+        p95_s = col2.number_input("p95 latency budget (seconds)", min_value=0.0, step=1.0,
+                                  value=(budgets["p95Ms"] or 0) / 1000)
+        if st.form_submit_button("Save budgets"):
+            llm.set_budgets(int(tokens), int(p95_s * 1000))
+            st.rerun()
+
+
+# Built on request like the JSON export. write_archive streams entries into a temporary file, but the finished
+# archive is then held in memory, because Streamlit serves downloads from memory. Only `python -m cli export`
+# streams the archive end to end, so large journals should be exported with the CLI.
+def _render_archive_export(has_entries: bool) -> None:
+    st.caption("Or download an encrypted archive, protected by a separate passphrase you choose now.")
+    passphrase = st.text_input("Archive passphrase", type="password", key="export_archive_pass")
+
+    if st.button("Prepare encrypted archive", key="export_archive_btn", disabled=not (has_entries and passphrase)):
+        with tempfile.TemporaryFile() as out:
+            archive.write_archive(out, passphrase)
+            out.seek(0)
+            data = out.read()
+        st.download_button(
+            "Download encrypted archive",
+            data=data,
+            file_name=f"journal-export-{datetime.now().strftime('%Y-%m-%d')}{archive.EXTENSION}",
+            mime="application/octet-stream",
+            key="download_archive",
+        )
 
 
 def render():
@@ -33,12 +197,13 @@ def render():
     if use_ai != llm.get_use_ai():
         llm.set_use_ai(use_ai)
         st.rerun()
+    _render_ai_usage()
 
     st.markdown("### Export your data")
-    st.caption("Download all entries as JSON. Encrypted—only you can read it.")
+    st.caption("Download all entries as plain JSON. Anyone with the file can read it.")
     entries = db.get_all_entries()
     if st.button("Export as JSON", key="export_btn", disabled=not entries):
-        data = _export_entries(entries)
+        data = transfer.export_entries(entries)
         st.download_button(
             "Download JSON",
             data=data,
@@ -46,63 +211,35 @@ def render():
             mime="application/json",
             key="download_export",
         )
+    _render_archive_export(bool(entries))
 
     st.markdown("### Import data")
-    st.caption("Import from a previously exported JSON. Same date: content is merged below.")
-    uploaded = st.file_uploader("Choose a JSON file", type=["json"], key="import_file")
-    if uploaded and st.button("Import from JSON", key="import_btn"):
+    st.caption("Import from a previously exported JSON or encrypted archive. Same date: content is merged below.")
+    uploaded = st.file_uploader("Choose a file", type=["json", archive.EXTENSION.lstrip(".")], key="import_file")
+    is_archive = uploaded is not None and archive.is_archive(uploaded.getvalue()[:len(archive.MAGIC)])
+    archive_passphrase = st.text_input("Archive passphrase", type="password", key="import_archive_pass") if is_archive else ""
+    if uploaded and st.button("Import", key="import_btn"):
         try:
+            if is_archive:
+                imported = archive.import_archive(uploaded, archive_passphrase)
+                st.success(f"Imported {imported} entries.")
+                st.rerun()
             text = uploaded.read().decode("utf-8")
             data = json.loads(text)
             list_data = data if isinstance(data, list) else []
             if not list_data:
                 st.warning("No entries found in file.")
             else:
-                existing = db.get_all_entries()
-                day_to_entry = {}
-                for e in existing:
-                    day = db.get_day_start_ms(e["createdAt"])
-                    if day not in day_to_entry:
-                        day_to_entry[day] = e
-                imported = 0
-                for item in list_data:
-                    content = (item.get("content") or "").strip()
-                    created_at = item.get("createdAt") or int(datetime.now().timestamp() * 1000)
-                    if not content:
-                        continue
-                    day = db.get_day_start_ms(created_at)
-                    existing_entry = day_to_entry.get(day)
-                    if existing_entry:
-                        if (existing_entry.get("content") or "").strip() == content:
-                            continue
-                        merged = (existing_entry.get("content") or "").strip() + "\n\n" + content
-                        sent_result = sentiment.analyze_sentiment(merged)
-                        themes = sentiment.extract_themes(merged)
-                        db.update_entry(existing_entry["id"], {
-                            "content": merged,
-                            "sentimentScore": sent_result["score"],
-                            "sentimentLabel": sent_result["label"],
-                            "themes": themes,
-                        })
-                        day_to_entry[day] = {**existing_entry, "content": merged}
-                    else:
-                        sent_result = sentiment.analyze_sentiment(content)
-                        themes = sentiment.extract_themes(content)
-                        new_entry = db.insert_entry({
-                            "content": content,
-                            "createdAt": created_at,
-                            "sentimentScore": sent_result["score"],
-                            "sentimentLabel": sent_result["label"],
-                            "themes": themes,
-                        })
-                        day_to_entry[day] = new_entry
-                    imported += 1
-                st.session_state.entries_changed = st.session_state.get("entries_changed", 0) + 1
+                imported = transfer.import_entries(list_data)
                 st.success(f"Imported {imported} entries.")
                 st.rerun()
         except Exception as e:
             st.error(str(e))
 
+    _render_passphrase()
+    _render_backups()
+    _render_performance()
+
     st.markdown("### Delete all data")
     st.caption("Permanently delete all entries. Export before deletion. This cannot be undone.")
     if "delete_confirm" not in st.session_state:
@@ -114,7 +251,7 @@ def render():
         col1, col2 = st.columns(2)
         with col1:
             if st.button("Yes, export and delete", key="delete_confirm_btn"):
-                data = _export_entries(db.get_all_entries())
+                data = transfer.export_entries(db.get_all_entries())
                 db.clear_all_entries()
                 llm.clear_all_llm_keys()
                 llm.clear_stored_reflections()
@@ -122,7 +259,6 @@ def render():
                 st.session_state.has_vault = False
                 st.session_state.unlocked = False
                 st.session_state.delete_confirm = False
-                st.session_state.entries_changed = 0
                 st.success("All data deleted. Download your export below if you haven't.")
                 st.download_button("Download backup", data=data, file_name=f"journal-backup-{datetime.now().strftime('%Y-%m-%d')}.json", mime="application/json", key="backup_dl")
                 st.rerun()
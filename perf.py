@@ -0,0 +1,108 @@
+# Hot-path timing hooks aggregated per Streamlit rerun; a thread-local check when disabled.
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("dear_diary.perf")
+ALWAYS_ON = os.environ.get("DIARY_PERF", "").lower() in ("1", "true", "yes")
+
+
+class _RerunState(threading.local):
+    stats = None  # class default keeps the disabled check a plain attribute read
+    started = 0.0
+
+
+_local = _RerunState()
+_count_lock = threading.Lock()
+_active_reruns = 0  # reruns currently collecting; zero means every hook is a single global read
+
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+
+def is_active() -> bool:
+    return _local.stats is not None
+
+
+def record(name: str, seconds: float, rows: int = 0) -> None:
+    stats = _local.stats
+    if stats is None:
+        return
+    s = stats.get(name)
+    if s is None:
+        s = stats[name] = [0, 0.0, 0]
+    s[0] += 1
+    s[1] += seconds
+    s[2] += rows
+
+
+# Decorator; rows(result) -> int counts rows or items touched by the call.
+def timed(name: str, rows=None):
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _active_reruns or _local.stats is None:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            result = fn(*args, **kwargs)
+            record(name, time.perf_counter() - t0, rows(result) if rows else 0)
+            return result
+        return wrapper
+    return deco
+
+
+@contextmanager
+def span(name: str, rows: int = 0):
+    if not _active_reruns or _local.stats is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - t0, rows)
+
+
+def _set_active(active: bool) -> None:
+    global _active_reruns
+    if active == (_local.stats is not None):
+        return
+    with _count_lock:
+        _active_reruns += 1 if active else -1
+
+
+def begin_rerun(enabled: bool = False) -> None:
+    if enabled or ALWAYS_ON:
+        _set_active(True)
+        _local.stats = {}
+        _local.started = time.perf_counter()
+    else:
+        _set_active(False)
+        _local.stats = None
+
+
+# Ends the rerun: logs one structured line and returns the summary (None when disabled).
+def end_rerun(label: str = "") -> dict | None:
+    stats = _local.stats
+    if stats is None:
+        return None
+    _set_active(False)
+    _local.stats = None
+    summary = {
+        "event": "rerun",
+        "label": label,
+        "wall_ms": round((time.perf_counter() - _local.started) * 1000, 3),
+        "hooks": {
+            name: {"calls": calls, "total_ms": round(secs * 1000, 3), "rows": rows}
+            for name, (calls, secs, rows) in sorted(stats.items(), key=lambda kv: -kv[1][1])
+        },
+    }
+    logger.info(json.dumps(summary))
+    return summary
@@ -0,0 +1,161 @@
+# OpenAI-compatible chat endpoints ("providers" in .llm_config.json; OpenAI alone by default) and routing
+# between them: healthy endpoints are tried fastest first by latency EWMA, a failing one backs off, and one
+# request never runs past its deadline. Every call is metered (metering.record).
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import crypto
+import db
+import metering
+import perf
+
+DEFAULT_MODEL = "gpt-4.1-nano"
+DEFAULT_PROVIDERS = [{"name": "openai", "model": DEFAULT_MODEL, "apiKeyEnv": "OPENAI_API_KEY"}]
+DEADLINE_S = 8.0  # whole request, all attempts; "deadlineS" in .llm_config.json overrides
+MIN_ATTEMPT_S = 0.5  # with less time left than this, stop and let the caller fall back
+SLOW_FACTOR = 3  # an attempt that is not the last gets this many times the endpoint's usual latency
+MAX_TOKENS = 800
+EWMA_ALPHA = 0.3
+BACKOFF_S = 30  # skip an endpoint this long after a failure, doubling per consecutive failure
+MAX_BACKOFF_S = 15 * 60
+
+logger = logging.getLogger("dear_diary.providers")
+# Per-endpoint latency and health for this process, keyed by provider name; seeded once from metered calls.
+_stats = {}
+_lock = threading.Lock()
+_seeded = False
+
+
+# Config entries as {"name", "baseUrl", "model", "apiKeyEnv"}. No apiKeyEnv means a local endpoint without a key.
+def normalize(entries: list | None) -> list:
+    out = []
+    for p in entries if entries is not None else DEFAULT_PROVIDERS:
+        if not isinstance(p, dict) or not p.get("model"):
+            continue
+        base = p.get("baseUrl") or None
+        name = p.get("name") or (urlparse(base).netloc if base else "openai")
+        out.append({"name": name, "baseUrl": base, "model": p["model"], "apiKeyEnv": p.get("apiKeyEnv") or None})
+    return out
+
+
+# Providers that can be called: local ones, and remote ones whose key variable is set.
+def usable(providers: list) -> list:
+    return [p for p in providers if not p["apiKeyEnv"] or os.environ.get(p["apiKeyEnv"])]
+
+
+def _fold(name: str, ms: float) -> dict:
+    s = _stats.setdefault(name, {"ewmaMs": None, "failures": 0, "retryAt": 0.0})
+    s["ewmaMs"] = ms if s["ewmaMs"] is None else EWMA_ALPHA * ms + (1 - EWMA_ALPHA) * s["ewmaMs"]
+    return s
+
+
+# A timeout folds in the time waited: a lower bound, but enough to push the endpoint down the order.
+def _observe(name: str, ms: float, ok: bool) -> None:
+    with _lock:
+        s = _fold(name, ms)
+        if ok:
+            s["failures"], s["retryAt"] = 0, 0.0
+        else:
+            s["failures"] += 1
+            s["retryAt"] = time.monotonic() + min(MAX_BACKOFF_S, BACKOFF_S * 2 ** (s["failures"] - 1))
+
+
+# Latency from the last day's metered calls, so a restart does not have to rediscover which endpoint is fast.
+def _seed() -> None:
+    global _seeded
+    if _seeded or not crypto.get_key():
+        return
+    _seeded = True
+    try:
+        calls = db.get_llm_calls(db.get_day_start_ms(int(time.time() * 1000)) - db.MS_DAY_MS)
+    except Exception:
+        logger.exception("could not seed provider latency from metered calls")
+        return
+    with _lock:
+        for c in calls:
+            if c.get("provider") and c["outcome"] == "ok":
+                _fold(c["provider"], c["ms"])
+
+
+# Healthy providers, fastest first; ones never measured go first (in config order) so they get measured.
+def route(providers: list) -> list:
+    now = time.monotonic()
+    with _lock:
+        stats = {p["name"]: dict(_stats.get(p["name"]) or {"ewmaMs": None, "retryAt": 0.0}) for p in providers}
+    healthy = [p for p in providers if stats[p["name"]]["retryAt"] <= now]
+    return sorted(healthy, key=lambda p: stats[p["name"]]["ewmaMs"] or 0.0)
+
+
+# For Settings: each provider with its latency estimate and whether it is backing off.
+def status(providers: list) -> list:
+    now = time.monotonic()
+    with _lock:
+        stats = {p["name"]: dict(_stats.get(p["name"]) or {"ewmaMs": None, "failures": 0, "retryAt": 0.0}) for p in providers}
+    return [{**p, "ewmaMs": stats[p["name"]]["ewmaMs"], "failures": stats[p["name"]]["failures"],
+             "retryInS": max(0.0, stats[p["name"]]["retryAt"] - now)} for p in providers]
+
+
+@perf.timed("llm.openai")
+def _call(p: dict, system: str, user: str, timeout_s: float, purpose: str) -> str:
+    model, usage, outcome = p["model"], None, "error"
+    t0 = time.perf_counter()
+    try:
+        from openai import OpenAI
+        # Local servers ignore the key, but the client requires one.
+        api_key = os.environ.get(p["apiKeyEnv"]) if p["apiKeyEnv"] else "local"
+        client = OpenAI(api_key=api_key, base_url=p["baseUrl"], timeout=timeout_s, max_retries=0)
+        r = client.chat.completions.create(
+            model=p["model"],
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": user},
+            ],
+            max_tokens=MAX_TOKENS,
+        )
+        model, usage = r.model or p["model"], r.usage
+        text = (r.choices[0].message.content or "").strip()
+        if not text:
+            outcome = "empty"
+            raise ValueError("Empty response")
+        outcome = "ok"
+        return text
+    except Exception as e:
+        if "Timeout" in type(e).__name__:
+            outcome = "timeout"
+        raise RuntimeError(str(e)) from e
+    finally:
+        ms = (time.perf_counter() - t0) * 1000
+        _observe(p["name"], ms, outcome == "ok")
+        metering.record(purpose, p["name"], model, getattr(usage, "prompt_tokens", 0),
+                        getattr(usage, "completion_tokens", 0), ms, outcome)
+
+
+# Completion text from the first provider (in route order) that answers within the deadline. Raises
+# RuntimeError naming what went wrong when none does, so the caller can serve its local fallback.
+def complete(providers: list, system: str, user: str, deadline_s: float = DEADLINE_S, purpose: str = "reflection") -> str:
+    _seed()
+    end = time.monotonic() + deadline_s
+    errors = []
+    candidates = route(providers)
+    for i, p in enumerate(candidates):
+        left = end - time.monotonic()
+        if left < MIN_ATTEMPT_S:
+            errors.append(f"{p['name']}: no time left within the {deadline_s:g} s deadline")
+            break
+        # A stalled endpoint gives up early enough for the next one; an unmeasured one gets an even share.
+        timeout = left
+        if i < len(candidates) - 1:
+            with _lock:
+                ewma = _stats.get(p["name"], {}).get("ewmaMs")
+            share = SLOW_FACTOR * ewma / 1000 if ewma else left / (len(candidates) - i)
+            timeout = min(left, max(MIN_ATTEMPT_S, share))
+        try:
+            return _call(p, system, user, timeout, purpose)
+        except RuntimeError as e:
+            errors.append(f"{p['name']}: {e}")
+    if not candidates:
+        errors.append("every provider is backing off after recent failures")
+    raise RuntimeError("; ".join(errors))
@@ -0,0 +1,158 @@
+# Local TF-IDF index over entry terms for "related past entries"; no network, no full-journal decrypt.
+import heapq
+import math
+import threading
+
+import crypto
+import db
+import sentiment
+
+MAX_QUERY_TERMS = 12
+MAX_DF_RATIO = 0.1
+MAX_CANDIDATES = 2000
+BACKFILL_BATCH = 200
+NORM_REFRESH_RATIO = 0.1
+
+
+def _tf(count: int) -> float:
+    return 1.0 + math.log(count)
+
+
+# In-memory inverted index; term vectors are persisted encrypted in db.entry_terms.
+class RelatedIndex:
+    def __init__(self, docs: dict | None = None):
+        self.docs = {}
+        self.postings = {}
+        self.norms = {}
+        self._norm_n = 0
+        self.rev = None
+        for eid, counts in (docs or {}).items():
+            self.add(eid, counts)
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log((1 + len(self.docs)) / (1 + df)) + 1.0
+
+    def add(self, eid: str, counts: dict) -> None:
+        self.remove(eid)
+        self.docs[eid] = counts
+        for t in counts:
+            self.postings.setdefault(t, set()).add(eid)
+
+    def remove(self, eid: str) -> None:
+        counts = self.docs.pop(eid, None)
+        self.norms.pop(eid, None)
+        for t in counts or ():
+            ids = self.postings.get(t)
+            if ids is not None:
+                ids.discard(eid)
+                if not ids:
+                    del self.postings[t]
+
+    def _norm(self, eid: str) -> float:
+        # Norms use the idf of the moment they were computed; refreshed when the corpus drifts.
+        if abs(len(self.docs) - self._norm_n) > NORM_REFRESH_RATIO * max(self._norm_n, 10):
+            self.norms.clear()
+            self._norm_n = len(self.docs)
+        n = self.norms.get(eid)
+        if n is None:
+            n = self.norms[eid] = math.sqrt(sum((_tf(c) * self.idf(t)) ** 2 for t, c in self.docs[eid].items())) or 1.0
+        return n
+
+    # Top-k (eid, cosine) for the query counts. Candidates come from the postings of the rarest, highest-weight
+    # query terms; common terms (over MAX_DF_RATIO of entries) only add to candidates' scores, unless the query
+    # has no rarer term, as on a small or single-topic journal.
+    def query(self, counts: dict, k: int = 3, exclude: set | None = None) -> list:
+        n_docs = len(self.docs)
+        if not counts or not n_docs:
+            return []
+        weights = {t: _tf(c) * self.idf(t) for t, c in counts.items() if t in self.postings}
+        terms = sorted(weights, key=lambda t: -weights[t])[:MAX_QUERY_TERMS]
+        seeds = {t for t in terms if len(self.postings[t]) <= max(MAX_DF_RATIO * n_docs, 1)} or set(terms)
+        acc = {}
+        for t in terms:
+            idf, qw = self.idf(t), weights[t]
+            # Highest-weight terms first; once the candidate budget is spent, only rescore known candidates.
+            if t in seeds and len(acc) < MAX_CANDIDATES:
+                for eid in self.postings[t]:
+                    acc[eid] = acc.get(eid, 0.0) + qw * _tf(self.docs[eid][t]) * idf
+            else:
+                postings = self.postings[t]
+                for eid in acc:
+                    if eid in postings:
+                        acc[eid] += qw * _tf(self.docs[eid][t]) * idf
+        for eid in exclude or ():
+            acc.pop(eid, None)
+        if not acc:
+            return []
+        q_norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        best = heapq.nlargest(k, acc.items(), key=lambda kv: kv[1] / self._norm(kv[0]))
+        return [(eid, score / (self._norm(eid) * q_norm)) for eid, score in best]
+
+
+_lock = threading.Lock()
+_index: RelatedIndex | None = None
+
+
+# Term vectors for entries saved before the index existed; decrypts each old entry once. Returns entries indexed.
+def backfill() -> int:
+    done = 0
+    while True:
+        ids = db.get_unindexed_entry_ids(BACKFILL_BATCH)
+        if not ids:
+            return done
+        for e in db.get_entries_by_ids(ids):
+            db.save_entry_terms(e["id"], sentiment.term_counts(e["content"]))
+        done += len(ids)
+
+
+def get_index() -> RelatedIndex:
+    global _index
+    rev = db.get_revision()
+    with _lock:
+        if _index is None or _index.rev != rev:
+            backfill()
+            _index = RelatedIndex(db.get_all_entry_terms())
+            _index.rev = rev
+        return _index
+
+
+def find_related(text: str, k: int = 3, exclude: set | None = None) -> list:
+    counts = sentiment.term_counts(text)
+    if not counts:
+        return []
+    index = get_index()
+    with _lock:
+        return index.query(counts, k, exclude)
+
+
+def clear() -> None:
+    global _index
+    with _lock:
+        _index = None
+
+
+def _on_write(event: dict) -> None:
+    global _index
+    op = event["op"]
+    if op == "upsert" and "content" in event:
+        counts = sentiment.term_counts(event["content"])
+        db.save_entry_terms(event["id"], counts)
+    with _lock:
+        if _index is None:
+            return
+        if _index.rev not in (event["revision"] - 1, event["revision"]):
+            _index = None  # missed a write from another session or process
+        elif op == "upsert":
+            if "content" in event:
+                _index.add(event["id"], counts)
+            _index.rev = event["revision"]
+        elif op == "delete":
+            _index.remove(event["id"])
+            _index.rev = event["revision"]
+        else:
+            _index = None
+
+
+db.add_write_listener(_on_write)
+crypto.add_clear_listener(clear)
@@ -0,0 +1,36 @@
+# Word-level deltas for entry revision history (db.entry_revisions). A delta rebuilds one version from the
+# next newer one: a JSON list of [start, end] character spans copied from that text and literal insertions.
+import difflib
+import json
+import re
+
+SNAPSHOT_EVERY = 16  # every Nth revision is stored whole, so a rebuild applies at most N - 1 deltas
+_TOKEN = re.compile(r"\s+|\S+")  # words and the whitespace between them; joined, they give the text back
+
+
+def make_delta(base: str, target: str) -> str:
+    a, b = _TOKEN.findall(base), _TOKEN.findall(target)
+    offsets = [0]
+    for t in a:
+        offsets.append(offsets[-1] + len(t))
+    # Most edits touch one place (an appended paragraph, an import merge): match the shared ends directly.
+    head = 0
+    while head < min(len(a), len(b)) and a[head] == b[head]:
+        head += 1
+    tail = 0
+    while tail < min(len(a), len(b)) - head and a[-1 - tail] == b[-1 - tail]:
+        tail += 1
+    ops = [[0, offsets[head]]] if head else []
+    matcher = difflib.SequenceMatcher(None, a[head:len(a) - tail], b[head:len(b) - tail])
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([offsets[head + i1], offsets[head + i2]])
+        elif j2 > j1:
+            ops.append("".join(b[head + j1:head + j2]))
+    if tail:
+        ops.append([offsets[len(a) - tail], offsets[len(a)]])
+    return json.dumps(ops, ensure_ascii=False, separators=(",", ":"))
+
+
+def apply_delta(base: str, delta: str) -> str:
+    return "".join(base[op[0]:op[1]] if isinstance(op, list) else op for op in json.loads(delta))
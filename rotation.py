@@ -0,0 +1,81 @@
+# Passphrase change: re-encrypt every encrypted table and file under the new key in small batches.
+# auth.begin_passphrase_change starts it; progress is checkpointed in db.key_rotation, so it resumes after a crash.
+import sqlite3
+import threading
+import time
+
+import crypto
+import db
+import llm
+
+_lock = threading.Lock()
+_running = False
+
+
+def status() -> dict | None:
+    rot = db.get_key_rotation()
+    if rot is None:
+        return None
+    return {"done": rot["done_rows"], "total": rot["total_rows"], "table": rot["table_name"], "startedAt": rot["started_at"]}
+
+
+# Re-encrypt from the checkpoint to the end. progress(done, total, rows_per_s) is called after each batch.
+# Memory stays at one batch; each batch is its own short transaction. Returns rows re-encrypted.
+def run(batch_size: int = db.ROTATION_BATCH, progress=None, pause_s: float = 0.0) -> int:
+    global _running
+    with _lock:
+        if _running:
+            raise ValueError("The passphrase change is already running.")
+        _running = True
+    try:
+        return _run(batch_size, progress, pause_s)
+    finally:
+        with _lock:
+            _running = False
+
+
+def _run(batch_size, progress, pause_s) -> int:
+    rot = db.get_key_rotation()
+    if rot is None:
+        return 0
+    new_key, old_key = crypto.get_key(), crypto.get_previous_key()
+    if not (new_key and old_key):
+        raise ValueError("Unlock required to continue the passphrase change.")
+    tables = [t for t, _ in db.ENCRYPTED_TABLES]
+    done, total, t0, rewritten = rot["done_rows"], rot["total_rows"], time.perf_counter(), 0
+    for table, col in db.ENCRYPTED_TABLES[tables.index(rot["table_name"]):]:
+        if table != rot["table_name"]:
+            db.advance_key_rotation(table)
+        while crypto.get_key() is new_key:
+            n = db.reencrypt_batch(table, col, batch_size, old_key, new_key)
+            if n is None:
+                break
+            rewritten += n
+            done = db.get_key_rotation()["done_rows"]
+            if progress:
+                progress(done, total, rewritten / max(time.perf_counter() - t0, 1e-9))
+            time.sleep(pause_s)
+        if crypto.get_key() is not new_key:
+            return rewritten  # locked mid-way; resumes after the next unlock
+    llm.reencrypt_files()
+    db.finish_key_rotation()
+    crypto.set_previous_key(None)
+    return rewritten
+
+
+# Finish an interrupted passphrase change on a daemon thread after unlock; cheap to call per rerun.
+def resume_in_background() -> bool:
+    if crypto.get_previous_key() is None or _running:
+        return False
+
+    def work():
+        try:
+            run(pause_s=0.01)
+        except (ValueError, sqlite3.Error):
+            pass
+    threading.Thread(target=work, name="journal-key-rotation", daemon=True).start()
+    return True
+
+
+def is_running() -> bool:
+    return _running
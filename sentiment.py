@@ -1,6 +1,14 @@
 # Sentiment (VADER) and theme extraction for journal entries.
+import hashlib
 import re
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+import string
+from bisect import bisect_right
+from importlib import metadata
+from types import SimpleNamespace
+
+from vaderSentiment.vaderSentiment import BOOSTER_DICT, SentimentIntensityAnalyzer
+
+import perf
 
 _analyzer = SentimentIntensityAnalyzer()
 
@@ -31,14 +39,32 @@ STOPWORDS = frozenset([
 
 MAX_THEMES_PER_ENTRY = 8
 MIN_WORD_LENGTH = 2
+ANALYSIS_REVISION = 1  # bump when the scoring or theme code below changes
+
+
+# Short hash of everything that shapes stored results; rows scored under another version get re-scored.
+def _analyzer_version() -> str:
+    try:
+        vader = metadata.version("vaderSentiment")
+    except metadata.PackageNotFoundError:
+        vader = "unknown"
+    parts = [str(ANALYSIS_REVISION), vader, str(MAX_THEMES_PER_ENTRY), str(MIN_WORD_LENGTH), ",".join(sorted(STOPWORDS))]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:12]
+
 
+ANALYZER_VERSION = _analyzer_version()
 
+
+@perf.timed("sentiment.analyze_sentiment")
 def analyze_sentiment(text: str) -> dict:
     if not (text or "").strip():
         return {"score": 0, "comparative": 0, "label": "neutral"}
-    s = _analyzer.polarity_scores(text.strip())
-    score = s["compound"] * 5
-    comparative = s["compound"]
+    return _from_compound(_analyzer.polarity_scores(text.strip())["compound"])
+
+
+def _from_compound(compound: float) -> dict:
+    score = compound * 5
+    comparative = compound
     label = "neutral"
     if comparative > 0.1:
         label = "positive"
@@ -51,24 +77,181 @@ def _normalize(word: str) -> str:
     return word.lower().replace("'", "").strip()
 
 
-def extract_themes(text: str) -> list:
+# Normalized, stopword-filtered terms in text order; shared by themes and the related-entries index.
+def extract_terms(text: str) -> list:
     if not (text or "").strip():
         return []
-    text = text.strip()
-    words = re.findall(r"[a-zA-Z'][a-zA-Z0-9']*|[a-zA-Z]{2,}", text)
+    words = re.findall(r"[a-zA-Z'][a-zA-Z0-9']*|[a-zA-Z]{2,}", text.strip())
     terms = []
-    stop = STOPWORDS 
+    stop = STOPWORDS
     for w in words:
         n = _normalize(w)
         if len(n) >= MIN_WORD_LENGTH and n not in stop:
             terms.append(n)
+    return terms
+
+
+def term_counts(text: str) -> dict:
     counts = {}
-    for t in terms:
+    for t in extract_terms(text):
         counts[t] = counts.get(t, 0) + 1
+    return counts
+
+
+@perf.timed("sentiment.extract_themes")
+def extract_themes(text: str) -> list:
+    counts = term_counts(text)
     sorted_terms = sorted(counts.items(), key=lambda x: -x[1])[:MAX_THEMES_PER_ENTRY]
     return [t for t, _ in sorted_terms]
 
 
+# Entry metadata fields for text, tagged with the analyzer version.
+def analyze(text: str) -> dict:
+    s = analyze_sentiment(text)
+    return {"sentimentScore": s["score"], "sentimentLabel": s["label"], "themes": extract_themes(text),
+            "analyzerVersion": ANALYZER_VERSION}
+
+
+# --- Paragraph-level incremental analysis ---
+# VADER scores tokens of text.split(), and paragraphs are joined by whitespace, so the entry's token list is
+# the concatenation of its paragraphs' tokens. A token's valence depends only on tokens i-3..i+2 and the
+# entry-wide "some but not all caps" flag; the compound score is the sum of valences after the entry-wide
+# "but" rule, plus an amplifier from the entry's "!" and "?" counts. So per-paragraph records (sparse
+# valences, edge tokens, first "but", punctuation counts, term counts) recombine into exactly the result of
+# analyze(), and an edit only re-scores changed paragraphs plus the few tokens next to paragraph edges.
+
+PARAGRAPH_SEP = "\n\n"
+_EDGE = 5  # tokens kept from each paragraph edge: enough for every window that crosses an edge
+
+
+# VADER's emoji-to-description pass (polarity_scores), applied per paragraph.
+def _demojize(text: str) -> str:
+    out, prev_space = [], True
+    for ch in text:
+        if ch in _analyzer.emojis:
+            if not prev_space:
+                out.append(" ")
+            out.append(_analyzer.emojis[ch])
+            prev_space = False
+        else:
+            out.append(ch)
+            prev_space = ch == " "
+    return "".join(out)
+
+
+def _tokens(text: str) -> list:
+    return [_strip_token(w) for w in text.split()]
+
+
+# SentiText._strip_punc_if_word
+def _strip_token(token: str) -> str:
+    stripped = token.strip(string.punctuation)
+    return token if len(stripped) <= 2 else stripped
+
+
+# Valence of tokens[i] as polarity_scores computes it before the "but" rule.
+def _valence_at(tokens: list, i: int, cap_diff: bool) -> float:
+    item = tokens[i]
+    low = item.lower()
+    if low in BOOSTER_DICT:
+        return 0
+    if i < len(tokens) - 1 and low == "kind" and tokens[i + 1].lower() == "of":
+        return 0
+    senti = SimpleNamespace(words_and_emoticons=tokens, is_cap_diff=cap_diff)
+    return _analyzer.sentiment_valence(0, senti, item, i, [])[-1]
+
+
+# Each token is scored on its own 6-token window, keeping the cost linear in the paragraph length.
+def _valences(tokens: list, cap_diff: bool) -> dict:
+    out = {}
+    for i in range(len(tokens)):
+        lo = max(0, i - 3)
+        v = _valence_at(tokens[lo:i + 3], i - lo, cap_diff)
+        if v:
+            out[i] = v
+    return out
+
+
+def _paragraph_record(text: str) -> dict:
+    plain = _demojize(text)
+    tokens = _tokens(plain)
+    lower = [t.lower() for t in tokens]
+    return {
+        "n": len(tokens),
+        "upper": sum(1 for t in tokens if t.isupper()),
+        "tokens": tokens,  # dropped before the record is stored
+        "head": tokens[:_EDGE],
+        "tail": tokens[-_EDGE:] if tokens else [],
+        "but": lower.index("but") if "but" in lower else -1,
+        "ep": plain.count("!"),
+        "qm": plain.count("?"),
+        "terms": term_counts(text),
+    }
+
+
+def _paragraph_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# Same result as analyze(text). `cache` is the value returned for the entry's previous text (or None);
+# only paragraphs missing from it are tokenized and scored. Returns (result, new cache).
+@perf.timed("sentiment.analyze_incremental")
+def analyze_incremental(text: str, cache: dict | None = None) -> tuple[dict, dict]:
+    known = (cache or {}).get("paragraphs", {}) if (cache or {}).get("version") == ANALYZER_VERSION else {}
+    paras = (text or "").strip().split(PARAGRAPH_SEP)
+    keys = [_paragraph_key(p) for p in paras]
+    records = {}
+    for key, para in zip(keys, paras):
+        if key not in records:
+            records[key] = dict(known[key], v={int(i): v for i, v in known[key]["v"].items()}) if key in known \
+                else _paragraph_record(para)
+    ordered = [records[k] for k in keys]
+    total = sum(r["n"] for r in ordered)
+    upper = sum(r["upper"] for r in ordered)
+    cap_diff = 0 < total - upper < total
+    for key, para in zip(keys, paras):
+        r = records[key]
+        if "v" not in r or (r["upper"] and r["cap"] != cap_diff):
+            tokens = r.get("tokens") or _tokens(_demojize(para))
+            r["v"], r["cap"] = _valences(tokens, cap_diff), cap_diff
+
+    # Assemble entry-wide valences, then re-score tokens whose window crosses a paragraph edge.
+    starts, sentiments, pos = [], [0.0] * total, 0
+    for r in ordered:
+        starts.append(pos)
+        for i, v in r["v"].items():
+            sentiments[pos + i] = v
+        pos += r["n"]
+
+    def token(g):
+        k = bisect_right(starts, g) - 1  # among empty paragraphs sharing a start, the last one holds g
+        r, j = ordered[k], g - starts[k]
+        return r["head"][j] if j < len(r["head"]) else r["tail"][j - (r["n"] - len(r["tail"]))]
+    edges = {g for b in starts[1:] for g in range(b - 2, b + 3) if 0 <= g < total}
+    for g in sorted(edges):
+        lo, hi = max(0, g - 3), min(total, g + 3)
+        sentiments[g] = _valence_at([token(x) for x in range(lo, hi)], g - lo, cap_diff)
+
+    but = next((starts[k] + r["but"] for k, r in enumerate(ordered) if r["but"] >= 0), -1)
+    if but >= 0:
+        words = [""] * total
+        words[but] = "but"
+        sentiments = _analyzer._but_check(words, sentiments)
+    ep, qm = sum(r["ep"] for r in ordered), sum(r["qm"] for r in ordered)
+    compound = _analyzer.score_valence(sentiments, "!" * ep + "?" * qm)["compound"] if total else 0.0
+    s = _from_compound(compound) if (text or "").strip() else _from_compound(0)
+
+    counts = {}
+    for r in ordered:
+        for t, c in r["terms"].items():
+            counts[t] = counts.get(t, 0) + c
+    themes = [t for t, _ in sorted(counts.items(), key=lambda x: -x[1])[:MAX_THEMES_PER_ENTRY]]
+    result = {"sentimentScore": s["score"], "sentimentLabel": s["label"], "themes": themes, "analyzerVersion": ANALYZER_VERSION}
+    stored = {k: {f: v for f, v in r.items() if f != "tokens"} for k, r in records.items()}
+    return result, {"version": ANALYZER_VERSION, "paragraphs": stored}
+
+
+@perf.timed("sentiment.aggregate_themes")
 def aggregate_themes(entries: list) -> list:
     counts = {}
     for e in entries:
@@ -0,0 +1,88 @@
+# Archive tier: entries older than ARCHIVE_AFTER_DAYS move to journal-archive.db (attached by db.get_conn), so
+# the hot table and its indexes stay small; db reads span both tiers. Free pages are returned incrementally.
+# The app runs maintain() in the background after unlock; python -m cli maintain runs it on demand.
+import os
+import sqlite3
+import threading
+import time
+
+import db
+import sentiment
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get("DIARY_ARCHIVE_AFTER_DAYS") or 365)  # 0 turns archiving off
+ARCHIVE_BATCH = 500
+ARCHIVE_PAUSE_S = 0.02
+RECLAIM_MIN_PAGES = 256  # below this the free pages are left for reuse
+RECLAIM_STEP_PAGES = 2048
+MAINTAIN_INTERVAL_S = 6 * 60 * 60
+CHECK_EVERY_S = 60
+
+_lock = threading.Lock()
+_state = {"running": False, "last_check": 0.0, "last_run": 0.0}
+
+
+def cutoff_ms(days: int = ARCHIVE_AFTER_DAYS) -> int:
+    return db.get_day_start_ms(int(time.time() * 1000)) - days * db.MS_DAY_MS
+
+
+# Move old, fully analyzed entries to the archive, ARCHIVE_BATCH per pair of commits. Returns entries moved.
+def archive_old(days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH, pause_s: float = 0.0,
+                progress=None) -> int:
+    if days <= 0:
+        return 0
+    cutoff, moved = cutoff_ms(days), 0
+    while True:
+        n = db.archive_entries_before(cutoff, sentiment.ANALYZER_VERSION, batch_size)
+        if not n:
+            return moved
+        moved += n
+        if progress:
+            progress(moved)
+        time.sleep(pause_s)
+
+
+# Return free pages in RECLAIM_STEP_PAGES steps once there are enough to matter. Returns pages freed.
+def reclaim(min_pages: int = RECLAIM_MIN_PAGES) -> int:
+    if sum(db.free_pages().values()) < min_pages:
+        return 0
+    freed = 0
+    while True:
+        n = db.reclaim_free_pages(RECLAIM_STEP_PAGES)
+        if not n:
+            return freed
+        freed += n
+
+
+def maintain(days: int = ARCHIVE_AFTER_DAYS, pause_s: float = 0.0, progress=None) -> dict:
+    return {"archived": archive_old(days, pause_s=pause_s, progress=progress), "reclaimedPages": reclaim()}
+
+
+def status() -> dict:
+    sizes = {name: path.stat().st_size if path.exists() else 0
+             for name, path in (("hotBytes", db.DB_PATH), ("archiveBytes", db.archive_path()))}
+    return {**db.tier_counts(), **sizes, "freePages": db.free_pages(), "archiveAfterDays": ARCHIVE_AFTER_DAYS}
+
+
+# Run maintain() on a daemon thread at most every MAINTAIN_INTERVAL_S; cheap to call per rerun.
+def maybe_maintain_in_background() -> bool:
+    now = time.time()
+    with _lock:
+        if _state["running"] or now - _state["last_check"] < CHECK_EVERY_S:
+            return False
+        _state["last_check"] = now
+        if now - _state["last_run"] < MAINTAIN_INTERVAL_S:
+            return False
+        _state["running"] = True
+
+    def run():
+        try:
+            maintain(pause_s=ARCHIVE_PAUSE_S)
+            with _lock:
+                _state["last_run"] = time.time()
+        except (ValueError, sqlite3.Error):
+            pass
+        finally:
+            with _lock:
+                _state["running"] = False
+    threading.Thread(target=run, name="journal-tiering", daemon=True).start()
+    return True
@@ -0,0 +1,77 @@
+# JSON export/import of entries; shared by Settings, benchmarks and tooling.
+import json
+from datetime import datetime
+
+import analysis
+import db
+
+
+def export_record(e: dict) -> dict:
+    return {
+        "id": e.get("id"),
+        "content": e.get("content", ""),
+        "createdAt": e.get("createdAt"),
+        "sentimentScore": e.get("sentimentScore"),
+        "sentimentLabel": e.get("sentimentLabel"),
+        "themes": e.get("themes") or [],
+    }
+
+
+def export_entries(entries):
+    return json.dumps([export_record(e) for e in entries], indent=2)
+
+
+# Streams the same JSON array export_entries returns (one record per line) to a text file; no full copy in
+# memory. Returns entries written.
+def write_export(out, entries, progress=None) -> int:
+    out.write("[")
+    count = 0
+    for e in entries:
+        out.write(("\n" if count == 0 else ",\n") + json.dumps(export_record(e), ensure_ascii=False))
+        count += 1
+        if progress:
+            progress(count)
+    out.write("\n]\n")
+    return count
+
+
+# The entry an import item merges into: the newest entry already stored on that day (indexed lookup,
+# so streamed imports never load the whole journal).
+def _day_entry(day: int) -> dict | None:
+    found = db.get_entries_by_date_range(day, day + db.MS_DAY_MS - 1)
+    return found[0] if found else None
+
+
+# Whether `content` already sits in `existing` as its own run of paragraphs (merges join with a blank line).
+def _contains_fragment(existing: str, content: str) -> bool:
+    return f"\n\n{content}\n\n" in f"\n\n{existing}\n\n"
+
+
+# Import exported items (any iterable, so archives can stream in); same-day content is merged below the
+# existing entry. Content the journal already holds on that day, as an entry or a merged fragment, is found
+# by its content hash without decrypting, so re-running an import is a no-op. Returns entries imported.
+# Sentiment and themes are recomputed by the analysis queue (analysis.wait() blocks until they are stored).
+def import_entries(list_data) -> int:
+    imported = 0
+    for item in list_data:
+        content = (item.get("content") or "").strip()
+        created_at = item.get("createdAt") or int(datetime.now().timestamp() * 1000)
+        if not content:
+            continue
+        mac = db.content_hash(created_at, content)
+        if db.has_content_hash(mac):
+            continue
+        existing_entry = _day_entry(db.get_day_start_ms(created_at))
+        if existing_entry:
+            existing = (existing_entry.get("content") or "").strip()
+            if _contains_fragment(existing, content):
+                # Merged before hashes were kept (or edited since): remember it so the next run skips the decrypt.
+                db.add_content_hash(existing_entry["id"], mac)
+                continue
+            db.update_entry(existing_entry["id"], {"content": existing + "\n\n" + content}, fragment=content)
+            analysis.enqueue(existing_entry["id"])
+        else:
+            new_entry = db.insert_entry({"content": content, "createdAt": created_at})
+            analysis.enqueue(new_entry["id"])
+        imported += 1
+    return imported